@@ -3,14 +3,19 @@
 ユーザーのSQLを実行して正解と比較し、AIフィードバックを提供
 """
 
+import json
 import logging
 import math
+from collections.abc import AsyncIterator
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
+from app.core.cancellation import cancel_on_disconnect
+from app.core.config import settings
 from app.core.dependencies import get_db_service, get_llm
-from app.core.error_codes import PROBLEM_NOT_FOUND
+from app.core.error_codes import DB_TIMEOUT_ERROR, PROBLEM_NOT_FOUND
 from app.core.exceptions import DatabaseError, LLMError, NotFoundError
 from app.core.validators import validate_sql
 from app.schemas import UniversalRequest, UniversalResponse
@@ -21,6 +26,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# LLMがヒントを返さなかった場合のヒント
+DEFAULT_HINT = "結果を比較して、どこが違うか確認してみましょう。"
+
 
 def _compare_results(
     user_result: list[dict[str, Any]], expected_result: list[dict[str, Any]]
@@ -92,95 +100,149 @@ def _compare_results(
     return True
 
 
-@router.post("/check-answer", response_model=UniversalResponse)
-async def check_answer(
+async def _evaluate_answer(
     request: UniversalRequest,
-    llm_service: LLMService = Depends(get_llm),
-    db_service: DatabaseService = Depends(get_db_service),
-) -> UniversalResponse:
+    http_request: Request,
+    db_service: DatabaseService,
+) -> dict[str, Any] | UniversalResponse:
     """
-    ユーザーのSQL回答をチェック
-
-    Args:
-        request: リクエストデータ
-            - prompt: 省略可、フィードバック指示
-            - context: 必須
-                - problem_id: 問題ID
-                - user_sql: ユーザーのSQL
+    ユーザーSQLを検証・実行して期待結果と比較(LLMは呼ばない)
 
     Returns:
-        採点結果とフィードバック
+        判定情報(problem_id, user_sql, user_result, user_truncated,
+        expected_result, table_schemas, is_correct)。
+        SQLが不正・実行エラーの場合はそのまま返すレスポンス
 
     Raises:
-        HTTPException: チェック失敗時
+        HTTPException: リクエストが不正な場合
+        NotFoundError: 問題が見つからない場合
     """
-    try:
-        # リクエスト検証
-        if not request.context:
-            raise HTTPException(status_code=400, detail="contextが必要です")
+    # リクエスト検証
+    if not request.context:
+        raise HTTPException(status_code=400, detail="contextが必要です")
 
-        problem_id = request.context.get("problem_id")
-        user_sql = request.context.get("user_sql")
+    problem_id = request.context.get("problem_id")
+    user_sql = request.context.get("user_sql")
 
-        if not problem_id or not user_sql:
-            raise HTTPException(
-                status_code=400, detail="problem_idとuser_sqlが必要です"
-            )
+    if not problem_id or not user_sql:
+        raise HTTPException(status_code=400, detail="problem_idとuser_sqlが必要です")
 
-        try:
-            problem_id = int(problem_id)
-        except (TypeError, ValueError):
-            raise HTTPException(
-                status_code=400, detail="problem_idは数値である必要があります"
-            ) from None
+    try:
+        problem_id = int(problem_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=400, detail="problem_idは数値である必要があります"
+        ) from None
 
-        logger.info(f"Checking answer for problem {problem_id}")
+    logger.info(f"Checking answer for problem {problem_id}")
 
-        # 1. SQL検証(SELECT文のみ許可)
-        is_valid, error_code, error_message = validate_sql(user_sql)
-        if not is_valid:
-            return UniversalResponse(
-                success=False,
-                message="SQLが不正です",
-                data={
-                    "is_correct": False,
-                    "error_code": error_code,
-                    "error_message": error_message,
-                    "hint": "SELECT文のみ実行可能です。SQL構文を確認してください。",
-                },
-            )
+    # 1. SQL検証(SELECT文のみ許可)
+    is_valid, error_code, error_message = validate_sql(user_sql)
+    if not is_valid:
+        return UniversalResponse(
+            success=False,
+            message="SQLが不正です",
+            data={
+                "is_correct": False,
+                "error_code": error_code,
+                "error_message": error_message,
+                "hint": "SELECT文のみ実行可能です。SQL構文を確認してください。",
+            },
+        )
 
-        # 2. 問題情報の取得
-        problem = await db_service.get_problem(problem_id)
-        if not problem:
-            raise NotFoundError(
-                message=f"問題ID {problem_id} が見つかりません",
-                error_code=PROBLEM_NOT_FOUND,
-            )
+    # 2. 問題情報の取得
+    problem = await db_service.get_problem(problem_id)
+    if not problem:
+        raise NotFoundError(
+            message=f"問題ID {problem_id} が見つかりません",
+            error_code=PROBLEM_NOT_FOUND,
+        )
 
-        expected_result = problem["expected_result"]
-        table_schemas = problem["table_schemas"]
+    expected_result = problem["expected_result"]
 
-        # 3. ユーザーSQLの実行
-        try:
-            user_result = await db_service.execute_select_query(
-                user_sql, query_timeout=5
-            )
-        except DatabaseError as e:
-            # SQL構文エラーの場合は詳細なヒントを提供
+    # 3. ユーザーSQLの実行(クライアント切断時はサーバー側のクエリも中断)
+    try:
+        user_result, user_truncated = await cancel_on_disconnect(
+            http_request,
+            db_service.execute_select_query(
+                user_sql, query_timeout=settings.SQL_EXECUTION_TIMEOUT
+            ),
+        )
+    except DatabaseError as e:
+        if e.error_code == DB_TIMEOUT_ERROR:
             return UniversalResponse(
                 success=False,
-                message="SQLの実行でエラーが発生しました",
+                message="SQLの実行が制限時間を超えました",
                 data={
                     "is_correct": False,
+                    "error_code": e.error_code,
                     "error_message": str(e.detail),
-                    "hint": "SQL構文を確認してください。"
-                    "テーブル名やカラム名に誤りがないか確認しましょう。",
+                    "hint": "結合条件の漏れによる直積など、"
+                    "結果が膨大になっていないか確認しましょう。",
                 },
             )
 
-        # 4. 結果の比較
-        is_correct = _compare_results(user_result, expected_result)
+        # SQL構文エラーの場合は詳細なヒントを提供
+        return UniversalResponse(
+            success=False,
+            message="SQLの実行でエラーが発生しました",
+            data={
+                "is_correct": False,
+                "error_message": str(e.detail),
+                "hint": "SQL構文を確認してください。"
+                "テーブル名やカラム名に誤りがないか確認しましょう。",
+            },
+        )
+
+    # 4. 結果の比較(行数上限で打ち切られた結果は不一致扱い)
+    is_correct = not user_truncated and _compare_results(user_result, expected_result)
+
+    return {
+        "problem_id": problem_id,
+        "user_sql": user_sql,
+        "user_result": user_result,
+        "user_truncated": user_truncated,
+        "expected_result": expected_result,
+        "table_schemas": problem["table_schemas"],
+        "is_correct": is_correct,
+    }
+
+
+@router.post("/check-answer", response_model=UniversalResponse)
+async def check_answer(
+    request: UniversalRequest,
+    http_request: Request,
+    llm_service: LLMService = Depends(get_llm),
+    db_service: DatabaseService = Depends(get_db_service),
+) -> UniversalResponse:
+    """
+    ユーザーのSQL回答をチェック
+
+    Args:
+        request: リクエストデータ
+            - prompt: 省略可、フィードバック指示
+            - context: 必須
+                - problem_id: 問題ID
+                - user_sql: ユーザーのSQL
+
+    Returns:
+        採点結果とフィードバック
+
+    Raises:
+        HTTPException: チェック失敗時
+    """
+    try:
+        evaluation = await _evaluate_answer(request, http_request, db_service)
+        if isinstance(evaluation, UniversalResponse):
+            return evaluation
+
+        problem_id = evaluation["problem_id"]
+        user_sql = evaluation["user_sql"]
+        user_result = evaluation["user_result"]
+        user_truncated = evaluation["user_truncated"]
+        expected_result = evaluation["expected_result"]
+        table_schemas = evaluation["table_schemas"]
+        is_correct = evaluation["is_correct"]
 
         # 5. AIによるフィードバック生成
         feedback_result = await llm_service.check_answer(
@@ -202,10 +264,9 @@ async def check_answer(
             response_data.update(
                 {
                     "user_result": user_result,
+                    "user_result_truncated": user_truncated,
                     "expected_result": expected_result,
-                    "hint": feedback_result.get(
-                        "hint", "結果を比較して、どこが違うか確認してみましょう。"
-                    ),
+                    "hint": feedback_result.get("hint", DEFAULT_HINT),
                     "improvement_suggestions": feedback_result.get(
                         "improvement_suggestions", []
                     ),
@@ -235,7 +296,7 @@ async def check_answer(
     except LLMError as e:
         logger.error(f"LLM error during answer checking: {e}")
         raise HTTPException(
-            status_code=500,
+            status_code=e.status_code,
             detail={
                 "error_code": e.error_code,
                 "message": e.message,
@@ -264,3 +325,127 @@ async def check_answer(
                 "detail": str(e),
             },
         ) from None
+
+
+def _sse_event(event: str, data: dict[str, Any]) -> str:
+    """Server-Sent Eventsの1イベント分の文字列を組み立てる"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@router.post("/check-answer/stream")
+async def check_answer_stream(
+    request: UniversalRequest,
+    http_request: Request,
+    llm_service: LLMService = Depends(get_llm),
+    db_service: DatabaseService = Depends(get_db_service),
+) -> StreamingResponse:
+    """
+    ユーザーのSQL回答をチェックし、AIフィードバックをストリーミングで返す
+
+    text/event-streamで以下のイベントを順に送信する
+        - result: 判定結果(UniversalResponse形式、LLMを待たずに送信)
+        - token: フィードバック文の断片 {"text": str}
+        - error: フィードバック生成失敗 {"error_code", "message", "detail"}
+        - feedback: /check-answerと同じ採点情報 {"score"}
+          (不正解の場合は"hint", "improvement_suggestions"も含む)
+        - done: 終了
+
+    Args:
+        request: /check-answerと同じリクエストデータ
+
+    Returns:
+        イベントストリーム
+
+    Raises:
+        HTTPException: ストリーム開始前のチェック失敗時
+    """
+    try:
+        evaluation = await _evaluate_answer(request, http_request, db_service)
+
+    except HTTPException:
+        raise
+
+    except NotFoundError as e:
+        logger.error(f"Problem not found: {e}")
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error_code": e.error_code,
+                "message": e.message,
+                "detail": e.detail,
+            },
+        ) from None
+
+    except DatabaseError as e:
+        logger.error(f"Database error during answer checking: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error_code": e.error_code,
+                "message": e.message,
+                "detail": e.detail,
+            },
+        ) from None
+
+    async def events() -> AsyncIterator[str]:
+        if isinstance(evaluation, UniversalResponse):
+            yield _sse_event("result", evaluation.model_dump())
+            yield _sse_event("done", {})
+            return
+
+        is_correct = evaluation["is_correct"]
+        result_data: dict[str, Any] = {"is_correct": is_correct}
+        if not is_correct:
+            result_data.update(
+                {
+                    "user_result": evaluation["user_result"],
+                    "user_result_truncated": evaluation["user_truncated"],
+                    "expected_result": evaluation["expected_result"],
+                }
+            )
+        yield _sse_event(
+            "result",
+            {
+                "success": True,
+                "message": "回答をチェックしました",
+                "data": result_data,
+            },
+        )
+
+        # クライアントが切断するとStreamingResponseがこのジェネレーターを
+        # キャンセルし、LLMへのストリームも閉じられる
+        try:
+            async for text in llm_service.stream_answer_feedback(
+                user_sql=evaluation["user_sql"],
+                user_result=evaluation["user_result"],
+                expected_result=evaluation["expected_result"],
+                table_schemas=evaluation["table_schemas"],
+                is_correct=is_correct,
+            ):
+                yield _sse_event("token", {"text": text})
+        except LLMError as e:
+            logger.error(f"LLM error during streaming feedback: {e}")
+            yield _sse_event(
+                "error",
+                {
+                    "error_code": e.error_code,
+                    "message": e.message,
+                    "detail": e.detail,
+                },
+            )
+
+        # フィードバック文は構造化されないため、/check-answerでLLMが値を
+        # 返さなかった場合と同じ既定値を送る
+        feedback_data: dict[str, Any] = {"score": 100 if is_correct else 0}
+        if not is_correct:
+            feedback_data.update({"hint": DEFAULT_HINT, "improvement_suggestions": []})
+        yield _sse_event("feedback", feedback_data)
+
+        yield _sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -4,21 +4,98 @@
 """
 
 import logging
+import re
+import unicodedata
+from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from app.core.config import settings
 from app.core.dependencies import get_db_service, get_llm
 from app.core.error_codes import TABLE_CREATION_ERROR
 from app.core.exceptions import DatabaseError, LLMError
+from app.core.metrics import metrics
 from app.schemas import UniversalRequest, UniversalResponse
 from app.services.db_service import DatabaseService
 from app.services.llm_service import LLMService
+from app.services.problem_pool import schedule_refill
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _resolve_target_rows(value: Any) -> int:
+    """scaledモードの目標行数を設定範囲内に収める"""
+    try:
+        target_rows = int(value) if value is not None else 0
+    except (TypeError, ValueError):
+        target_rows = 0
+
+    if target_rows <= 0:
+        return settings.SCALED_DATA_DEFAULT_ROWS
+    return min(
+        max(target_rows, settings.SCALED_DATA_MIN_ROWS), settings.SCALED_DATA_MAX_ROWS
+    )
+
+
+THEME_POLICIES = ("auto", "reuse", "fresh")
+
+
+def _theme_key(prompt: str | None) -> str:
+    """プロンプトを正規化してテーマライブラリの検索キーにする"""
+    if not prompt:
+        return ""
+    normalized = unicodedata.normalize("NFKC", prompt)
+    return re.sub(r"\s+", " ", normalized).strip().lower()
+
+
+def _resolve_theme_policy(value: Any) -> str:
+    """テーマの選択方針を決める(不正な値は設定値を使う)"""
+    if not settings.THEME_LIBRARY_ENABLED:
+        return "fresh"
+    if value in THEME_POLICIES:
+        return str(value)
+    return settings.THEME_LIBRARY_POLICY
+
+
+async def _restore_theme(
+    db_service: DatabaseService, theme_key: str, data_mode: str, policy: str
+) -> dict[str, Any] | None:
+    """
+    方針に従ってライブラリのテーマをセッションスキーマに復元
+
+    Returns:
+        復元したテーマ情報(LLMで新規生成すべき場合はNone)
+    """
+    if policy == "fresh":
+        return None
+
+    if policy == "auto":
+        variants = await db_service.count_themes(theme_key, data_mode)
+        if variants < settings.THEME_LIBRARY_MIN_VARIANTS:
+            return None
+
+    theme = await db_service.pick_theme(theme_key, data_mode)
+    if theme is None:
+        return None
+
+    try:
+        await db_service.execute_sql_statements(theme["sql_statements"])
+        if data_mode == "scaled":
+            theme["load_result"] = await db_service.generate_scaled_data(
+                theme["data_spec"]
+            )
+    except DatabaseError as e:
+        # 復元できないテーマはLLMでの生成にフォールバック
+        logger.warning(f"Failed to restore theme {theme['id']}: {e}")
+        metrics.increment("theme_library.restore_failures")
+        await db_service.reset_session_schema()
+        return None
+
+    return theme
+
+
 @router.post("/create-tables", response_model=UniversalResponse)
 async def create_tables(
     request: UniversalRequest,
@@ -29,10 +106,17 @@ async def create_tables(
     学習用テーブルとサンプルデータを作成
 
     Args:
-        request: リクエストデータ(prompt: 省略可、最大1000文字)
+        request: リクエストデータ
+            - prompt: 省略可、最大1000文字
+            - context: 省略可
+                - data_mode: "sample"(既定、LLMが数行のデータを作成) または
+                  "scaled"(LLMは分布のみ定義し、サーバー側で大量データを生成)
+                - target_rows: scaled時の最大テーブルの目標行数
+                - theme_policy: "auto" / "reuse" / "fresh"
+                  (ライブラリのテーマを再利用するか、LLMで新規生成するか)
 
     Returns:
-        作成結果とテーマ情報
+        作成結果とテーマ情報(scaled時は行数と生成時間を含む)
 
     Raises:
         HTTPException: 作成失敗時
@@ -49,46 +133,99 @@ async def create_tables(
             f"Creating tables with prompt: {prompt[:50] if prompt else 'None'}..."
         )
 
-        # 1. 既存のpublicスキーマのテーブルを全削除
-        await db_service.drop_all_user_tables()
+        # 1. セッションスキーマを空の状態にリセット
+        await db_service.reset_session_schema()
 
         # 2. システムスキーマの初期化
         await db_service.initialize_system_schema()
 
-        # 3. LLMにテーブル構造を生成させる
-        table_info = await llm_service.generate_tables(prompt)
+        context = request.context or {}
+        scaled = context.get("data_mode") == "scaled"
+        data_mode = "scaled" if scaled else "sample"
+        theme_key = _theme_key(prompt)
+
+        # 3. ライブラリのテーマを復元できればLLMを呼ばない
+        restored = await _restore_theme(
+            db_service,
+            theme_key,
+            data_mode,
+            _resolve_theme_policy(context.get("theme_policy")),
+        )
+
+        if restored is not None:
+            metrics.increment("theme_library.reused")
+            table_info = restored
+            sql_statements = restored["sql_statements"]
+            load_result = restored.get("load_result")
+        else:
+            # 4. LLMにテーブル構造を生成させる
+            if scaled:
+                target_rows = _resolve_target_rows(context.get("target_rows"))
+                table_info = await llm_service.generate_scaled_tables(
+                    target_rows, prompt
+                )
+            else:
+                table_info = await llm_service.generate_tables(prompt)
+
+            # 5. CREATE TABLE文とサンプルデータを実行
+            sql_statements = table_info["sql_statements"]
+            await db_service.execute_sql_statements(sql_statements)
 
-        # 4. CREATE TABLE文とサンプルデータを実行
-        sql_statements = table_info["sql_statements"]
-        await db_service.execute_sql_statements(sql_statements)
+            # 6. scaledモードでは分布定義からサーバー側で大量データを生成
+            #    (テーブル作成とは別トランザクションのため、失敗したら空のテーブルを
+            #    残さないようスキーマをリセットする)
+            load_result = None
+            if scaled:
+                try:
+                    load_result = await db_service.generate_scaled_data(
+                        table_info["data_spec"]
+                    )
+                except DatabaseError:
+                    await db_service.reset_session_schema()
+                    raise
 
-        # 5. セッション状態を更新(今後実装)
-        # TODO: セッション管理機能の実装
+            # 7. 実行に成功したテーマをライブラリに保存(失敗しても作成は成功扱い)
+            metrics.increment("theme_library.generated")
+            if settings.THEME_LIBRARY_ENABLED:
+                try:
+                    await db_service.save_theme(theme_key, data_mode, table_info)
+                except DatabaseError as e:
+                    logger.warning(f"Theme was not saved to library: {e}")
 
         theme = table_info.get("theme", "Unknown")
         description = table_info.get("description", "テーブルを作成しました")
 
         logger.info(f"Successfully created tables for theme: {theme}")
 
-        return UniversalResponse(
-            success=True,
-            message=description,
-            data={
-                "theme": theme,
-                "table_count": len(
-                    [
-                        stmt
-                        for stmt in sql_statements
-                        if stmt.strip().upper().startswith("CREATE TABLE")
-                    ]
-                ),
-            },
-        )
+        data = {
+            "theme": theme,
+            "table_count": len(
+                [
+                    stmt
+                    for stmt in sql_statements
+                    if stmt.strip().upper().startswith("CREATE TABLE")
+                ]
+            ),
+            "data_mode": data_mode,
+            "source": "library" if restored is not None else "llm",
+        }
+        if load_result:
+            data.update(load_result)
+
+        # 8. 最初の問題生成を待たせないよう問題プールの補充を開始
+        try:
+            schedule_refill(
+                llm_service, db_service, await db_service.get_table_schemas()
+            )
+        except DatabaseError as e:
+            logger.warning(f"Problem pool was not warmed: {e}")
+
+        return UniversalResponse(success=True, message=description, data=data)
 
     except LLMError as e:
         logger.error(f"LLM error during table creation: {e}")
         raise HTTPException(
-            status_code=500,
+            status_code=e.status_code,
             detail={
                 "error_code": e.error_code,
                 "message": e.message,
@@ -104,6 +241,7 @@ async def create_tables(
                 "error_code": e.error_code,
                 "message": e.message,
                 "detail": e.detail,
+                "data": e.data,
             },
         ) from None
 
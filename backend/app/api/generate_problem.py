@@ -13,6 +13,8 @@ from app.core.exceptions import DatabaseError, LLMError, NotFoundError
 from app.schemas import UniversalRequest, UniversalResponse
 from app.services.db_service import DatabaseService
 from app.services.llm_service import LLMService
+from app.services.problem_generator import generate_servable_problem
+from app.services.problem_pool import problem_pool, schedule_refill
 
 logger = logging.getLogger(__name__)
 
@@ -57,41 +59,36 @@ async def generate_problem(
                 error_code=NO_TABLES,
             )
 
-        # 2. LLMに問題を生成させる
+        # 2. プロンプト指定がなければ事前生成プールから出題
         # TODO: 前回の正答率から難易度を自動調整(1-10レベル)
-        problem_info = await llm_service.generate_problem(table_schemas, prompt)
+        problem = None if prompt else problem_pool.pop(db_service.schema, table_schemas)
 
-        # 3. 生成されたSQLを実行して結果を取得
-        correct_sql = problem_info["correct_sql"]
-        try:
-            expected_result = await db_service.execute_select_query(
-                correct_sql, query_timeout=10
+        if problem is None:
+            # 3. LLMに問題の候補を並行して生成させ、生成されたSQLを実行して
+            #    結果が3-10行になった最初の候補を使う
+            problem = await generate_servable_problem(
+                llm_service, db_service, table_schemas, prompt
             )
-        except DatabaseError:
-            logger.exception(f"Generated SQL failed to execute: {correct_sql}")
-            raise DatabaseError(
-                message="生成された問題のSQLが実行できませんでした",
-                error_code=PROBLEM_GENERATION_ERROR,
-                detail=f"SQL: {correct_sql[:100]}...",
-            ) from None
-
-        # 結果の行数チェック(3-10行でなければ再生成)
-        if not (3 <= len(expected_result) <= 10):
-            logger.warning(
-                f"Generated problem has {len(expected_result)} rows, outside range 3-10"
+            problem_pool.note_served(
+                db_service.schema, table_schemas, problem["correct_sql"]
             )
-            # TODO: 再生成ロジックの実装
+
+        expected_result = problem["expected_result"]
+        truncated = problem["truncated"]
 
         # 4. 問題をデータベースに保存
         problem_id = await db_service.save_problem(
             theme="未設定",  # TODO: セッション管理から取得
-            difficulty=problem_info.get("difficulty", "medium"),
-            correct_sql=correct_sql,
+            difficulty=problem["difficulty"],
+            correct_sql=problem["correct_sql"],
             expected_result=expected_result,
             table_schemas=table_schemas,
-            hint=problem_info.get("hint"),
+            hint=problem["hint"],
         )
 
+        # 次の出題に備えてプールを補充
+        schedule_refill(llm_service, db_service, table_schemas)
+
         # 5. 結果のメタデータを準備
         column_names = list(expected_result[0].keys()) if expected_result else []
 
@@ -104,8 +101,9 @@ async def generate_problem(
                 "problem_id": problem_id,
                 "result": expected_result,
                 "row_count": len(expected_result),
+                "truncated": truncated,
                 "column_names": column_names,
-                "difficulty": problem_info.get("difficulty", "medium"),
+                "difficulty": problem["difficulty"],
             },
         )
 
@@ -123,7 +121,7 @@ async def generate_problem(
     except LLMError as e:
         logger.error(f"LLM error during problem generation: {e}")
         raise HTTPException(
-            status_code=500,
+            status_code=e.status_code,
             detail={
                 "error_code": e.error_code,
                 "message": e.message,
@@ -0,0 +1,53 @@
+"""
+セッション管理API
+セッション専用スキーマの破棄を行う
+"""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.dependencies import get_db_service
+from app.core.exceptions import DatabaseError
+from app.schemas import UniversalResponse
+from app.services.db_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.delete("/session", response_model=UniversalResponse)
+async def delete_session(
+    db_service: DatabaseService = Depends(get_db_service),
+) -> UniversalResponse:
+    """
+    セッションのスキーマと問題を破棄
+
+    他のセッションのデータには影響しない
+
+    Returns:
+        破棄結果
+
+    Raises:
+        HTTPException: 破棄失敗時
+    """
+    try:
+        await db_service.drop_session_schema()
+
+        return UniversalResponse(
+            success=True,
+            message="セッションのデータを削除しました",
+            data={"schema": db_service.schema},
+        )
+
+    except DatabaseError as e:
+        logger.error(f"Database error during session teardown: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error_code": e.error_code,
+                "message": e.message,
+                "detail": e.detail,
+            },
+        ) from None
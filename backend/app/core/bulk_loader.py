@@ -0,0 +1,415 @@
+"""
+INSERT文のCOPY変換ロード
+LLMが生成したINSERT ... VALUES文を解析し、バイナリCOPYでまとめて投入する
+"""
+
+import logging
+import math
+import re
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+import asyncpg
+
+from app.core.metrics import metrics
+from app.core.session import quote_ident
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = r'(?:"(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_$]*)'
+
+_INSERT_HEADER = re.compile(
+    rf"""^\s*INSERT\s+INTO\s+
+    (?P<table>{_IDENTIFIER}(?:\s*\.\s*{_IDENTIFIER})?)
+    \s*(?:\((?P<columns>[^)]*)\))?
+    \s*VALUES\s*""",
+    re.IGNORECASE | re.VERBOSE | re.DOTALL,
+)
+
+_NUMBER = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_KEYWORD = re.compile(r"(NULL|TRUE|FALSE)\b", re.IGNORECASE)
+_TYPED_STRING_PREFIX = re.compile(
+    r"(DATE|TIME|TIMESTAMP|TIMESTAMPTZ)\s+(?=')", re.IGNORECASE
+)
+_CAST_SUFFIX = re.compile(
+    r"\s*::\s*[A-Za-z_][A-Za-z0-9_ ]*(?:\(\s*\d+(?:\s*,\s*\d+)?\s*\))?"
+)
+
+# 整数型の値の範囲(範囲外は通常実行に任せ、失敗した文として特定させる)
+_INTEGER_RANGES = {
+    "smallint": (-(2**15), 2**15 - 1),
+    "integer": (-(2**31), 2**31 - 1),
+    "bigint": (-(2**63), 2**63 - 1),
+}
+
+_BOOLEAN_STRINGS = {
+    "t": True,
+    "true": True,
+    "y": True,
+    "yes": True,
+    "on": True,
+    "1": True,
+    "f": False,
+    "false": False,
+    "n": False,
+    "no": False,
+    "off": False,
+    "0": False,
+}
+
+# リテラルの種類: ("str", 値) / ("num", 数値の文字列) / ("bool", 値) / ("null", None)
+Literal = tuple[str, Any]
+
+
+def _unquote_identifier(identifier: str) -> str:
+    """識別子のクォートを外す(クォートなしはPostgreSQLと同様に小文字化)"""
+    identifier = identifier.strip()
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier.lower()
+
+
+def _split_qualified_name(name: str) -> tuple[str | None, str]:
+    """schema.table形式を(スキーマ, テーブル)に分割"""
+    parts = re.findall(_IDENTIFIER, name)
+    if len(parts) == 2:
+        return _unquote_identifier(parts[0]), _unquote_identifier(parts[1])
+    return None, _unquote_identifier(parts[0])
+
+
+def _parse_literal(text: str, pos: int) -> tuple[Literal, int] | None:
+    """posから1つのリテラルを読み取る(式や関数呼び出しはNone)"""
+    prefix = _TYPED_STRING_PREFIX.match(text, pos)
+    if prefix:
+        pos = prefix.end()
+
+    if pos < len(text) and text[pos] == "'":
+        chars = []
+        pos += 1
+        while pos < len(text):
+            if text[pos] == "'":
+                if text.startswith("''", pos):
+                    chars.append("'")
+                    pos += 2
+                    continue
+                literal: Literal = ("str", "".join(chars))
+                pos += 1
+                break
+            chars.append(text[pos])
+            pos += 1
+        else:
+            return None
+    elif prefix:
+        return None
+    elif keyword := _KEYWORD.match(text, pos):
+        word = keyword.group(1).upper()
+        literal = ("null", None) if word == "NULL" else ("bool", word == "TRUE")
+        pos = keyword.end()
+    elif number := _NUMBER.match(text, pos):
+        literal = ("num", number.group(0))
+        pos = number.end()
+    else:
+        return None
+
+    # '2024-01-01'::date のような型キャストは列の型で変換するため読み飛ばす
+    cast = _CAST_SUFFIX.match(text, pos)
+    if cast:
+        pos = cast.end()
+
+    return literal, pos
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _parse_values(text: str, pos: int) -> list[list[Literal]] | None:
+    """VALUES句の (..), (..) を解析"""
+    rows: list[list[Literal]] = []
+
+    while True:
+        pos = _skip_whitespace(text, pos)
+        if pos >= len(text) or text[pos] != "(":
+            return None
+        pos += 1
+
+        row: list[Literal] = []
+        while True:
+            pos = _skip_whitespace(text, pos)
+            parsed = _parse_literal(text, pos)
+            if parsed is None:
+                return None
+            literal, pos = parsed
+            row.append(literal)
+
+            pos = _skip_whitespace(text, pos)
+            if pos < len(text) and text[pos] == ",":
+                pos += 1
+                continue
+            if pos < len(text) and text[pos] == ")":
+                pos += 1
+                break
+            return None
+
+        rows.append(row)
+
+        pos = _skip_whitespace(text, pos)
+        if pos < len(text) and text[pos] == ",":
+            pos += 1
+            continue
+        break
+
+    # 末尾のセミコロン以外(ON CONFLICT, RETURNING等)があれば変換しない
+    if text[pos:].strip() not in ("", ";"):
+        return None
+
+    return rows
+
+
+def parse_insert(sql: str) -> dict[str, Any] | None:
+    """
+    INSERT ... VALUES文を解析
+
+    Args:
+        sql: SQL文
+
+    Returns:
+        {"schema": str | None, "table": str, "columns": list[str] | None,
+         "rows": list[list[Literal]]}
+        COPYに変換できない文の場合はNone
+    """
+    header = _INSERT_HEADER.match(sql)
+    if not header:
+        return None
+
+    columns = None
+    if header.group("columns") is not None:
+        names = [name.strip() for name in header.group("columns").split(",")]
+        if not all(re.fullmatch(_IDENTIFIER, name) for name in names):
+            return None
+        columns = [_unquote_identifier(name) for name in names]
+
+    rows = _parse_values(sql, header.end())
+    if not rows:
+        return None
+
+    width = len(columns) if columns is not None else len(rows[0])
+    if any(len(row) != width for row in rows):
+        return None
+
+    schema, table = _split_qualified_name(header.group("table"))
+    return {"schema": schema, "table": table, "columns": columns, "rows": rows}
+
+
+def convert_literal(literal: Literal, pg_type: str) -> Any:
+    """
+    リテラルを列の型に応じたPython値に変換(バイナリCOPY用)
+
+    Args:
+        literal: parse_insertが返したリテラル
+        pg_type: format_type(atttypid, NULL)の型名
+
+    Returns:
+        変換後の値
+
+    Raises:
+        ValueError: 変換できない型・値の場合
+    """
+    kind, value = literal
+    if kind == "null":
+        return None
+
+    try:
+        if pg_type in _INTEGER_RANGES:
+            if kind == "bool":
+                raise ValueError("boolean to integer")
+            number = Decimal(str(value))
+            if number != number.to_integral_value():
+                raise ValueError(f"not an integer: {value}")
+            low, high = _INTEGER_RANGES[pg_type]
+            if not low <= number <= high:
+                raise ValueError(f"out of range for {pg_type}: {value}")
+            return int(number)
+        if pg_type == "numeric":
+            if kind == "bool":
+                raise ValueError("boolean to numeric")
+            return Decimal(str(value))
+        if pg_type in ("real", "double precision"):
+            if kind == "bool":
+                raise ValueError("boolean to float")
+            real = float(value)
+            if math.isinf(real) and kind == "num":
+                raise ValueError(f"out of range for {pg_type}: {value}")
+            return real
+        if pg_type == "boolean":
+            if kind == "bool":
+                return value
+            if kind != "str":
+                raise ValueError("number to boolean")
+            return _BOOLEAN_STRINGS[str(value).strip().lower()]
+        if kind == "bool":
+            raise ValueError(f"boolean to {pg_type}")
+        if pg_type in ("text", "character varying", "character"):
+            return str(value)
+        if kind != "str":
+            # 数値から日付・uuid・jsonなどへは通常のINSERTでも代入できない
+            raise ValueError(f"number to {pg_type}")
+        if pg_type == "date":
+            return date.fromisoformat(str(value))
+        if pg_type == "timestamp without time zone":
+            parsed = datetime.fromisoformat(str(value))
+            if parsed.tzinfo is not None:
+                # オフセットの扱いはサーバー側の変換に任せる
+                raise ValueError("aware timestamp for timestamp")
+            return parsed
+        if pg_type == "timestamp with time zone":
+            parsed = datetime.fromisoformat(str(value))
+            if parsed.tzinfo is None:
+                # タイムゾーンの解釈はサーバー設定に依存するため通常実行に任せる
+                raise ValueError("naive timestamp for timestamptz")
+            return parsed
+        if pg_type == "time without time zone":
+            return time.fromisoformat(str(value))
+        if pg_type in ("json", "jsonb"):
+            return str(value)
+        if pg_type == "uuid":
+            return uuid.UUID(str(value))
+    except (KeyError, InvalidOperation, OverflowError, TypeError) as e:
+        raise ValueError(f"cannot convert {value!r} to {pg_type}") from e
+
+    raise ValueError(f"unsupported column type: {pg_type}")
+
+
+async def _fetch_column_types(
+    conn: asyncpg.Connection, schema: str | None, table: str
+) -> list[tuple[str, str]] | None:
+    """テーブルの(カラム名, 型名)を定義順に取得"""
+    qualified = (
+        f"{quote_ident(schema)}.{quote_ident(table)}" if schema else quote_ident(table)
+    )
+    rows = await conn.fetch(
+        """
+        SELECT a.attname, format_type(a.atttypid, NULL) AS type_name
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass($1)
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+        ORDER BY a.attnum
+        """,
+        qualified,
+    )
+    if not rows:
+        return None
+    return [(row["attname"], row["type_name"]) for row in rows]
+
+
+async def _build_copy(
+    conn: asyncpg.Connection,
+    parsed: dict[str, Any],
+    column_types: dict[tuple[str | None, str], list[tuple[str, str]] | None],
+) -> tuple[tuple[str | None, str, tuple[str, ...]], list[tuple[Any, ...]]] | None:
+    """解析済みINSERTをCOPY用の(キー, レコード)に変換(不可ならNone)"""
+    key = (parsed["schema"], parsed["table"])
+    if key not in column_types:
+        column_types[key] = await _fetch_column_types(conn, *key)
+    table_columns = column_types[key]
+    if table_columns is None:
+        return None
+
+    types = dict(table_columns)
+    columns = parsed["columns"]
+    if columns is None:
+        # カラム指定がない場合は定義順の先頭から対応
+        if len(parsed["rows"][0]) > len(table_columns):
+            return None
+        columns = [name for name, _ in table_columns[: len(parsed["rows"][0])]]
+    if any(column not in types for column in columns):
+        return None
+
+    try:
+        records = [
+            tuple(
+                convert_literal(literal, types[column])
+                for literal, column in zip(row, columns, strict=True)
+            )
+            for row in parsed["rows"]
+        ]
+    except ValueError as e:
+        logger.debug(f"INSERT into {parsed['table']} not convertible to COPY: {e}")
+        return None
+
+    return (parsed["schema"], parsed["table"], tuple(columns)), records
+
+
+async def load_statements(
+    conn: asyncpg.Connection, statements: list[str]
+) -> dict[str, int]:
+    """
+    SQL文を順に実行し、変換可能なINSERT文はテーブル単位のバイナリCOPYで投入
+
+    呼び出し側のトランザクション内で実行すること。連続するINSERTは同じテーブル・
+    カラムであれば1回のCOPYにまとめ、その他の文は連続する分を1往復で実行する
+
+    Args:
+        conn: 使用する接続
+        statements: 実行するSQL文のリスト(実行順)
+
+    Returns:
+        {"copied_rows": COPYで投入した行数, "copy_batches": COPY回数,
+         "executed_statements": 通常実行した文の数}
+    """
+    stats = {"copied_rows": 0, "copy_batches": 0, "executed_statements": 0}
+    column_types: dict[tuple[str | None, str], list[tuple[str, str]] | None] = {}
+    pending_sql: list[str] = []
+    pending_copy: tuple[tuple[str | None, str, tuple[str, ...]], list[Any]] | None = (
+        None
+    )
+
+    async def flush_sql() -> None:
+        if pending_sql:
+            await conn.execute("\n;\n".join(pending_sql))
+            stats["executed_statements"] += len(pending_sql)
+            pending_sql.clear()
+
+    async def flush_copy() -> None:
+        nonlocal pending_copy
+        if pending_copy:
+            (schema, table, columns), records = pending_copy
+            await conn.copy_records_to_table(
+                table, records=records, columns=list(columns), schema_name=schema
+            )
+            stats["copied_rows"] += len(records)
+            stats["copy_batches"] += 1
+            pending_copy = None
+
+    for sql in statements:
+        parsed = parse_insert(sql)
+        copy = None
+        if parsed is not None:
+            # 参照先テーブルの作成やデータ投入を先に済ませてから型を調べる
+            await flush_sql()
+            copy = await _build_copy(conn, parsed, column_types)
+
+        if copy is None:
+            await flush_copy()
+            pending_sql.append(sql)
+            continue
+
+        key, records = copy
+        if pending_copy and pending_copy[0] == key:
+            pending_copy[1].extend(records)
+        else:
+            await flush_copy()
+            pending_copy = (key, records)
+
+    await flush_copy()
+    await flush_sql()
+
+    metrics.increment("bulk_load.copied_rows", stats["copied_rows"])
+    metrics.increment("bulk_load.copy_batches", stats["copy_batches"])
+    metrics.increment("bulk_load.executed_statements", stats["executed_statements"])
+    return stats
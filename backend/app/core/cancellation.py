@@ -0,0 +1,59 @@
+"""
+クライアント切断時の処理中断
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import Awaitable
+from typing import TypeVar
+
+from fastapi import Request
+
+from app.core.error_codes import DB_CANCELLED_ERROR
+from app.core.exceptions import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 切断を確認する間隔(秒)
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    クライアントが切断したら実行中の処理をキャンセルする
+
+    DB処理の場合はキャンセルによりバックエンドへの中断要求が送られる
+
+    Args:
+        request: 監視対象のHTTPリクエスト
+        awaitable: 実行する処理
+
+    Returns:
+        処理結果
+
+    Raises:
+        DatabaseError: クライアント切断により処理を中断した場合
+    """
+    task = asyncio.ensure_future(awaitable)
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling running query")
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+                raise DatabaseError(
+                    message="クライアントが切断されたため処理を中断しました",
+                    error_code=DB_CANCELLED_ERROR,
+                )
+    finally:
+        if not task.done():
+            task.cancel()
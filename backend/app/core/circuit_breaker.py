@@ -0,0 +1,156 @@
+"""
+サーキットブレーカー
+依存サービスのエラー率が閾値を超えたら呼び出しを即座に失敗させ、一定時間後に試験的に再開する
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable
+from threading import Lock
+from typing import Any
+
+from app.core.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# メトリクスのゲージに記録する状態の数値
+_STATE_VALUES = {CLOSED: 0.0, HALF_OPEN: 1.0, OPEN: 2.0}
+
+
+class CircuitBreaker:
+    """
+    エラー率ベースのサーキットブレーカー
+
+    - closed: 通常状態。直近window_size件の結果を記録し、min_calls件以上で
+      エラー率がfailure_rate_threshold以上になったらopenへ
+    - open: 呼び出しを拒否。recovery_timeout秒経過したらhalf_openへ
+    - half_open: half_open_max_calls件までの試験呼び出しだけを許可。
+      成功すればclosed、失敗すれば再びopenへ
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        window_size: int = 20,
+        min_calls: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = Lock()
+        self._results: deque[bool] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._half_open_at = 0.0
+        self._record_state()
+
+    @property
+    def state(self) -> str:
+        """現在の状態(open中に回復待ち時間を過ぎていればhalf_open)"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        呼び出しを許可するかどうか
+
+        half_openでは許可した分を試験呼び出しとして数えるため、許可された場合は
+        必ずrecord_success/record_failureで結果を記録すること
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if (
+                self._state == HALF_OPEN
+                and self._half_open_calls < self.half_open_max_calls
+            ):
+                self._half_open_calls += 1
+                return True
+
+        metrics.increment(f"{self.name}.circuit.rejected")
+        return False
+
+    def record_success(self) -> None:
+        """呼び出し成功を記録"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+                return
+            self._results.append(True)
+
+    def record_failure(self) -> None:
+        """呼び出し失敗を記録"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            if self._state == OPEN:
+                return
+
+            self._results.append(False)
+            failures = self._results.count(False)
+            if (
+                len(self._results) >= self.min_calls
+                and failures / len(self._results) >= self.failure_rate_threshold
+            ):
+                self._transition(OPEN)
+
+    def retry_after(self) -> float:
+        """openの場合、half_openになるまでの残り秒数"""
+        with self._lock:
+            self._refresh()
+            if self._state != OPEN:
+                return 0.0
+            return max(self._opened_at + self.recovery_timeout - self._clock(), 0.0)
+
+    def snapshot(self) -> dict[str, Any]:
+        """ヘルスチェック用の状態"""
+        with self._lock:
+            self._refresh()
+            failures = self._results.count(False)
+            return {
+                "state": self._state,
+                "failure_rate": failures / len(self._results) if self._results else 0.0,
+                "window_calls": len(self._results),
+            }
+
+    def _refresh(self) -> None:
+        """回復待ち時間を過ぎたopenをhalf_openへ(ロック取得済みで呼ぶ)"""
+        now = self._clock()
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+        elif (
+            self._state == HALF_OPEN
+            and now - self._half_open_at >= self.recovery_timeout
+        ):
+            # 試験呼び出しが結果を記録しないまま中断された場合も再試行できるようにする
+            self._half_open_calls = 0
+            self._half_open_at = now
+
+    def _transition(self, state: str) -> None:
+        """状態遷移(ロック取得済みで呼ぶ)"""
+        self._state = state
+        self._half_open_calls = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+            metrics.increment(f"{self.name}.circuit.opened")
+        elif state == HALF_OPEN:
+            self._half_open_at = self._clock()
+        elif state == CLOSED:
+            self._results.clear()
+        self._record_state()
+
+    def _record_state(self) -> None:
+        metrics.set_gauge(f"{self.name}.circuit.state", _STATE_VALUES[self._state])
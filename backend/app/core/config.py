@@ -8,6 +8,24 @@ from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+def _parse_str_list(value: str | list[str]) -> list[str]:
+    """JSON配列またはカンマ区切りの文字列をリストに変換"""
+    if isinstance(value, str):
+        # JSON形式を試す
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                return parsed
+        except (json.JSONDecodeError, ValueError):
+            pass
+        # JSON解析に失敗した場合、またはlistでない場合はカンマ区切りとして処理
+        return [i.strip() for i in value.split(",") if i.strip()]
+    elif isinstance(value, list):
+        return value
+    else:
+        return []
+
+
 class Settings(BaseSettings):
     """アプリケーション設定"""
 
@@ -20,15 +38,69 @@ class Settings(BaseSettings):
     DB_POOL_SIZE: int = Field(default=10)
     DB_MAX_OVERFLOW: int = Field(default=20)
     DB_POOL_TIMEOUT: float = Field(default=30.0)
+    SCHEMA_CACHE_ENABLED: bool = Field(default=True)
+    # スキーマ変更通知の購読用接続が切れた場合の再接続間隔(指数バックオフの初期値と上限、秒)
+    SCHEMA_CACHE_RECONNECT_DELAY: float = Field(default=1.0)
+    SCHEMA_CACHE_RECONNECT_MAX_DELAY: float = Field(default=30.0)
 
     # LocalAI / Ollama
     LLM_ENDPOINT_TYPE: str = Field(default="localai")  # "localai" or "ollama"
+    # Ollamaの場合はネイティブAPI(/api/chat)を使い、keep_aliveの間モデルとKVキャッシュを保持
+    LLM_OLLAMA_NATIVE: bool = Field(default=True)
+    LLM_OLLAMA_KEEP_ALIVE: str = Field(default="30m")
+    # OpenAI互換APIでcache_promptを送り、llama.cppにプロンプト先頭のKVキャッシュを再利用させる
+    LLM_CACHE_PROMPT: bool = Field(default=True)
     LLM_API_URL: str = Field(default="http://llm:8080/v1")
+    # 複数のLLMバックエンド(JSON配列またはカンマ区切り)。指定時はLLM_API_URLより優先し、
+    # 処理中のリクエストが最も少ないバックエンドへ振り分ける
+    LLM_API_URLS: str | list[str] = Field(default=[])
     LLM_MODEL_NAME: str = Field(default="gpt-3.5-turbo")
     LLM_TIMEOUT: float = Field(default=30.0)
     LLM_MAX_RETRIES: int = Field(default=3)
     LLM_TEMPERATURE: float = Field(default=0.7)
     LLM_MAX_TOKENS: int = Field(default=2000)
+    # リトライ間隔(指数バックオフの基準値と上限、秒)
+    LLM_RETRY_BACKOFF_BASE: float = Field(default=0.5)
+    LLM_RETRY_BACKOFF_MAX: float = Field(default=8.0)
+    # サーキットブレーカー(直近の呼び出しのエラー率で判定)
+    LLM_CIRCUIT_FAILURE_RATE: float = Field(default=0.5)
+    LLM_CIRCUIT_WINDOW_SIZE: int = Field(default=20)
+    LLM_CIRCUIT_MIN_CALLS: int = Field(default=5)
+    LLM_CIRCUIT_RECOVERY_TIMEOUT: float = Field(default=30.0)
+    # LLMの死活確認(推論を行わずGET /modelsで確認し、結果をキャッシュする)
+    LLM_HEALTH_CACHE_TTL: float = Field(default=30.0)
+    LLM_HEALTH_REFRESH_INTERVAL: float = Field(default=15.0)  # 0以下で定期確認なし
+    LLM_HEALTH_PROBE_TIMEOUT: float = Field(default=5.0)
+    # LLM HTTP接続プール(プロセスで1つのクライアントを共有)
+    LLM_MAX_CONNECTIONS: int = Field(default=20)
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=10)
+    LLM_KEEPALIVE_EXPIRY: float = Field(default=30.0)
+    LLM_HTTP2: bool = Field(default=False)  # h2パッケージ(httpx[http2])が必要
+    # バックエンド1台あたりのLLM呼び出しの同時実行数(0以下で無制限)と
+    # 優先度ごとの待ち行列の上限
+    # 上限を超えた呼び出しは待たずに503(LLM_OVERLOADED)で拒否する
+    LLM_MAX_CONCURRENCY: int = Field(default=2)
+    LLM_QUEUE_LIMITS: dict[str, int] = Field(
+        default={"interactive": 20, "normal": 10, "background": 2}
+    )
+    # JSON応答をストリーミングで受信し、オブジェクトが閉じた時点で生成を打ち切る
+    LLM_STREAM_JSON_EARLY_STOP: bool = Field(default=True)
+    # JSONを返すタスクで応答のJSONスキーマを送り、スキーマに合う出力だけを生成させる
+    LLM_STRUCTURED_OUTPUT: bool = Field(default=True)
+    # JSONの解析・検証に失敗した応答を生成し直す回数
+    LLM_JSON_MAX_REGENERATIONS: int = Field(default=1)
+    # 同一プロンプトの実行中の呼び出しを1回にまとめるタスク
+    # (generate_tables, generate_scaled_tables, generate_problem, check_answer)
+    LLM_COALESCE_TASKS: str | list[str] = Field(
+        default=["generate_problem", "check_answer"]
+    )
+    # LLM応答キャッシュ(タスクごとのTTL秒、0または未指定のタスクはキャッシュしない)
+    LLM_CACHE_TTLS: dict[str, float] = Field(default={"check_answer": 86400.0})
+    LLM_CACHE_MAX_ENTRIES: int = Field(default=1000)
+    LLM_CACHE_MAX_BYTES: int = Field(default=32 * 1024 * 1024)
+    LLM_CACHE_PERSISTENT: bool = Field(default=False)  # app_systemに保存して共有
+    # 回答チェックのプロンプトに含める実行結果の差分のトークン数の上限(概算)
+    LLM_ANSWER_CHECK_TOKEN_BUDGET: int = Field(default=600)
 
     # CORS
     ALLOWED_ORIGINS: str | list[str] = Field(
@@ -39,6 +111,28 @@ class Settings(BaseSettings):
     SQL_EXECUTION_TIMEOUT: float = Field(default=5.0)
     MAX_RESULT_ROWS: int = Field(default=100)
 
+    # 大規模データ生成(パフォーマンスチューニング演習用)
+    SCALED_DATA_DEFAULT_ROWS: int = Field(default=100_000)
+    SCALED_DATA_MIN_ROWS: int = Field(default=10_000)
+    SCALED_DATA_MAX_ROWS: int = Field(default=1_000_000)
+    SCALED_DATA_LOAD_TIMEOUT: float = Field(default=300.0)
+
+    # テーマライブラリ(生成済みテーマの再利用)
+    # auto: 同じプロンプトのテーマがTHEME_LIBRARY_MIN_VARIANTS件以上あれば再利用
+    # reuse: 1件でもあれば再利用 / fresh: 常にLLMで新規生成
+    THEME_LIBRARY_ENABLED: bool = Field(default=True)
+    THEME_LIBRARY_POLICY: str = Field(default="auto")
+    THEME_LIBRARY_MIN_VARIANTS: int = Field(default=3)
+
+    # 問題生成APIで並行して生成する問題の候補数(最初に出題条件を満たした候補を使う)
+    PROBLEM_CANDIDATES: int = Field(default=3)
+    # 問題の事前生成プール(セッションスキーマごとに検証済みの問題を蓄える)
+    PROBLEM_POOL_ENABLED: bool = Field(default=True)
+    PROBLEM_POOL_SIZE: int = Field(default=3)
+    PROBLEM_POOL_MAX_SCHEMAS: int = Field(default=100)
+    # 補充1回あたりに許容する生成失敗・不適格の回数(超えたら補充を打ち切る)
+    PROBLEM_POOL_MAX_FAILURES: int = Field(default=3)
+
     def get_allowed_origins(self) -> list[str]:
         """CORS許可オリジンのリストを返す"""
         if isinstance(self.ALLOWED_ORIGINS, str):
@@ -56,6 +150,18 @@ class Settings(BaseSettings):
         else:
             return []
 
+    def get_llm_api_urls(self) -> list[str]:
+        """LLMバックエンドのURLのリストを返す(未指定時はLLM_API_URLのみ)"""
+        return _parse_str_list(self.LLM_API_URLS) or [self.LLM_API_URL]
+
+    def get_coalesce_tasks(self) -> list[str]:
+        """呼び出しを合流させるLLMタスクのリストを返す"""
+        return _parse_str_list(self.LLM_COALESCE_TASKS)
+
+    def get_llm_cache_ttl(self, task: str) -> float:
+        """LLMタスクの応答キャッシュTTL(秒)を返す(0はキャッシュしない)"""
+        return max(float(self.LLM_CACHE_TTLS.get(task, 0.0)), 0.0)
+
     model_config = SettingsConfigDict(
         env_file=".env",
         case_sensitive=True,
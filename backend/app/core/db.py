@@ -2,19 +2,80 @@
 PostgreSQL接続管理
 """
 
-import asyncio
+import json
 import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, NoReturn
 
 import asyncpg
 
+from app.core.bulk_loader import load_statements
 from app.core.config import settings
 from app.core.exceptions import DatabaseError
+from app.core.session import quote_ident
 
 logger = logging.getLogger(__name__)
 
+# statement_timeoutより後にクライアント側の待機を打ち切るための猶予(秒)
+_CLIENT_TIMEOUT_GRACE = 1.0
+
+# スキーマ内のテーブル・カラム・主キー・外部キーを一括取得するクエリ
+_TABLE_SCHEMAS_QUERY = """
+SELECT
+    c.relname AS table_name,
+    COALESCE(
+        (
+            SELECT json_agg(
+                json_build_object(
+                    'name', a.attname,
+                    'type', upper(format_type(a.atttypid, NULL)),
+                    'nullable', NOT a.attnotnull,
+                    'is_primary_key', EXISTS (
+                        SELECT 1
+                        FROM pg_constraint pk
+                        WHERE pk.conrelid = c.oid
+                        AND pk.contype = 'p'
+                        AND a.attnum = ANY (pk.conkey)
+                    ),
+                    'foreign_key', (
+                        SELECT json_build_object(
+                            'table', ref_class.relname,
+                            'column', ref_attr.attname
+                        )
+                        FROM pg_constraint fk
+                        CROSS JOIN LATERAL unnest(fk.conkey, fk.confkey)
+                            AS k(attnum, ref_attnum)
+                        JOIN pg_class ref_class ON ref_class.oid = fk.confrelid
+                        JOIN pg_attribute ref_attr
+                            ON ref_attr.attrelid = fk.confrelid
+                            AND ref_attr.attnum = k.ref_attnum
+                        WHERE fk.conrelid = c.oid
+                        AND fk.contype = 'f'
+                        AND k.attnum = a.attnum
+                        LIMIT 1
+                    )
+                )
+                ORDER BY a.attnum
+            )
+            FROM pg_attribute a
+            WHERE a.attrelid = c.oid
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+        ),
+        '[]'::json
+    )::text AS columns
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = $1
+AND c.relkind IN ('r', 'p')
+ORDER BY c.relname
+"""
+
+
+class _ReplayRollback(Exception):
+    """失敗した文の特定のための再実行をロールバックさせる"""
+
 
 class Database:
     """データベース接続管理クラス"""
@@ -49,8 +110,16 @@ class Database:
             logger.info("Database connection pool closed")
 
     @asynccontextmanager
-    async def acquire(self) -> AsyncGenerator[asyncpg.Connection, None]:
-        """接続をコンテキストマネージャーとして取得"""
+    async def acquire(
+        self, schema: str | None = None
+    ) -> AsyncGenerator[asyncpg.Connection, None]:
+        """
+        接続をコンテキストマネージャーとして取得
+
+        Args:
+            schema: search_pathに設定するスキーマ(セッションスキーマ等)
+                接続はプール返却時にRESET ALLされるため他の利用者に漏れない
+        """
         if not self.pool:
             raise DatabaseError(
                 message="データベースプールが初期化されていません",
@@ -59,26 +128,79 @@ class Database:
             )
 
         async with self.pool.acquire() as connection:
+            if schema:
+                await connection.execute(f"SET search_path TO {quote_ident(schema)}")
             yield connection
 
     async def execute_select(
-        self, query: str, *args: Any, query_timeout: float | None = None
+        self,
+        query: str,
+        *args: Any,
+        query_timeout: float | None = None,
+        schema: str | None = None,
     ) -> list[dict[str, Any]]:
-        """SELECT文を実行"""
+        """
+        SELECT文を実行
+
+        query_timeoutを指定した場合はサーバー側のstatement_timeoutで実行時間を制限し、
+        クライアント側で待機を打ち切った場合もバックエンドにキャンセル要求を送る
+        (キャンセル要求はasyncpgが接続とは別のソケットで送る)
+        """
+        rows = await self._select(
+            query, args, query_timeout=query_timeout, schema=schema
+        )
+
+        # 結果を辞書形式に変換
+        return [dict(row) for row in rows]
+
+    async def execute_bounded_select(
+        self,
+        query: str,
+        *args: Any,
+        max_rows: int,
+        query_timeout: float | None = None,
+        schema: str | None = None,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        サーバーサイドカーソルで最大max_rows行までSELECT文の結果を取得
+
+        max_rows + 1行だけ取得して打ち切りを判定するため、
+        結果セット全体がバックエンドのメモリに載ることはない
+
+        Returns:
+            (結果行, 打ち切られたかどうか)
+        """
+        rows = await self._select(
+            query,
+            args,
+            query_timeout=query_timeout,
+            schema=schema,
+            limit=max_rows + 1,
+        )
+        truncated = len(rows) > max_rows
+
+        return [dict(row) for row in rows[:max_rows]], truncated
+
+    async def _select(
+        self,
+        query: str,
+        args: tuple[Any, ...],
+        query_timeout: float | None = None,
+        schema: str | None = None,
+        limit: int | None = None,
+    ) -> list[asyncpg.Record]:
+        """SELECT文を実行し、エラーをDatabaseErrorに変換"""
         try:
-            async with self.acquire() as conn:
-                # タイムアウト設定
-                if query_timeout:
-                    rows = await asyncio.wait_for(
-                        conn.fetch(query, *args), timeout=query_timeout
+            async with self.acquire(schema) as conn:
+                if query_timeout or limit:
+                    return await self._fetch_guarded(
+                        conn, query, args, query_timeout, limit
                     )
-                else:
-                    rows = await conn.fetch(query, *args)
 
-                # 結果を辞書形式に変換
-                return [dict(row) for row in rows]
+                rows: list[asyncpg.Record] = await conn.fetch(query, *args)
+                return rows
 
-        except TimeoutError:
+        except (TimeoutError, asyncpg.QueryCanceledError):
             raise DatabaseError(
                 message="SQL実行タイムアウト",
                 error_code="DB_TIMEOUT_ERROR",
@@ -94,10 +216,46 @@ class Database:
                 message="SQL実行エラー", error_code="DB_EXECUTION_ERROR", detail=str(e)
             ) from None
 
-    async def execute(self, query: str, *args: Any) -> Any:
+    async def _fetch_guarded(
+        self,
+        conn: asyncpg.Connection,
+        query: str,
+        args: tuple[Any, ...],
+        query_timeout: float | None,
+        limit: int | None,
+    ) -> list[asyncpg.Record]:
+        """
+        読み取り専用トランザクション内でSELECT文を実行
+
+        query_timeout指定時はstatement_timeoutをトランザクション単位で設定し、
+        limit指定時はサーバーサイドカーソルからlimit行だけ取得する
+
+        Raises:
+            asyncpg.QueryCanceledError: サーバー側でタイムアウトした場合
+            TimeoutError: クライアント側の待機上限を超えた場合
+        """
+        client_timeout = (
+            query_timeout + _CLIENT_TIMEOUT_GRACE if query_timeout else None
+        )
+
+        async with conn.transaction(readonly=True):
+            if query_timeout:
+                timeout_ms = max(1, int(query_timeout * 1000))
+                await conn.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+            # タイムアウト・キャンセル時はasyncpgがプール外の専用ソケットで
+            # CancelRequestを送り、サーバーで走り続けるクエリを中断する
+            rows: list[asyncpg.Record]
+            if limit:
+                cursor = await conn.cursor(query, *args, timeout=client_timeout)
+                rows = await cursor.fetch(limit, timeout=client_timeout)
+            else:
+                rows = await conn.fetch(query, *args, timeout=client_timeout)
+            return rows
+
+    async def execute(self, query: str, *args: Any, schema: str | None = None) -> Any:
         """任意のSQLを実行(CREATE/DROP等)"""
         try:
-            async with self.acquire() as conn:
+            async with self.acquire(schema) as conn:
                 result = await conn.execute(query, *args)
                 return result
         except Exception as e:
@@ -106,68 +264,255 @@ class Database:
                 message="SQL実行エラー", error_code="DB_EXECUTION_ERROR", detail=str(e)
             ) from None
 
-    async def get_table_schemas(self) -> list[dict[str, Any]]:
-        """現在のテーブルスキーマ情報を取得"""
-        query = """
-        SELECT
-            t.table_name,
-            t.table_type,
-            obj_description(pgc.oid, 'pg_class') as table_comment
-        FROM information_schema.tables t
-        JOIN pg_class pgc ON pgc.relname = t.table_name
-        WHERE t.table_schema = 'public'
-        AND t.table_type = 'BASE TABLE'
-        ORDER BY t.table_name;
-        """
-
-        tables = await self.execute_select(query)
-
-        # 各テーブルのカラム情報を取得
-        for table in tables:
-            column_query = """
-            SELECT
-                column_name,
-                data_type,
-                is_nullable,
-                column_default,
-                character_maximum_length
-            FROM information_schema.columns
-            WHERE table_schema = 'public'
-            AND table_name = $1
-            ORDER BY ordinal_position;
-            """
+    async def execute_batch(
+        self,
+        statements: list[str],
+        schema: str | None = None,
+        bulk_load: bool = False,
+    ) -> dict[str, int]:
+        """
+        複数のSQL文を1つの接続・1つのトランザクションで実行
+
+        全文を1つのsimple queryメッセージにまとめて1往復で送信する。
+        失敗した場合は全体をロールバックし、どの文が失敗したかを特定するため
+        必ずロールバックするトランザクション内で1文ずつ再実行する
+        (再実行の結果は残さず、失敗は常に呼び出し元に返す)
 
-            columns = await self.execute_select(column_query, table["table_name"])
-            table["columns"] = columns
+        Args:
+            statements: 実行するSQL文のリスト
+            schema: search_pathに設定するスキーマ
+            bulk_load: INSERT文をバイナリCOPYに変換して投入し、最後にANALYZEするか
 
-        return tables
+        Returns:
+            ロード統計(bulk_load時のみ値が入る)
+
+        Raises:
+            DatabaseError: 実行失敗時(dataに失敗した文の位置を含む)
+        """
+        statements = [
+            sql.strip().rstrip(";").rstrip() for sql in statements if sql.strip()
+        ]
+        stats: dict[str, int] = {}
+        if not statements:
+            return stats
 
-    async def drop_all_tables(self) -> None:
-        """全てのテーブルを削除(開発用)"""
         try:
-            async with self.acquire() as conn:
-                # 外部キー制約を一時的に無効化
-                await conn.execute("SET session_replication_role = 'replica';")
+            async with self.acquire(schema) as conn:
+                try:
+                    async with conn.transaction():
+                        if bulk_load:
+                            stats = await load_statements(conn, statements)
+                        else:
+                            # 行コメントで区切り文字が無効化されないよう改行で挟む
+                            await conn.execute("\n;\n".join(statements))
+                except asyncpg.PostgresError as e:
+                    logger.warning(f"Batch execution failed, locating statement: {e}")
+                    await self._locate_failed_statement(conn, statements, e)
 
-                # 全テーブル削除
-                tables = await conn.fetch(
-                    "SELECT tablename FROM pg_tables WHERE schemaname = 'public';"
-                )
+                if bulk_load:
+                    # 投入直後のテーブルに統計情報を持たせ、学習者のクエリの実行計画を安定させる
+                    await self._analyze_schema_tables(conn)
 
-                for table in tables:
-                    await conn.execute(
-                        f"DROP TABLE IF EXISTS {table['tablename']} CASCADE;"
-                    )
+            return stats
+
+        except DatabaseError:
+            raise
+        except Exception as e:
+            logger.error(f"Database batch execute error: {e}")
+            raise DatabaseError(
+                message="SQL実行エラー", error_code="DB_EXECUTION_ERROR", detail=str(e)
+            ) from None
 
-                # 外部キー制約を再有効化
-                await conn.execute("SET session_replication_role = 'origin';")
+    async def execute_generation(
+        self,
+        statements: list[tuple[str, list[Any]]],
+        schema: str | None = None,
+        command_timeout: float | None = None,
+    ) -> list[int]:
+        """
+        パラメータ付きのデータ生成文を1トランザクションで実行し、最後にANALYZE
+
+        Args:
+            statements: (SQL文, 引数)のリスト
+            schema: search_pathに設定するスキーマ
+            command_timeout: 1文あたりの制限時間(大量データ生成用)
+
+        Returns:
+            各文で挿入された行数
+
+        Raises:
+            DatabaseError: 実行失敗時(dataに失敗した文の位置を含む)
+        """
+        inserted: list[int] = []
+        try:
+            async with self.acquire(schema) as conn:
+                async with conn.transaction():
+                    for index, (sql, args) in enumerate(statements):
+                        try:
+                            status = await conn.execute(
+                                sql, *args, timeout=command_timeout
+                            )
+                        except asyncpg.PostgresError as e:
+                            raise DatabaseError(
+                                message="データ生成に失敗しました",
+                                error_code="DB_EXECUTION_ERROR",
+                                detail=f"{index + 1}番目の生成文でエラー: {e}",
+                                data={"statement_index": index, "statement": sql},
+                            ) from None
+                        # "INSERT 0 <行数>" から行数を取り出す
+                        inserted.append(int(status.rsplit(" ", 1)[-1]))
+
+                await self._analyze_schema_tables(conn)
+
+            return inserted
+
+        except DatabaseError:
+            raise
+        except Exception as e:
+            logger.error(f"Data generation error: {e}")
+            raise DatabaseError(
+                message="データ生成に失敗しました",
+                error_code="DB_EXECUTION_ERROR",
+                detail=str(e),
+            ) from None
+
+    async def _locate_failed_statement(
+        self,
+        conn: asyncpg.Connection,
+        statements: list[str],
+        error: asyncpg.PostgresError,
+    ) -> NoReturn:
+        """
+        1文ずつ再実行して失敗した文を特定
+
+        再実行は位置の特定のためだけに行い、トランザクションは必ずロールバックする。
+        再実行ではすべて成功した場合(デッドロック・タイムアウトなど一時的な失敗や、
+        COPYでの投入のみ失敗した場合)も、元のエラーを返す
+
+        Args:
+            conn: 一括実行に使った接続
+            statements: 一括実行したSQL文のリスト
+            error: 一括実行で発生したエラー
+
+        Raises:
+            DatabaseError: 常に送出(特定できた場合はdataに失敗した文の位置を含む)
+        """
+        try:
+            async with conn.transaction():
+                for index, sql in enumerate(statements):
+                    try:
+                        await conn.execute(sql)
+                    except asyncpg.PostgresError as e:
+                        raise DatabaseError(
+                            message="SQL文の実行に失敗しました",
+                            error_code="DB_EXECUTION_ERROR",
+                            detail=f"{index + 1}番目のSQL文でエラー: {e}",
+                            data={"statement_index": index, "statement": sql},
+                        ) from None
+                raise _ReplayRollback
+        except _ReplayRollback:
+            pass
+
+        logger.warning(f"Batch failed but every statement succeeded on replay: {error}")
+        raise DatabaseError(
+            message="SQL文の実行に失敗しました",
+            error_code="DB_EXECUTION_ERROR",
+            detail=str(error),
+        )
+
+    async def _analyze_schema_tables(self, conn: asyncpg.Connection) -> None:
+        """search_path先頭スキーマの全テーブルをANALYZE"""
+        tables = await conn.fetch(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema()"
+        )
+        if tables:
+            table_list = ", ".join(quote_ident(table["tablename"]) for table in tables)
+            await conn.execute(f"ANALYZE {table_list}")
 
-                logger.info(f"Dropped {len(tables)} tables")
+    async def drop_schema(self, schema: str) -> None:
+        """スキーマを配下のオブジェクトごと削除"""
+        await self.execute(f"DROP SCHEMA IF EXISTS {quote_ident(schema)} CASCADE")
+
+    async def get_table_schemas(self, schema: str = "public") -> list[dict[str, Any]]:
+        """
+        スキーマ内の全テーブルの構造を1回の問い合わせで取得
+
+        information_schemaのビューを使わずpg_catalogを直接参照し、
+        カラム・主キー・外部キーをサーバー側でJSONに集約する
+
+        Args:
+            schema: 対象スキーマ名
+
+        Returns:
+            テーブル構造のリスト
+            [{"table_name": str, "columns": [{"name", "type", "nullable",
+              "is_primary_key", "foreign_key"(外部キーの場合のみ)}]}]
+        """
+        rows = await self.execute_select(_TABLE_SCHEMAS_QUERY, schema)
+
+        schemas = []
+        for row in rows:
+            columns = json.loads(row["columns"])
+            for column in columns:
+                # 外部キーでないカラムにはキー自体を含めない
+                if column["foreign_key"] is None:
+                    del column["foreign_key"]
+            schemas.append({"table_name": row["table_name"], "columns": columns})
+
+        return schemas
+
+    async def get_column_types(self, schema: str) -> dict[str, dict[str, str]]:
+        """
+        スキーマ内の全テーブルのカラムの型を取得
+
+        Returns:
+            {テーブル名: {カラム名: 型名(format_type(atttypid, NULL))}}
+        """
+        rows = await self.execute_select(
+            """
+            SELECT c.relname AS table_name, a.attname AS column_name,
+                format_type(a.atttypid, NULL) AS type_name
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid
+            WHERE n.nspname = $1
+            AND c.relkind IN ('r', 'p')
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+            """,
+            schema,
+        )
+
+        column_types: dict[str, dict[str, str]] = {}
+        for row in rows:
+            column_types.setdefault(row["table_name"], {})[row["column_name"]] = row[
+                "type_name"
+            ]
+        return column_types
+
+    async def reset_schema(self, schema: str) -> None:
+        """
+        スキーマを削除して空の状態で作り直す
+
+        テーブル数に関係なく1トランザクション・1往復で完了し、
+        途中まで削除された状態が残ることはない
+
+        Raises:
+            DatabaseError: リセット失敗時
+        """
+        identifier = quote_ident(schema)
+        try:
+            async with self.acquire() as conn, conn.transaction():
+                await conn.execute(
+                    f"DROP SCHEMA IF EXISTS {identifier} CASCADE;\n"
+                    f"CREATE SCHEMA {identifier};"
+                )
+            logger.info(f"Reset schema {schema}")
 
         except Exception as e:
-            logger.error(f"Failed to drop tables: {e}")
+            logger.error(f"Failed to reset schema {schema}: {e}")
             raise DatabaseError(
-                message="テーブル削除エラー",
+                message="スキーマのリセットに失敗しました",
                 error_code="DB_DROP_TABLE_ERROR",
                 detail=str(e),
             ) from None
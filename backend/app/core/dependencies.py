@@ -2,10 +2,11 @@
 依存性注入の設定
 """
 
-from functools import lru_cache
+from fastapi import Depends
 
 from app.core.db import Database, db
-from app.core.llm_client import LLMClient
+from app.core.llm_client import LLMClient, llm_client
+from app.core.session import get_session_id, session_schema_name
 from app.services.db_service import DatabaseService
 from app.services.llm_service import LLMService
 
@@ -15,10 +16,9 @@ async def get_db() -> Database:
     return db
 
 
-@lru_cache(maxsize=1)
 def _get_llm_client() -> LLMClient:
-    """LLMクライアントのシングルトンインスタンスを取得"""
-    return LLMClient()
+    """LLMクライアントのシングルトンインスタンスを取得(接続プールを共有)"""
+    return llm_client
 
 
 async def get_llm() -> LLMService:
@@ -26,6 +26,8 @@ async def get_llm() -> LLMService:
     return LLMService(_get_llm_client())
 
 
-async def get_db_service() -> DatabaseService:
-    """データベースサービスを取得"""
-    return DatabaseService(db)
+async def get_db_service(
+    session_id: str = Depends(get_session_id),
+) -> DatabaseService:
+    """セッションスキーマに紐づいたデータベースサービスを取得"""
+    return DatabaseService(db, session_schema_name(session_id))
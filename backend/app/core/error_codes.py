@@ -8,6 +8,7 @@ VALIDATION_INVALID_SQL = "VALIDATION_INVALID_SQL"
 VALIDATION_EMPTY_SQL = "VALIDATION_EMPTY_SQL"
 VALIDATION_SQL_TOO_LONG = "VALIDATION_SQL_TOO_LONG"
 VALIDATION_INVALID_PROMPT = "VALIDATION_INVALID_PROMPT"
+VALIDATION_INVALID_SESSION = "VALIDATION_INVALID_SESSION"
 
 # NOT_FOUND エラー(404)
 NOT_FOUND_PROBLEM = "NOT_FOUND_PROBLEM"
@@ -17,6 +18,7 @@ NOT_FOUND_TABLES = "NOT_FOUND_TABLES"
 DB_CONNECTION_ERROR = "DB_CONNECTION_ERROR"
 DB_EXECUTION_ERROR = "DB_EXECUTION_ERROR"
 DB_TIMEOUT_ERROR = "DB_TIMEOUT_ERROR"
+DB_CANCELLED_ERROR = "DB_CANCELLED_ERROR"
 DB_SYNTAX_ERROR = "DB_SYNTAX_ERROR"
 DB_SCHEMA_ERROR = "DB_SCHEMA_ERROR"
 DB_NOT_INITIALIZED_ERROR = "DB_NOT_INITIALIZED_ERROR"
@@ -27,6 +29,8 @@ LLM_CONNECTION = "LLM_CONNECTION"
 LLM_TIMEOUT = "LLM_TIMEOUT"
 LLM_INVALID_RESPONSE = "LLM_INVALID_RESPONSE"
 LLM_GENERATION_FAILED = "LLM_GENERATION_FAILED"
+LLM_CIRCUIT_OPEN = "LLM_CIRCUIT_OPEN"
+LLM_OVERLOADED = "LLM_OVERLOADED"
 
 # INTERNAL エラー(500)
 INTERNAL_ERROR = "INTERNAL_ERROR"
@@ -57,9 +57,14 @@ class DatabaseError(AppException):
         message: str,
         error_code: str = "DATABASE_ERROR",
         detail: str | None = None,
+        data: dict[str, Any] | None = None,
     ):
         super().__init__(
-            message=message, error_code=error_code, status_code=500, detail=detail
+            message=message,
+            error_code=error_code,
+            status_code=500,
+            detail=detail,
+            data=data,
         )
 
 
@@ -0,0 +1,69 @@
+"""
+JSONの終端検出
+ストリーミング中のLLM出力から、トップレベルのJSONオブジェクトが閉じた位置を逐次判定する
+"""
+
+
+class JsonBoundaryDetector:
+    """
+    トップレベルJSONオブジェクトの終端検出器
+
+    最初の "{" からオブジェクトの開始とみなし、文字列リテラル内の括弧や
+    エスケープを考慮して対応する "}" までを追跡する。```json のような
+    コードフェンスや前置きの文章は "{" が現れるまで読み飛ばす
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str = "") -> tuple[int, int] | None:
+        """
+        断片を追加し、オブジェクトが閉じたら(開始位置, 終了位置)を返す
+
+        閉じた位置で走査を止めるため、検出した範囲がJSONとして解析できなかった
+        場合は feed() を再度呼ぶと続きから次のオブジェクトを探す
+
+        Args:
+            chunk: ストリームから受け取ったテキスト断片
+
+        Returns:
+            これまでに受け取った全テキスト上の[開始, 終了)の範囲。
+            まだ閉じていない場合はNone
+        """
+        self.text += chunk
+
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+            self._pos += 1
+
+            if self._start is None:
+                if char == "{":
+                    self._start = self._pos - 1
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    start, self._start = self._start, None
+                    return start, self._pos
+
+        return None
@@ -0,0 +1,162 @@
+"""
+LLM出力からのJSON抽出と修復
+前置きの文章やコードフェンスに埋め込まれたJSONオブジェクトを取り出し、
+LLMが出しがちな軽微な書式の誤りを直してから解析する
+"""
+
+import json
+from typing import Any
+
+# 文字列の外で二重引用符として扱う文字(“ ” „ ＂)
+SMART_QUOTES = frozenset("“”„＂")
+
+# 文字列内でそのまま書かれた制御文字のエスケープ
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+# 修復を試みるオブジェクト候補の最大数(対応しない "{" が多い文章で走査を打ち切る)
+MAX_CANDIDATES = 8
+
+# 修復の種類(メトリクス名に使用)
+SMART_QUOTES_REPAIR = "smart_quotes"
+TRAILING_COMMA_REPAIR = "trailing_comma"
+CONTROL_CHARACTER_REPAIR = "control_character"
+UNTERMINATED_STRING_REPAIR = "unterminated_string"
+UNCLOSED_BRACKET_REPAIR = "unclosed_bracket"
+
+
+def _scan_object(text: str, start: int) -> tuple[str, int, list[str]]:
+    """
+    startの "{" から対応する閉じ括弧までを走査し、修復したテキストを作成
+
+    Returns:
+        (修復後のテキスト, 走査を終えた位置, 適用した修復の種類)
+    """
+    out: list[str] = []
+    repairs: list[str] = []
+    closers: list[str] = []
+    in_string = False
+    smart_string = False
+    escape = False
+    # 直前の有効な文字が文字列外のカンマの場合、その出力位置
+    last_comma: int | None = None
+
+    def repaired(kind: str) -> None:
+        if kind not in repairs:
+            repairs.append(kind)
+
+    pos = start
+    while pos < len(text):
+        char = text[pos]
+        pos += 1
+
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == '"' or (smart_string and char in SMART_QUOTES):
+                in_string = False
+                out.append('"')
+            elif char in _CONTROL_ESCAPES:
+                repaired(CONTROL_CHARACTER_REPAIR)
+                out.append(_CONTROL_ESCAPES[char])
+            else:
+                out.append(char)
+            continue
+
+        if char == '"' or char in SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            if smart_string:
+                repaired(SMART_QUOTES_REPAIR)
+            out.append('"')
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            if last_comma is not None:
+                repaired(TRAILING_COMMA_REPAIR)
+                out[last_comma] = ""
+            if closers:
+                closers.pop()
+            out.append(char)
+            if not closers:
+                return "".join(out), pos, repairs
+        elif char == ",":
+            out.append(char)
+            last_comma = len(out) - 1
+            continue
+        else:
+            out.append(char)
+            if char.isspace():
+                continue
+
+        last_comma = None
+
+    # 出力が途中で終わった場合(max_tokensによる打ち切りなど)は閉じる
+    if in_string:
+        if escape:
+            out.pop()
+        repaired(UNTERMINATED_STRING_REPAIR)
+        out.append('"')
+    elif last_comma is not None:
+        repaired(TRAILING_COMMA_REPAIR)
+        out[last_comma] = ""
+    if closers:
+        repaired(UNCLOSED_BRACKET_REPAIR)
+        out.extend(reversed(closers))
+    return "".join(out), pos, repairs
+
+
+def _loads_object(text: str) -> dict[str, Any] | None:
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def extract_json_object(text: str) -> tuple[dict[str, Any], list[str]]:
+    """
+    テキスト中の最初のJSONオブジェクトを抽出
+
+    "{" から対応する閉じ括弧までを候補とし、そのまま解析できなければ
+    以下の修復を適用して解析し直す。解析できない候補は読み飛ばして次を探す
+    (閉じた候補どうしは重ならないため走査はテキスト長に対して線形時間。
+    閉じない候補があっても走査はMAX_CANDIDATES回まで)
+
+    - 文字列の区切りに使われたスマートクォート(“ ”)を二重引用符に置換
+    - 閉じ括弧の直前の余分なカンマを削除
+    - 文字列内の改行・タブをエスケープ
+    - 途中で終わった文字列・括弧を閉じる
+
+    Args:
+        text: LLMの出力
+
+    Returns:
+        (解析したオブジェクト, 適用した修復の種類)
+
+    Raises:
+        ValueError: JSONオブジェクトが見つからない場合
+    """
+    pos = 0
+    for _ in range(MAX_CANDIDATES):
+        start = text.find("{", pos)
+        if start == -1:
+            break
+
+        repaired_text, end, repairs = _scan_object(text, start)
+        parsed = _loads_object(text[start:end])
+        if parsed is not None:
+            return parsed, []
+        if repairs:
+            parsed = _loads_object(repaired_text)
+            if parsed is not None:
+                return parsed, repairs
+
+        # 閉じなかった候補は最後まで読んでいるため、直後から次の候補を探す
+        pos = start + 1 if UNCLOSED_BRACKET_REPAIR in repairs else end
+
+    raise ValueError("JSONオブジェクトが見つかりません")
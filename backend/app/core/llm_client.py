@@ -4,7 +4,12 @@ LocalAI/Ollama対応のOpenAI API互換HTTPクライアント
 """
 
 import asyncio
+import importlib.util
+import json
 import logging
+import random
+import time
+from collections.abc import AsyncGenerator
 from typing import Any
 
 import httpx
@@ -17,27 +22,153 @@ from app.core.error_codes import (
     LLM_TIMEOUT,
 )
 from app.core.exceptions import LLMError
+from app.core.llm_router import LLMBackend, LLMRouter
+from app.core.llm_scheduler import llm_scheduler
+from app.core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
+def _is_server_failure(status_code: int) -> bool:
+    """LLMサーバー側の障害・過負荷を示すステータスか"""
+    return status_code >= 500 or status_code == 429
+
+
 class LLMClient:
     """LLM HTTPクライアント (LocalAI/Ollama対応)"""
 
     def __init__(self) -> None:
         self.endpoint_type = settings.LLM_ENDPOINT_TYPE
-        self.base_url = settings.LLM_API_URL
+        self.router = LLMRouter(settings.get_llm_api_urls())
         self.model_name = settings.LLM_MODEL_NAME
         self.timeout = settings.LLM_TIMEOUT
         self.max_retries = settings.LLM_MAX_RETRIES
         self.temperature = settings.LLM_TEMPERATURE
         self.max_tokens = settings.LLM_MAX_TOKENS
+        # OllamaではネイティブAPI(/api/chat)でkeep_aliveを指定し、モデルとKVキャッシュを保持する
+        self.ollama_native = (
+            self.endpoint_type == "ollama" and settings.LLM_OLLAMA_NATIVE
+        )
+        self._client: httpx.AsyncClient | None = None
+        # 直近の死活確認の結果(確認時刻, 結果)
+        self._health: tuple[float, bool] | None = None
+        self._health_refresh: asyncio.Task[bool] | None = None
+        self._health_monitor: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        """
+        接続プール付きのHTTPクライアントを作成(アプリ起動時に1回)
+
+        keep-aliveした接続を全リクエストで再利用し、毎回のTCP/TLS接続を避ける
+        """
+        if self._client is not None:
+            return
+
+        http2 = settings.LLM_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning(
+                "LLM_HTTP2 is enabled but h2 is not installed; using HTTP/1.1"
+            )
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, read=self.timeout),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info(f"LLM HTTP client started (http2={http2})")
+
+    async def close(self) -> None:
+        """HTTPクライアントを閉じて接続を解放(アプリ終了時)"""
+        for task in (self._health_monitor, self._health_refresh):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._health_monitor = None
+        self._health_refresh = None
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("LLM HTTP client closed")
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """共有HTTPクライアントを取得(lifespan外で使われた場合は遅延作成)"""
+        if self._client is None:
+            await self.start()
+        assert self._client is not None
+        return self._client
+
+    async def _post(
+        self,
+        payload: dict[str, Any],
+        timeout: float | None = None,
+        failed: set[str] | None = None,
+    ) -> httpx.Response:
+        """
+        バックエンドを選択してチャットAPIにPOSTし、結果をバックエンドごとに記録
+
+        接続の新規作成・再利用もメトリクスに記録する。新規接続かどうかは
+        httpxのtrace拡張(connect_tcpイベントの有無)で判定する
+
+        Args:
+            payload: リクエストボディ
+            timeout: タイムアウト(省略時はクライアントの既定値)
+            failed: 同じ呼び出しで失敗したバックエンドのURL。
+                選択時に避け、今回失敗した場合は追加する
+
+        Raises:
+            LLMError: 全バックエンドのブレーカーがopenの場合(503)
+            httpx.HTTPError: 通信失敗時
+        """
+        client = await self._get_client()
+        backend = self.router.select(exclude=failed)
+        connected = False
+
+        async def trace(event_name: str, _info: dict[str, Any]) -> None:
+            nonlocal connected
+            if event_name == "connection.connect_tcp.complete":
+                connected = True
+
+        kwargs: dict[str, Any] = {"json": payload, "extensions": {"trace": trace}}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        started = backend.begin()
+        try:
+            response = await client.post(self._chat_url(backend), **kwargs)
+        except Exception:
+            backend.end(started, success=False)
+            if failed is not None:
+                failed.add(backend.url)
+            raise
+
+        # リクエスト自体の誤り(4xx)はバックエンドの障害として扱わない
+        healthy = not _is_server_failure(response.status_code)
+        backend.end(started, success=healthy)
+        if not healthy and failed is not None:
+            failed.add(backend.url)
+
+        metrics.increment("llm_http.requests")
+        if connected:
+            metrics.increment("llm_http.connections_opened")
+        else:
+            metrics.increment("llm_http.connections_reused")
+        if response.http_version == "HTTP/2":
+            metrics.increment("llm_http.http2_requests")
+        return response
 
     async def chat_completion(
         self,
         messages: list[dict[str, str]],
         temperature: float | None = None,
         max_tokens: int | None = None,
+        response_schema: dict[str, Any] | None = None,
     ) -> dict[str, Any]:
         """
         チャット補完APIを呼び出し
@@ -46,6 +177,7 @@ class LLMClient:
             messages: チャットメッセージのリスト
             temperature: サンプリング温度(オプション)
             max_tokens: 最大トークン数(オプション)
+            response_schema: 応答のJSONスキーマ(指定時は構造化出力を要求)
 
         Returns:
             LLMからのレスポンス
@@ -53,71 +185,74 @@ class LLMClient:
         Raises:
             LLMError: API呼び出し失敗時
         """
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "temperature": temperature or self.temperature,
-            "max_tokens": max_tokens or self.max_tokens,
-            "stream": False,
-        }
+        payload = self._chat_payload(
+            messages, temperature, max_tokens, stream=False, schema=response_schema
+        )
 
-        # リトライ機能付きで実行
+        # 指数バックオフ(ジッター付き)でリトライし、失敗率が高い間は即座に失敗させる
+        # 実行枠はHTTP呼び出しの間だけ確保し、バックオフ中は他の呼び出しに譲る。
+        # 再試行では失敗したバックエンドを避けて別のバックエンドへ送る
+        failed: set[str] = set()
         for attempt in range(self.max_retries):
             try:
-                async with httpx.AsyncClient(
-                    timeout=httpx.Timeout(self.timeout, read=self.timeout)
-                ) as client:
-                    response = await client.post(
-                        f"{self.base_url}/chat/completions",
-                        json=payload,
-                        headers={"Content-Type": "application/json"},
-                    )
-
-                    if response.status_code == 200:
-                        result = response.json()
-                        return self._validate_response(result)
-
+                async with llm_scheduler.slot():
+                    response = await self._post(payload, failed=failed)
+            except LLMError:
+                raise
+            except httpx.TimeoutException:
+                logger.warning(f"LLM API timeout (attempt {attempt + 1})")
+                error = LLMError(
+                    message="LLM API タイムアウト",
+                    error_code=LLM_TIMEOUT,
+                    detail=f"制限時間: {self.timeout}秒",
+                )
+            except httpx.ConnectError:
+                logger.warning(f"LLM connection error (attempt {attempt + 1})")
+                error = LLMError(
+                    message="LLM接続エラー",
+                    error_code=LLM_CONNECTION,
+                    detail=f"{self.endpoint_type.upper()}サービスに接続できません",
+                )
+            except Exception as e:
+                logger.error(f"Unexpected LLM error (attempt {attempt + 1}): {e}")
+                error = LLMError(
+                    message="LLM処理エラー",
+                    error_code=LLM_GENERATION_FAILED,
+                    detail=str(e),
+                )
+            else:
+                if response.status_code == 200:
+                    try:
+                        data = response.json()
+                        if self.ollama_native:
+                            data = self._from_ollama(data)
+                        return self._validate_response(data)
+                    except ValueError as e:
+                        error = LLMError(
+                            message="LLM応答が不正です",
+                            error_code=LLM_INVALID_RESPONSE,
+                            detail=str(e),
+                        )
+                    except LLMError as e:
+                        error = e
+                else:
                     logger.warning(
                         f"LLM API error (attempt {attempt + 1}): "
                         f"{response.status_code} - {response.text}"
                     )
-                    if attempt == self.max_retries - 1:
-                        raise LLMError(
-                            message=f"LLM API エラー: {response.status_code}",
-                            error_code=LLM_CONNECTION,
-                            detail=response.text,
-                        )
-
-            except TimeoutError:
-                logger.warning(f"LLM API timeout (attempt {attempt + 1})")
-                if attempt == self.max_retries - 1:
-                    raise LLMError(
-                        message="LLM API タイムアウト",
-                        error_code=LLM_TIMEOUT,
-                        detail=f"制限時間: {self.timeout}秒",
-                    ) from None
-
-            except httpx.ConnectError:
-                logger.warning(f"LLM connection error (attempt {attempt + 1})")
-                if attempt == self.max_retries - 1:
-                    raise LLMError(
-                        message="LLM接続エラー",
+                    error = LLMError(
+                        message=f"LLM API エラー: {response.status_code}",
                         error_code=LLM_CONNECTION,
-                        detail=f"{self.endpoint_type.upper()}サービスに接続できません",
-                    ) from None
+                        detail=response.text,
+                    )
+                    if not _is_server_failure(response.status_code):
+                        # リクエスト自体の誤りは再送しても結果が変わらない
+                        raise error
 
-            except Exception as e:
-                logger.error(f"Unexpected LLM error (attempt {attempt + 1}): {e}")
-                if attempt == self.max_retries - 1:
-                    raise LLMError(
-                        message="LLM処理エラー",
-                        error_code=LLM_GENERATION_FAILED,
-                        detail=str(e),
-                    ) from None
+            if attempt == self.max_retries - 1:
+                raise error
 
-            # リトライ前に少し待機
-            if attempt < self.max_retries - 1:
-                await asyncio.sleep(1)
+            await asyncio.sleep(self._backoff_delay(attempt))
 
         # ここには到達しないはず
         raise LLMError(
@@ -126,6 +261,246 @@ class LLMClient:
             detail=f"{self.max_retries}回試行しました",
         )
 
+    def _backoff_delay(self, attempt: int) -> float:
+        """
+        リトライ前の待機時間(Full Jitter方式の指数バックオフ)
+
+        上限 min(LLM_RETRY_BACKOFF_MAX, LLM_RETRY_BACKOFF_BASE * 2^attempt) までの
+        一様乱数にすることで、同時に失敗したリクエストの再送タイミングを分散させる
+        """
+        cap = min(
+            settings.LLM_RETRY_BACKOFF_MAX,
+            settings.LLM_RETRY_BACKOFF_BASE * (2**attempt),
+        )
+        return random.uniform(0, cap)
+
+    async def chat_completion_stream(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float | None = None,
+        max_tokens: int | None = None,
+        priority: str | None = None,
+        response_schema: dict[str, Any] | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        チャット補完APIをストリーミングで呼び出し、生成されたテキストを順次返す
+
+        OpenAI互換のSSE(data: {...} の行、終端は data: [DONE])、Ollamaのネイティブ
+        APIでは1行1JSONのストリーム(終端は"done": true)を読み取る。
+        トークンを返し始めた後は途中から再試行できないため、リトライは行わない。
+        スケジューラの実行枠とバックエンドの処理中件数はストリームを閉じるまで保持する
+
+        Args:
+            messages: チャットメッセージのリスト
+            temperature: サンプリング温度(オプション)
+            max_tokens: 最大トークン数(オプション)
+            priority: スケジューラの優先度(省略時はllm_priorityで設定された値)
+            response_schema: 応答のJSONスキーマ(指定時は構造化出力を要求)
+
+        Yields:
+            生成されたテキストの断片
+
+        Raises:
+            LLMError: API呼び出し失敗時
+        """
+        payload = self._chat_payload(
+            messages, temperature, max_tokens, stream=True, schema=response_schema
+        )
+
+        client = await self._get_client()
+        started = time.perf_counter()
+        first_token = True
+        backend: LLMBackend | None = None
+        backend_started = 0.0
+        healthy = False
+
+        try:
+            async with llm_scheduler.slot(priority):
+                backend = self.router.select()
+                backend_started = backend.begin()
+                async with client.stream(
+                    "POST", self._chat_url(backend), json=payload
+                ) as response:
+                    if response.status_code != 200:
+                        healthy = not _is_server_failure(response.status_code)
+                        body = (await response.aread()).decode(errors="replace")
+                        raise LLMError(
+                            message=f"LLM API エラー: {response.status_code}",
+                            error_code=LLM_CONNECTION,
+                            detail=body,
+                        )
+                    healthy = True
+
+                    async for line in response.aiter_lines():
+                        content, done = self._parse_stream_line(line)
+                        if done:
+                            break
+
+                        if content:
+                            if first_token:
+                                first_token = False
+                                metrics.observe(
+                                    "llm.stream.first_token_ms",
+                                    (time.perf_counter() - started) * 1000,
+                                )
+                            yield content
+
+            metrics.increment("llm.stream.completed")
+
+        except LLMError:
+            raise
+        except httpx.TimeoutException:
+            healthy = False
+            raise LLMError(
+                message="LLM API タイムアウト",
+                error_code=LLM_TIMEOUT,
+                detail=f"制限時間: {self.timeout}秒",
+            ) from None
+        except httpx.ConnectError:
+            healthy = False
+            raise LLMError(
+                message="LLM接続エラー",
+                error_code=LLM_CONNECTION,
+                detail=f"{self.endpoint_type.upper()}サービスに接続できません",
+            ) from None
+        except httpx.HTTPError as e:
+            healthy = False
+            raise LLMError(
+                message="LLM処理エラー",
+                error_code=LLM_GENERATION_FAILED,
+                detail=str(e),
+            ) from None
+        finally:
+            if backend is not None:
+                backend.end(backend_started, success=healthy)
+
+    def _chat_url(self, backend: LLMBackend) -> str:
+        """バックエンドのチャットAPIのURL"""
+        if self.ollama_native:
+            return f"{backend.native_url}/api/chat"
+        return f"{backend.url}/chat/completions"
+
+    def _chat_payload(
+        self,
+        messages: list[dict[str, str]],
+        temperature: float | None,
+        max_tokens: int | None,
+        stream: bool,
+        schema: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """
+        チャットAPIのリクエストボディを作成
+
+        - Ollama(ネイティブAPI): keep_aliveでモデルをメモリに保持し、
+          前回と共通のプロンプト先頭部分のKVキャッシュを再利用させる
+        - OpenAI互換: LLM_CACHE_PROMPTが有効ならcache_promptを付ける
+          (llama.cppのサーバーがKVキャッシュを再利用する。未対応のサーバーは無視する)
+
+        schemaを指定し、LLM_STRUCTURED_OUTPUTが有効な場合は、スキーマに合う
+        トークンだけを生成させる(OllamaはformatにJSONスキーマ、LocalAIなどの
+        OpenAI互換APIはresponse_formatのjson_schemaを文法に変換して制約する)
+        """
+        schema = schema if settings.LLM_STRUCTURED_OUTPUT else None
+
+        payload: dict[str, Any]
+        if self.ollama_native:
+            payload = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": stream,
+                "keep_alive": settings.LLM_OLLAMA_KEEP_ALIVE,
+                "options": {
+                    "temperature": temperature or self.temperature,
+                    "num_predict": max_tokens or self.max_tokens,
+                },
+            }
+            if schema is not None:
+                payload["format"] = schema
+            return payload
+
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": temperature or self.temperature,
+            "max_tokens": max_tokens or self.max_tokens,
+            "stream": stream,
+        }
+        if settings.LLM_CACHE_PROMPT:
+            payload["cache_prompt"] = True
+        if schema is not None:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": schema},
+            }
+        return payload
+
+    def _parse_stream_line(self, line: str) -> tuple[str | None, bool]:
+        """
+        ストリームの1行を解析
+
+        Returns:
+            (テキストの断片, ストリームの終端かどうか)
+
+        Raises:
+            LLMError: 行を解析できない場合
+        """
+        if self.ollama_native:
+            if not line.strip():
+                return None, False
+            data = line
+        else:
+            if not line.startswith("data:"):
+                return None, False
+            data = line[len("data:") :].strip()
+            if data == "[DONE]":
+                return None, True
+
+        try:
+            chunk = json.loads(data)
+            if self.ollama_native:
+                if "error" in chunk:
+                    raise ValueError(chunk["error"])
+                if chunk.get("done"):
+                    self._record_ollama_stats(chunk)
+                    return chunk.get("message", {}).get("content"), True
+                return chunk["message"].get("content"), False
+            delta = chunk["choices"][0].get("delta") or {}
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+            raise LLMError(
+                message="LLM応答が不正です",
+                error_code=LLM_INVALID_RESPONSE,
+                detail=f"ストリームのチャンクを解析できません: {e!s}",
+            ) from None
+
+        return delta.get("content"), False
+
+    def _from_ollama(self, response: dict[str, Any]) -> dict[str, Any]:
+        """OllamaのネイティブAPIの応答をOpenAI互換の形式に変換"""
+        self._record_ollama_stats(response)
+        return {
+            "choices": [{"message": response.get("message", {})}],
+            "usage": {
+                "prompt_tokens": response.get("prompt_eval_count", 0),
+                "completion_tokens": response.get("eval_count", 0),
+            },
+        }
+
+    def _record_ollama_stats(self, response: dict[str, Any]) -> None:
+        """
+        Ollamaが返す処理時間をメトリクスに記録
+
+        KVキャッシュが再利用されるとprompt_eval(prefill)のトークン数・時間が減り、
+        モデルがメモリに残っていればloadの時間はほぼ0になる
+        """
+        metrics.observe(
+            "llm.ollama.prompt_eval_tokens", response.get("prompt_eval_count", 0)
+        )
+        for name in ("prompt_eval", "load", "eval"):
+            # 時間はナノ秒単位
+            metrics.observe(
+                f"llm.ollama.{name}_ms", response.get(f"{name}_duration", 0) / 1e6
+            )
+
     def _validate_response(self, response: dict[str, Any]) -> dict[str, Any]:
         """
         LLMレスポンスの検証
@@ -178,51 +553,91 @@ class LLMClient:
         content: str = response["choices"][0]["message"]["content"]
         return content.strip()
 
-    async def check_health(self) -> bool:
+    def start_health_monitor(self) -> None:
         """
-        LLM接続の健全性をチェック
+        死活確認を定期的に実行するバックグラウンドタスクを開始(アプリ起動時)
 
-        Returns:
-            接続可能かどうか
+        ヘルスチェックAPIはこの結果を返すため、リクエストを待たせずに済む
         """
-        try:
-            test_messages = [{"role": "user", "content": "Hello"}]
+        if self._health_monitor is None and settings.LLM_HEALTH_REFRESH_INTERVAL > 0:
+            self._health_monitor = asyncio.create_task(self._monitor_health())
 
-            logger.debug(
-                f"LLM health check - URL: {self.base_url}, Model: {self.model_name}"
-            )
+    def cached_health(self) -> bool | None:
+        """直近の死活確認の結果(未確認ならNone、期限切れでも返す)"""
+        return self._health[1] if self._health is not None else None
 
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json={
-                        "model": self.model_name,
-                        "messages": test_messages,
-                        "max_tokens": 5,
-                    },
-                    headers={"Content-Type": "application/json"},
-                )
+    async def check_health(self) -> bool:
+        """
+        LLM接続の健全性をチェック
 
-                logger.info(
-                    f"LLM health check response - Status: {response.status_code}, "
-                    f"Headers: {dict(response.headers)}"
-                )
+        推論は行わず、モデル一覧(GET /models、OllamaのネイティブAPIでは/api/tags)の
+        取得で各バックエンドの死活を確認する。
+        結果はLLM_HEALTH_CACHE_TTL秒キャッシュし、期限切れの場合は前回の結果を
+        返しつつバックグラウンドで再確認する(初回のみ確認の完了を待つ)
 
-                if response.status_code != 200:
-                    logger.warning(
-                        f"LLM health check failed - Status: {response.status_code}, "
-                        f"Body: {response.text[:500]}"
-                    )
-                else:
-                    logger.info("LLM health check successful")
+        Returns:
+            1台以上のバックエンドに接続可能かどうか
+        """
+        if self._health is None:
+            return await self._refresh_health()
+
+        checked_at, healthy = self._health
+        if time.monotonic() - checked_at < settings.LLM_HEALTH_CACHE_TTL:
+            metrics.increment("llm_health.cache_hits")
+        elif self._health_refresh is None or self._health_refresh.done():
+            self._health_refresh = asyncio.create_task(self._refresh_health())
+        return healthy
+
+    async def _monitor_health(self) -> None:
+        """死活確認を一定間隔で繰り返す"""
+        while True:
+            await self._refresh_health()
+            await asyncio.sleep(settings.LLM_HEALTH_REFRESH_INTERVAL)
+
+    async def _refresh_health(self) -> bool:
+        """全バックエンドの死活を確認して結果をキャッシュ"""
+        results = await asyncio.gather(
+            *(self._probe_backend(backend) for backend in self.router.backends)
+        )
+        healthy = any(results)
+        self._health = (time.monotonic(), healthy)
+        metrics.increment("llm_health.probes")
+        metrics.set_gauge("llm_health.healthy", 1.0 if healthy else 0.0)
+        return healthy
 
-                return response.status_code == 200
+    async def _probe_backend(self, backend: LLMBackend) -> bool:
+        """
+        バックエンド1台の死活を確認
 
+        結果は死活状態にのみ使い、ブレーカーには記録しない(回復待ちのバックエンドを
+        閉じるのは振り分けた推論の成功だけ)。応答時間の統計も推論の所要時間なので
+        記録しない
+        """
+        try:
+            client = await self._get_client()
+            probe_url = (
+                f"{backend.native_url}/api/tags"
+                if self.ollama_native
+                else f"{backend.url}/models"
+            )
+            response = await client.get(
+                probe_url, timeout=settings.LLM_HEALTH_PROBE_TIMEOUT
+            )
+            healthy = response.status_code == 200
+            if not healthy:
+                logger.warning(
+                    f"LLM health probe failed - URL: {backend.url}, "
+                    f"Status: {response.status_code}, Body: {response.text[:500]}"
+                )
         except Exception as e:
-            logger.error(
-                f"LLM health check failed with exception: {type(e).__name__}: {e}"
+            logger.warning(
+                f"LLM health probe failed - URL: {backend.url}, {type(e).__name__}: {e}"
             )
-            return False
+            healthy = False
+
+        if not healthy:
+            metrics.increment(f"{backend.name}.probe_failures")
+        return healthy
 
 
 # グローバルクライアントインスタンス
@@ -0,0 +1,156 @@
+"""
+LLMバックエンドの振り分け
+複数のLocalAI/Ollamaに対し、処理中のリクエストが最も少ないバックエンドを選択する
+"""
+
+import time
+from collections.abc import Callable
+from typing import Any
+
+from app.core.circuit_breaker import OPEN, CircuitBreaker
+from app.core.config import settings
+from app.core.error_codes import LLM_CIRCUIT_OPEN
+from app.core.exceptions import LLMError
+from app.core.metrics import metrics
+
+# 応答時間の指数移動平均の重み(新しい観測値の割合)
+_LATENCY_ALPHA = 0.2
+
+
+class LLMBackend:
+    """
+    LLMバックエンド1台分の状態
+
+    サーキットブレーカーで失敗が続くバックエンドを振り分け対象から外し、
+    回復待ち時間の経過後は試験呼び出し(half_open)で復帰させる
+    """
+
+    def __init__(
+        self,
+        index: int,
+        url: str,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.url = url.rstrip("/")
+        self.name = f"llm_backend.{index}"
+        self.outstanding = 0
+        self.latency_ms: float | None = None
+        self.breaker = CircuitBreaker(
+            self.name,
+            failure_rate_threshold=settings.LLM_CIRCUIT_FAILURE_RATE,
+            window_size=settings.LLM_CIRCUIT_WINDOW_SIZE,
+            min_calls=settings.LLM_CIRCUIT_MIN_CALLS,
+            recovery_timeout=settings.LLM_CIRCUIT_RECOVERY_TIMEOUT,
+            clock=clock,
+        )
+
+    @property
+    def native_url(self) -> str:
+        """OpenAI互換APIのパス(/v1)を除いたURL(OllamaのネイティブAPI用)"""
+        return self.url.removesuffix("/v1")
+
+    def begin(self) -> float:
+        """リクエスト開始を記録し、開始時刻を返す"""
+        self.outstanding += 1
+        metrics.increment(f"{self.name}.requests")
+        metrics.set_gauge(f"{self.name}.outstanding", self.outstanding)
+        return time.perf_counter()
+
+    def end(self, started: float, success: bool) -> None:
+        """
+        リクエスト終了を記録
+
+        Args:
+            started: beginが返した開始時刻
+            success: バックエンドが正常に応答したか(サーバー障害・接続失敗はFalse)
+        """
+        self.outstanding -= 1
+        metrics.set_gauge(f"{self.name}.outstanding", self.outstanding)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe(f"{self.name}.latency_ms", elapsed_ms)
+        if success:
+            self.latency_ms = (
+                elapsed_ms
+                if self.latency_ms is None
+                else (1 - _LATENCY_ALPHA) * self.latency_ms
+                + _LATENCY_ALPHA * elapsed_ms
+            )
+            self.breaker.record_success()
+        else:
+            metrics.increment(f"{self.name}.errors")
+            self.breaker.record_failure()
+
+    def snapshot(self) -> dict[str, Any]:
+        """ヘルスチェック用の状態"""
+        return {
+            **self.breaker.snapshot(),
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "latency_ms": self.latency_ms,
+        }
+
+
+class LLMRouter:
+    """
+    LLMバックエンドの選択
+
+    ブレーカーがopenでないバックエンドのうち、処理中のリクエストが最も少ないものを
+    選ぶ(同数なら応答時間の移動平均が短いもの、未計測のものを優先)
+    """
+
+    def __init__(
+        self, urls: list[str], clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        if not urls:
+            raise ValueError("At least one LLM endpoint is required")
+        self.backends = [
+            LLMBackend(index, url, clock) for index, url in enumerate(urls)
+        ]
+
+    def select(self, exclude: set[str] | None = None) -> LLMBackend:
+        """
+        リクエストを送るバックエンドを選択
+
+        Args:
+            exclude: 避けたいバックエンドのURL(同じ呼び出しで失敗したもの)。
+                他に選べるバックエンドがなければ除外しない
+
+        Returns:
+            選択したバックエンド(呼び出し結果は必ずendで記録すること)
+
+        Raises:
+            LLMError: 全バックエンドのブレーカーがopenの場合(503)
+        """
+        available = [
+            backend for backend in self.backends if backend.breaker.state != OPEN
+        ]
+        preferred = [
+            backend for backend in available if backend.url not in (exclude or set())
+        ]
+
+        for backend in sorted(preferred or available, key=self._load):
+            # half_openでは試験呼び出しの枠が空いているものだけが許可される
+            if backend.breaker.allow_request():
+                if len(self.backends) > 1:
+                    metrics.increment(f"{backend.name}.selected")
+                return backend
+
+        retry_after = min(backend.breaker.retry_after() for backend in self.backends)
+        raise LLMError(
+            message="LLMサービスが一時的に利用できません",
+            error_code=LLM_CIRCUIT_OPEN,
+            detail=f"{retry_after:.0f}秒後に再試行してください",
+            status_code=503,
+        )
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """バックエンドごとの状態"""
+        return {backend.name: backend.snapshot() for backend in self.backends}
+
+    @staticmethod
+    def _load(backend: LLMBackend) -> tuple[int, float]:
+        return (
+            backend.outstanding,
+            backend.latency_ms if backend.latency_ms is not None else 0.0,
+        )
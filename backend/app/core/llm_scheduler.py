@@ -0,0 +1,155 @@
+"""
+LLM呼び出しのスケジューラ
+同時実行数を制限し、空きを待つ呼び出しを優先度順に実行する
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from app.core.config import settings
+from app.core.error_codes import LLM_OVERLOADED
+from app.core.exceptions import LLMError
+from app.core.metrics import metrics
+
+# 優先度クラス(先頭ほど優先)
+INTERACTIVE = "interactive"  # 回答チェック・フィードバック(ユーザーが結果を待っている)
+NORMAL = "normal"  # テーブル・問題の生成
+BACKGROUND = "background"  # 問題プールの補充など、誰も待っていない事前生成
+
+PRIORITIES = (INTERACTIVE, NORMAL, BACKGROUND)
+
+# 現在の処理が行うLLM呼び出しの優先度(バックグラウンドタスクにも引き継がれる)
+_current_priority: ContextVar[str] = ContextVar("llm_priority", default=NORMAL)
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """ブロック内で行うLLM呼び出しの優先度を設定"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    """現在のLLM呼び出しの優先度"""
+    return _current_priority.get()
+
+
+class LLMScheduler:
+    """
+    優先度付きの同時実行制限
+
+    実行中の呼び出しがmax_concurrency件に達している間、新しい呼び出しは待ち行列に
+    入り、空きが出たら優先度の高い順(同じ優先度は到着順)に実行する。
+    優先度ごとの待ち行列がqueue_limitsの上限に達していれば待たずに拒否する
+    """
+
+    def __init__(self, max_concurrency: int, queue_limits: dict[str, int]) -> None:
+        """
+        Args:
+            max_concurrency: 同時に実行するLLM呼び出しの上限(0以下で無制限)
+            queue_limits: 優先度ごとの待ち行列の上限
+        """
+        self.max_concurrency = max_concurrency
+        self.queue_limits = queue_limits
+        self._active = 0
+        # (優先順位, 到着順, 優先度, 実行許可を受け取るFuture)
+        self._waiters: list[tuple[int, int, str, asyncio.Future[None]]] = []
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        self._sequence = itertools.count()
+        self._record_state()
+
+    @asynccontextmanager
+    async def slot(self, priority: str | None = None) -> AsyncIterator[None]:
+        """
+        実行枠を確保してブロックを実行
+
+        Args:
+            priority: 優先度(省略時はllm_priorityで設定された値)
+
+        Raises:
+            LLMError: 待ち行列が上限に達している場合(503)
+        """
+        priority = priority or current_priority()
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def snapshot(self) -> dict[str, int]:
+        """実行中・待機中の件数"""
+        return {"active": self._active, **self._queued}
+
+    async def _acquire(self, priority: str) -> None:
+        started = time.perf_counter()
+
+        if self.max_concurrency <= 0 or (
+            self._active < self.max_concurrency and not self._waiters
+        ):
+            self._active += 1
+        else:
+            if self._queued[priority] >= self.queue_limits.get(priority, 0):
+                metrics.increment("llm_scheduler.rejected")
+                metrics.increment(f"llm_scheduler.{priority}.rejected")
+                raise LLMError(
+                    message="LLMサービスが混雑しています",
+                    error_code=LLM_OVERLOADED,
+                    detail="しばらく待ってから再試行してください",
+                    status_code=503,
+                )
+
+            future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            entry = (PRIORITIES.index(priority), next(self._sequence), priority, future)
+            heapq.heappush(self._waiters, entry)
+            self._queued[priority] += 1
+            self._record_state()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # 実行枠を受け取った直後にキャンセルされたので次に譲る
+                    self._release()
+                elif entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._queued[priority] -= 1
+                    self._record_state()
+                raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("llm_scheduler.wait_ms", wait_ms)
+        metrics.observe(f"llm_scheduler.{priority}.wait_ms", wait_ms)
+        self._record_state()
+
+    def _release(self) -> None:
+        # 実行枠は減らさずに待機中の先頭へそのまま引き渡す
+        while self._waiters:
+            _, _, priority, future = heapq.heappop(self._waiters)
+            self._queued[priority] -= 1
+            if not future.done():
+                future.set_result(None)
+                self._record_state()
+                return
+        self._active -= 1
+        self._record_state()
+
+    def _record_state(self) -> None:
+        metrics.set_gauge("llm_scheduler.active", self._active)
+        metrics.set_gauge("llm_scheduler.queued", len(self._waiters))
+
+
+# グローバルLLMスケジューラインスタンス
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY * len(settings.get_llm_api_urls()),
+    queue_limits=settings.LLM_QUEUE_LIMITS,
+)
@@ -0,0 +1,77 @@
+"""
+プロセス内メトリクス
+カウンター・ゲージ・観測値(件数/合計/最大)を集計し、/api/metricsで公開する
+"""
+
+from collections import defaultdict
+from threading import Lock
+from typing import Any
+
+
+class Metrics:
+    """メトリクス集計クラス"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._observations: dict[str, dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1.0) -> None:
+        """カウンターを加算"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """ゲージに現在値を設定"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """観測値(待ち時間・レイテンシ等)を記録"""
+        with self._lock:
+            summary = self._observations.setdefault(
+                name, {"count": 0.0, "sum": 0.0, "max": 0.0}
+            )
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def counter(self, name: str) -> float:
+        """カウンターの現在値を取得"""
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def gauge(self, name: str) -> float | None:
+        """ゲージの現在値を取得"""
+        with self._lock:
+            return self._gauges.get(name)
+
+    def snapshot(self) -> dict[str, Any]:
+        """全メトリクスのスナップショットを取得"""
+        with self._lock:
+            observations = {
+                name: {
+                    **summary,
+                    "avg": summary["sum"] / summary["count"]
+                    if summary["count"]
+                    else 0.0,
+                }
+                for name, summary in self._observations.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "observations": observations,
+            }
+
+    def reset(self) -> None:
+        """全メトリクスを初期化(テスト用)"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+
+
+# グローバルメトリクスインスタンス
+metrics = Metrics()
@@ -0,0 +1,234 @@
+"""
+LLM応答キャッシュ
+(モデル, 温度, メッセージ)のハッシュをキーに、解析済みの応答をタスクごとのTTLで保持する
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.core.db import Database
+
+logger = logging.getLogger(__name__)
+
+_CREATE_TABLE_SQL = """
+CREATE SCHEMA IF NOT EXISTS app_system;
+
+CREATE TABLE IF NOT EXISTS app_system.llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    task VARCHAR(50) NOT NULL,
+    response JSONB NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS llm_cache_expires_idx
+ON app_system.llm_cache (expires_at);
+"""
+
+
+def cache_key(
+    task: str, model: str, temperature: float, messages: list[dict[str, str]]
+) -> str:
+    """応答キャッシュのキー(内容のハッシュ)を生成"""
+    digest = hashlib.sha256(
+        json.dumps(
+            {"model": model, "temperature": temperature, "messages": messages},
+            ensure_ascii=False,
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+    return f"{task}:{digest}"
+
+
+class ResponseCache:
+    """
+    2階層のLLM応答キャッシュ
+
+    - メモリ: 件数・バイト数の上限付きLRU。値はJSON文字列で保持し、取得のたびに
+      復元するため呼び出し元が書き換えてもキャッシュは変わらない
+    - Postgres(任意): app_system.llm_cacheに保存し、再起動後や他のワーカーと共有する
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        # キー -> (有効期限, JSON文字列)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self._db: Database | None = None
+
+    async def start(self, db: "Database") -> None:
+        """
+        Postgres階層を有効化(LLM_CACHE_PERSISTENTが有効な場合)
+
+        テーブルの作成に失敗した場合はメモリのみで動作する
+        """
+        if not settings.LLM_CACHE_PERSISTENT:
+            return
+
+        try:
+            await db.execute(_CREATE_TABLE_SQL)
+            await db.execute(
+                "DELETE FROM app_system.llm_cache WHERE expires_at < NOW()"
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache persistent tier disabled: {e}")
+            return
+
+        self._db = db
+        logger.info("LLM cache persistent tier enabled")
+
+    def stop(self) -> None:
+        """Postgres階層の利用を終了"""
+        self._db = None
+
+    async def get(self, key: str, task: str) -> Any | None:
+        """
+        キャッシュされた応答を取得
+
+        Returns:
+            応答(キャッシュミス・期限切れの場合はNone)
+        """
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            persisted = await self._get_persistent(key)
+            if persisted is not None:
+                # 他のワーカーが保存した応答を残りの有効期間だけメモリにも載せる
+                value, remaining = persisted
+                self._put_memory(key, value, remaining)
+
+        if value is None:
+            metrics.increment("llm_cache.misses")
+            metrics.increment(f"llm_cache.{task}.misses")
+        else:
+            metrics.increment("llm_cache.hits")
+            metrics.increment(f"llm_cache.{task}.hits")
+
+        hits = metrics.counter("llm_cache.hits")
+        metrics.set_gauge(
+            "llm_cache.hit_rate", hits / (hits + metrics.counter("llm_cache.misses"))
+        )
+        return json.loads(value) if value is not None else None
+
+    async def put(self, key: str, task: str, response: Any, ttl: float) -> None:
+        """
+        応答をキャッシュに格納
+
+        Args:
+            key: cache_keyで生成したキー
+            task: タスク種別
+            response: 解析済みの応答(JSONに変換できること)
+            ttl: 有効期間(秒)
+        """
+        value = json.dumps(response, ensure_ascii=False, default=str)
+        self._put_memory(key, value, ttl)
+
+        if self._db is not None:
+            try:
+                await self._db.execute(
+                    """
+                    INSERT INTO app_system.llm_cache
+                    (cache_key, task, response, expires_at)
+                    VALUES ($1, $2, $3, NOW() + make_interval(secs => $4))
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET response = EXCLUDED.response,
+                        expires_at = EXCLUDED.expires_at
+                    """,
+                    key,
+                    task,
+                    value,
+                    float(ttl),
+                )
+            except Exception as e:
+                logger.warning(f"Failed to persist LLM cache entry: {e}")
+
+    def clear(self) -> None:
+        """メモリ上のキャッシュを全て破棄"""
+        self._entries.clear()
+        self._bytes = 0
+        self._record_size()
+
+    def _get_memory(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            metrics.increment("llm_cache.expirations")
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, value: str, ttl: float) -> None:
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self._clock() + ttl, value)
+        self._bytes += size
+
+        # 最も長く使われていないエントリから追い出す
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            metrics.increment("llm_cache.evictions")
+
+        self._record_size()
+
+    async def _get_persistent(self, key: str) -> tuple[str, float] | None:
+        """Postgres階層から(JSON文字列, 残りの有効期間)を取得"""
+        assert self._db is not None
+        try:
+            rows = await self._db.execute_select(
+                """
+                SELECT response::text AS response,
+                       EXTRACT(EPOCH FROM expires_at - NOW())::float8 AS remaining
+                FROM app_system.llm_cache
+                WHERE cache_key = $1 AND expires_at > NOW()
+                """,
+                key,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to read LLM cache entry: {e}")
+            return None
+
+        if not rows:
+            return None
+        metrics.increment("llm_cache.persistent_hits")
+        return rows[0]["response"], rows[0]["remaining"]
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode())
+        self._record_size()
+
+    def _record_size(self) -> None:
+        metrics.set_gauge("llm_cache.entries", len(self._entries))
+        metrics.set_gauge("llm_cache.bytes", self._bytes)
+
+
+# グローバルLLM応答キャッシュインスタンス
+llm_response_cache = ResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,285 @@
+"""
+テーブル構造キャッシュ
+DDLイベントトリガーとLISTEN/NOTIFYで無効化し、複数ワーカー間で一貫性を保つ
+"""
+
+import asyncio
+import copy
+import itertools
+import logging
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from app.core.db import Database
+
+logger = logging.getLogger(__name__)
+
+# スキーマ変更を通知するチャネル名
+SCHEMA_CHANGE_CHANNEL = "app_schema_changed"
+
+# DDL発生時に変更されたスキーマ名をNOTIFYするイベントトリガー
+_INSTALL_EVENT_TRIGGER_SQL = f"""
+SELECT pg_advisory_xact_lock(hashtext('app_system.notify_schema_change'));
+
+CREATE SCHEMA IF NOT EXISTS app_system;
+
+CREATE OR REPLACE FUNCTION app_system.notify_schema_change()
+RETURNS event_trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_EVENT = 'sql_drop' THEN
+        FOR changed IN
+            SELECT DISTINCT COALESCE(
+                schema_name,
+                CASE WHEN object_type = 'schema' THEN object_name END
+            ) AS name
+            FROM pg_event_trigger_dropped_objects()
+        LOOP
+            IF changed.name IS NOT NULL THEN
+                PERFORM pg_notify('{SCHEMA_CHANGE_CHANNEL}', changed.name);
+            END IF;
+        END LOOP;
+    ELSE
+        FOR changed IN
+            SELECT DISTINCT COALESCE(
+                schema_name,
+                CASE WHEN object_type = 'schema' THEN object_identity END
+            ) AS name
+            FROM pg_event_trigger_ddl_commands()
+        LOOP
+            IF changed.name IS NOT NULL THEN
+                PERFORM pg_notify('{SCHEMA_CHANGE_CHANNEL}', changed.name);
+            END IF;
+        END LOOP;
+    END IF;
+END;
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_event_trigger WHERE evtname = 'app_schema_change_ddl'
+    ) THEN
+        CREATE EVENT TRIGGER app_schema_change_ddl ON ddl_command_end
+            EXECUTE FUNCTION app_system.notify_schema_change();
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_event_trigger WHERE evtname = 'app_schema_change_drop'
+    ) THEN
+        CREATE EVENT TRIGGER app_schema_change_drop ON sql_drop
+            EXECUTE FUNCTION app_system.notify_schema_change();
+    END IF;
+END;
+$$;
+"""
+
+
+class SchemaCache:
+    """
+    スキーマごとのテーブル構造キャッシュ
+
+    スキーマごとにバージョン番号を持ち、DDLの通知を受けるとバージョンごと
+    エントリを破棄する(削除されたスキーマの分が残り続けないようにするため)。
+    バージョンは全スキーマで共通の連番から払い出すため、破棄の前に取得を始めた
+    結果が格納されることはない。通知を受け取れない状態ではキャッシュを使わない
+    """
+
+    def __init__(self, require_listener: bool = True) -> None:
+        """
+        Args:
+            require_listener: DDL通知の購読中のみキャッシュを有効にするか
+        """
+        self.require_listener = require_listener
+        self._version_counter = itertools.count()
+        self._versions: dict[str, int] = {}
+        self._entries: dict[str, tuple[int, list[dict[str, Any]]]] = {}
+        self._connection: asyncpg.Connection | None = None
+        self._listening = False
+        self._reconnect_task: asyncio.Task[None] | None = None
+        self._invalidation_listeners: list[Callable[[str | None], None]] = []
+
+    @property
+    def enabled(self) -> bool:
+        """キャッシュが利用可能かどうか"""
+        if not settings.SCHEMA_CACHE_ENABLED:
+            return False
+        return self._listening or not self.require_listener
+
+    def version(self, schema: str) -> int:
+        """スキーマの現在のバージョンを取得"""
+        if schema not in self._versions:
+            self._versions[schema] = next(self._version_counter)
+        return self._versions[schema]
+
+    def get(self, schema: str) -> list[dict[str, Any]] | None:
+        """
+        キャッシュされたテーブル構造を取得
+
+        Returns:
+            テーブル構造(キャッシュミス時はNone)
+        """
+        entry = self._entries.get(schema) if self.enabled else None
+        if entry is None or entry[0] != self._versions.get(schema):
+            metrics.increment("schema_cache.misses")
+            return None
+
+        metrics.increment("schema_cache.hits")
+        return copy.deepcopy(entry[1])
+
+    def put(self, schema: str, version: int, schemas: list[dict[str, Any]]) -> None:
+        """
+        テーブル構造をキャッシュに格納
+
+        取得中にDDLが発生してバージョンが進んでいた場合は格納しない
+
+        Args:
+            schema: スキーマ名
+            version: 取得開始時点のバージョン
+            schemas: テーブル構造
+        """
+        if not self.enabled or version != self._versions.get(schema):
+            return
+
+        self._entries[schema] = (version, copy.deepcopy(schemas))
+        metrics.set_gauge("schema_cache.entries", len(self._entries))
+
+    def add_invalidation_listener(self, listener: Callable[[str | None], None]) -> None:
+        """
+        スキーマ変更時に呼ばれる関数を登録
+
+        テーブル構造に依存する他のキャッシュ(問題プール等)の無効化に使う。
+        引数は変更されたスキーマ名(全スキーマの場合はNone)
+        """
+        self._invalidation_listeners.append(listener)
+
+    def invalidate(self, schema: str | None = None) -> None:
+        """
+        キャッシュを無効化
+
+        Args:
+            schema: 対象スキーマ(省略時は全スキーマ)
+        """
+        for listener in self._invalidation_listeners:
+            try:
+                listener(schema)
+            except Exception as e:
+                logger.warning(f"Schema invalidation listener failed: {e}")
+
+        if schema is None:
+            self._versions.clear()
+            self._entries.clear()
+        else:
+            self._versions.pop(schema, None)
+            self._entries.pop(schema, None)
+
+        metrics.increment("schema_cache.invalidations")
+        metrics.set_gauge("schema_cache.entries", len(self._entries))
+
+    async def start(self, db: "Database") -> None:
+        """
+        イベントトリガーを設置し、スキーマ変更通知の購読を開始
+
+        設置や購読に失敗した場合はキャッシュを無効のまま起動する
+        """
+        if not settings.SCHEMA_CACHE_ENABLED:
+            return
+
+        try:
+            await db.execute(_INSTALL_EVENT_TRIGGER_SQL)
+        except Exception as e:
+            logger.warning(f"Schema cache disabled: failed to install trigger: {e}")
+            return
+
+        try:
+            await self._listen()
+        except Exception as e:
+            logger.warning(f"Schema cache disabled: failed to LISTEN: {e}")
+            await self.stop()
+            return
+
+        logger.info("Schema cache listening for DDL notifications")
+
+    async def stop(self) -> None:
+        """スキーマ変更通知の購読を終了"""
+        self._listening = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+            self._reconnect_task = None
+        self.invalidate()
+
+        if self._connection is not None:
+            # 自分で閉じた接続は再接続しない
+            self._connection.remove_termination_listener(self._on_termination)
+            try:
+                await self._connection.close()
+            except Exception as e:
+                logger.warning(f"Failed to close schema cache listener: {e}")
+            self._connection = None
+
+    async def _listen(self) -> None:
+        """購読用の接続を開いてスキーマ変更通知のLISTENを開始"""
+        connection = await asyncpg.connect(settings.DATABASE_URL)
+        try:
+            await connection.add_listener(SCHEMA_CHANGE_CHANNEL, self._on_notification)
+        except Exception:
+            await connection.close()
+            raise
+
+        connection.add_termination_listener(self._on_termination)
+        self._connection = connection
+        self._listening = True
+
+    async def _reconnect(self) -> None:
+        """購読用の接続を指数バックオフで張り直す"""
+        delay = settings.SCHEMA_CACHE_RECONNECT_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.warning(f"Schema cache listener reconnect failed: {e}")
+                delay = min(delay * 2, settings.SCHEMA_CACHE_RECONNECT_MAX_DELAY)
+                continue
+
+            # 切断中に取りこぼした通知の分を無効化してから再開する
+            self.invalidate()
+            metrics.increment("schema_cache.reconnects")
+            logger.info("Schema cache listener reconnected")
+            return
+
+    def _on_notification(
+        self,
+        _connection: asyncpg.Connection,
+        _pid: int,
+        _channel: str,
+        payload: str,
+    ) -> None:
+        """スキーマ変更通知を受けたら該当スキーマを無効化"""
+        logger.debug(f"Schema changed: {payload}")
+        self.invalidate(payload)
+
+    def _on_termination(self, _connection: asyncpg.Connection) -> None:
+        """
+        購読用接続が切れたら通知を取りこぼすためキャッシュを停止し、
+        バックグラウンドで再接続する
+        """
+        logger.warning("Schema cache listener connection lost; reconnecting")
+        self._listening = False
+        self._connection = None
+        self.invalidate()
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+
+# グローバルスキーマキャッシュインスタンス
+schema_cache = SchemaCache()
@@ -0,0 +1,67 @@
+"""
+学習セッション管理
+セッションIDごとに専用のPostgreSQLスキーマを割り当てる
+"""
+
+import hashlib
+import re
+
+from fastapi import Header
+
+from app.core.error_codes import VALIDATION_INVALID_SESSION
+from app.core.exceptions import ValidationError
+
+# セッションIDを受け取るHTTPヘッダー名
+SESSION_HEADER = "X-Session-ID"
+
+# ヘッダー未指定時に使用するセッションID
+DEFAULT_SESSION_ID = "default"
+
+# セッションスキーマ名のプレフィックス
+SESSION_SCHEMA_PREFIX = "sess_"
+
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def session_schema_name(session_id: str) -> str:
+    """
+    セッションIDから専用スキーマ名を生成
+
+    任意のセッションIDをハッシュ化するため、識別子として常に安全で
+    PostgreSQLの識別子長制限(63バイト)にも収まる
+
+    Args:
+        session_id: セッションID
+
+    Returns:
+        スキーマ名
+    """
+    digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:24]
+    return f"{SESSION_SCHEMA_PREFIX}{digest}"
+
+
+def quote_ident(identifier: str) -> str:
+    """PostgreSQL識別子をダブルクォートでエスケープ"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+async def get_session_id(
+    x_session_id: str | None = Header(None, alias=SESSION_HEADER),
+) -> str:
+    """
+    リクエストヘッダーからセッションIDを取得
+
+    Raises:
+        ValidationError: セッションIDの形式が不正な場合
+    """
+    if not x_session_id:
+        return DEFAULT_SESSION_ID
+
+    if not _SESSION_ID_PATTERN.match(x_session_id):
+        raise ValidationError(
+            message="セッションIDが不正です",
+            error_code=VALIDATION_INVALID_SESSION,
+            detail="英数字・ハイフン・アンダースコアの1-128文字で指定してください",
+        )
+
+    return x_session_id
@@ -0,0 +1,73 @@
+"""
+同一リクエストの合流(singleflight)
+同じキーの処理が実行中であれば新たに実行せず、その結果を共有する
+"""
+
+import asyncio
+import copy
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    実行中の同一キーの処理を1回にまとめるクラス
+
+    処理は独立したタスクとして実行し、各呼び出し元はその完了を待つ。
+    呼び出し元の1人がキャンセルされても他の呼び出し元には影響せず、
+    全員がキャンセルされた場合のみ処理自体をキャンセルする
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: dict[str, asyncio.Task[Any]] = {}
+        self._waiters: dict[str, int] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        keyの処理を実行(実行中であれば合流)して結果を返す
+
+        Args:
+            key: 同一性を判定するキー
+            fn: 実行する処理
+
+        Returns:
+            処理結果(呼び出し元ごとに複製した値)
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _task: self._forget(key, _task))
+            metrics.increment(f"{self.name}.singleflight.leaders")
+        else:
+            metrics.increment(f"{self.name}.singleflight.shared")
+
+        self._waiters[key] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # 完了前であればキーの登録はまだ残っている
+            if not task.done():
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    task.cancel()
+            raise
+
+        # 呼び出し元が結果を書き換えても他の呼び出し元に影響しないよう複製する
+        return copy.deepcopy(result)
+
+    def in_flight(self) -> int:
+        """実行中の処理数"""
+        return len(self._calls)
+
+    def _forget(self, key: str, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
@@ -0,0 +1,20 @@
+"""
+トークン数の見積もり
+トークナイザーはモデルごとに異なるため、文字種から概算する
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算
+
+    英数字・記号はおおよそ4文字で1トークン、日本語などの非ASCII文字は
+    1文字1トークンとして数える(多くのモデルで実際より多めになる)
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def estimate_message_tokens(messages: list[dict[str, str]]) -> int:
+    """チャットメッセージ全体のトークン数を概算"""
+    return sum(estimate_tokens(message["content"]) for message in messages)
@@ -7,16 +7,27 @@ from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from datetime import UTC, datetime
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app import __version__
-from app.api import check_answer, create_tables, generate_problem, table_schemas
+from app.api import (
+    check_answer,
+    create_tables,
+    generate_problem,
+    session,
+    table_schemas,
+)
 from app.core.config import settings
 from app.core.error_response import ErrorResponseBuilder
 from app.core.exceptions import AppException
-from app.schemas import HealthResponse
+from app.core.llm_client import llm_client
+from app.core.metrics import metrics
+from app.core.response_cache import llm_response_cache
+from app.core.schema_cache import schema_cache
+from app.schemas import HealthResponse, MetricsResponse, ProbeResponse
+from app.services.problem_pool import problem_pool
 
 # ロガー設定
 logging.basicConfig(
@@ -38,9 +49,23 @@ async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
     await db.connect()
     logger.info("Database connected")
 
+    # テーブル構造キャッシュ(DDL通知の購読)
+    await schema_cache.start(db)
+
+    # LLM HTTPクライアント(接続プールをプロセス全体で共有)と定期的な死活確認
+    await llm_client.start()
+    llm_client.start_health_monitor()
+
+    # LLM応答キャッシュ(Postgres階層)
+    await llm_response_cache.start(db)
+
     yield
 
     # 終了時処理
+    await problem_pool.stop()
+    llm_response_cache.stop()
+    await llm_client.close()
+    await schema_cache.stop()
     await db.disconnect()
     logger.info("Database disconnected")
     logger.info("Shutting down application")
@@ -104,7 +129,7 @@ async def health_check() -> HealthResponse:
     # データベース接続チェック
     db_healthy = await db.check_health()
 
-    # LLM接続チェック
+    # LLM接続チェック(キャッシュした死活確認の結果、推論は行わない)
     try:
         llm_service = await get_llm()
         llm_healthy = await llm_service.check_health()
@@ -120,11 +145,48 @@ async def health_check() -> HealthResponse:
             "database": db_healthy,
             "llm": llm_healthy,
         },
+        circuit_breakers=llm_client.router.snapshot(),
+    )
+
+
+# 死活監視エンドポイント(オーケストレーション用、LLMの推論は行わない)
+@app.get("/api/health/live", response_model=ProbeResponse)
+async def liveness() -> ProbeResponse:
+    """プロセスが応答できるか(依存サービスは確認しない)"""
+    return ProbeResponse(status="alive")
+
+
+@app.get("/api/health/ready", response_model=ProbeResponse)
+async def readiness(response: Response) -> ProbeResponse:
+    """
+    リクエストを受け付けられるか
+
+    データベースに接続できなければ503。LLMはバックグラウンドで確認した直近の
+    結果を返すのみで、LLMの障害では503にしない(LLM呼び出しはサーキット
+    ブレーカーが個別に失敗させる)
+    """
+    from app.core.db import db
+
+    db_healthy = await db.check_health()
+    if not db_healthy:
+        response.status_code = 503
+
+    return ProbeResponse(
+        status="ready" if db_healthy else "not_ready",
+        services={"database": db_healthy, "llm": llm_client.cached_health()},
     )
 
 
+# メトリクスエンドポイント
+@app.get("/api/metrics", response_model=MetricsResponse)
+async def get_metrics() -> MetricsResponse:
+    """プロセス内メトリクスを取得"""
+    return MetricsResponse(**metrics.snapshot())
+
+
 # APIルーター登録
 app.include_router(create_tables.router, prefix="/api", tags=["tables"])
 app.include_router(generate_problem.router, prefix="/api", tags=["problems"])
 app.include_router(check_answer.router, prefix="/api", tags=["answers"])
 app.include_router(table_schemas.router, prefix="/api", tags=["schemas"])
+app.include_router(session.router, prefix="/api", tags=["session"])
@@ -76,6 +76,28 @@ class HealthResponse(BaseModel):
     timestamp: datetime = Field(..., description="レスポンス時刻")
     version: str = Field(..., description="APIバージョン")
     services: dict[str, bool] = Field(..., description="依存サービスの状態")
+    circuit_breakers: dict[str, dict[str, Any]] = Field(
+        default_factory=dict, description="サーキットブレーカーの状態"
+    )
+
+
+class ProbeResponse(BaseModel):
+    """死活監視(liveness/readiness)レスポンス"""
+
+    status: str = Field(..., description="alive / ready / not_ready")
+    services: dict[str, bool | None] = Field(
+        default_factory=dict, description="依存サービスの状態(LLMは直近の確認結果)"
+    )
+
+
+class MetricsResponse(BaseModel):
+    """メトリクスレスポンス"""
+
+    counters: dict[str, float] = Field(..., description="累積カウンター")
+    gauges: dict[str, float] = Field(..., description="現在値")
+    observations: dict[str, dict[str, float]] = Field(
+        ..., description="観測値の集計(count/sum/max/avg)"
+    )
 
 
 class ErrorResponse(BaseModel):
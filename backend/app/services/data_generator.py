@@ -0,0 +1,211 @@
+"""
+大規模データ生成
+LLMが出力した値の分布定義から、generate_seriesを使うINSERT ... SELECT文を組み立てる
+"""
+
+from typing import Any
+
+from app.core.session import quote_ident
+
+# 値の生成方法ごとの必須パラメータ
+COLUMN_KINDS: dict[str, tuple[str, ...]] = {
+    "sequence": (),
+    "int_range": ("min", "max"),
+    "numeric_range": ("min", "max"),
+    "date_range": ("start", "end"),
+    "timestamp_range": ("start", "end"),
+    "choice": ("values",),
+    "text_pattern": ("prefix",),
+    "bool": (),
+    "fk": ("ref_table",),
+}
+
+
+class _Params:
+    """プレースホルダ($n)と引数の管理(引数はすべて文字列で渡しSQL側でキャスト)"""
+
+    def __init__(self) -> None:
+        self.args: list[Any] = []
+
+    def add(self, value: Any, cast: str) -> str:
+        if isinstance(value, list):
+            self.args.append([str(item) for item in value])
+        else:
+            self.args.append(str(value))
+        return f"${len(self.args)}::{cast}"
+
+
+def _choice_cast(values: list[Any], pg_type: str | None) -> str:
+    """
+    選択肢の配列の型を決める
+
+    textからdate・uuid・列挙型などへは代入時に暗黙変換されないため、
+    挿入先カラムの型が分かればその型の配列に明示的にキャストする
+    """
+    if pg_type:
+        return f"text[]::{pg_type}[]"
+    if all(isinstance(value, bool) for value in values):
+        return "text[]::boolean[]"
+    if all(
+        isinstance(value, int | float) and not isinstance(value, bool)
+        for value in values
+    ):
+        return "text[]::numeric[]"
+    return "text[]"
+
+
+def _column_expression(
+    column: dict[str, Any],
+    params: _Params,
+    joins: list[str],
+    pg_type: str | None = None,
+) -> str:
+    """
+    1カラム分の値を生成するSQL式を組み立てる
+
+    Args:
+        column: 生成方法の定義
+        params: プレースホルダと引数
+        joins: 参照先テーブルの結合句(fkで追加される)
+        pg_type: 挿入先カラムの型名(format_type(atttypid, NULL)、不明ならNone)
+    """
+    kind = column.get("kind")
+    if kind not in COLUMN_KINDS:
+        raise ValueError(f"未対応の生成方法です: {kind}")
+    missing = [key for key in COLUMN_KINDS[kind] if column.get(key) is None]
+    if missing:
+        raise ValueError(f"{kind} に必要なパラメータがありません: {missing}")
+
+    if kind == "sequence":
+        start = params.add(column.get("start", 1), "text::bigint")
+        expression = f"({start} + g.i - 1)"
+    elif kind == "int_range":
+        low = params.add(column["min"], "text::bigint")
+        high = params.add(column["max"], "text::bigint")
+        expression = f"floor(random() * ({high} - {low} + 1) + {low})::bigint"
+    elif kind == "numeric_range":
+        low = params.add(column["min"], "text::numeric")
+        high = params.add(column["max"], "text::numeric")
+        scale = params.add(column.get("scale", 2), "text::int")
+        expression = f"round((random() * ({high} - {low}) + {low})::numeric, {scale})"
+    elif kind == "date_range":
+        start = params.add(column["start"], "text::date")
+        end = params.add(column["end"], "text::date")
+        expression = f"({start} + floor(random() * ({end} - {start} + 1))::int)"
+    elif kind == "timestamp_range":
+        start = params.add(column["start"], "text::timestamp")
+        end = params.add(column["end"], "text::timestamp")
+        expression = f"({start} + random() * ({end} - {start}))"
+    elif kind == "choice":
+        values = column["values"]
+        if not isinstance(values, list) or not values:
+            raise ValueError("choice の values は空でない配列である必要があります")
+        array = params.add(values, _choice_cast(values, pg_type))
+        expression = f"({array})[1 + floor(random() * cardinality({array}))::int]"
+    elif kind == "text_pattern":
+        prefix = params.add(column["prefix"], "text")
+        suffix = params.add(column.get("suffix", ""), "text")
+        expression = f"({prefix} || g.i || {suffix})"
+    elif kind == "bool":
+        probability = params.add(column.get("probability", 0.5), "text::float8")
+        expression = f"(random() < {probability})"
+    else:
+        # 参照先テーブルの実在するキーから選ぶため参照整合性が保たれる
+        alias = f"ref_{len(joins)}"
+        ref_table = quote_ident(column["ref_table"])
+        ref_column = quote_ident(column.get("ref_column", "id"))
+        joins.append(
+            f"CROSS JOIN (SELECT array_agg({ref_column}) AS ids FROM {ref_table}) "
+            f"AS {alias}"
+        )
+        expression = f"{alias}.ids[1 + floor(random() * cardinality({alias}.ids))::int]"
+
+    null_ratio = column.get("null_ratio")
+    if null_ratio:
+        ratio = params.add(null_ratio, "text::float8")
+        expression = f"CASE WHEN random() < {ratio} THEN NULL ELSE {expression} END"
+
+    return expression
+
+
+def _order_by_dependencies(tables: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """外部キーの参照先テーブルが先に生成されるよう並べ替える"""
+    by_name = {table["table"]: table for table in tables}
+    ordered: list[dict[str, Any]] = []
+    visiting: set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in visiting or any(t["table"] == name for t in ordered):
+            return
+        visiting.add(name)
+        for column in by_name[name].get("columns", {}).values():
+            ref = column.get("ref_table") if column.get("kind") == "fk" else None
+            if ref in by_name and ref != name:
+                visit(ref)
+        visiting.discard(name)
+        ordered.append(by_name[name])
+
+    for table in tables:
+        visit(table["table"])
+    return ordered
+
+
+def build_generation_statements(
+    data_spec: dict[str, Any],
+    max_rows: int,
+    column_types: dict[str, dict[str, str]] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    値の分布定義からデータ生成用のINSERT ... SELECT文を組み立てる
+
+    Args:
+        data_spec: {"tables": [{"table": str, "rows": int,
+                    "columns": {カラム名: {"kind": str, ...}}}]}
+        max_rows: 1テーブルあたりの最大行数
+        column_types: {テーブル名: {カラム名: 型名}}(作成済みテーブルの型)
+
+    Returns:
+        [{"table": str, "rows": int, "sql": str, "args": list}]
+        外部キーの参照先が先になる順序
+
+    Raises:
+        ValueError: 定義が不正な場合
+    """
+    tables = data_spec.get("tables")
+    if not isinstance(tables, list) or not tables:
+        raise ValueError("data_spec.tables は空でない配列である必要があります")
+
+    for table in tables:
+        if not isinstance(table, dict) or not table.get("table"):
+            raise ValueError("各テーブル定義には table が必要です")
+        if not isinstance(table.get("columns"), dict) or not table["columns"]:
+            raise ValueError(f"{table['table']} の columns が空です")
+
+    statements = []
+    for table in _order_by_dependencies(tables):
+        rows = min(max(int(table.get("rows", 1)), 1), max_rows)
+        params = _Params()
+        joins: list[str] = []
+
+        types = (column_types or {}).get(table["table"], {})
+
+        columns = []
+        expressions = []
+        for name, column in table["columns"].items():
+            columns.append(quote_ident(name))
+            expressions.append(
+                _column_expression(column, params, joins, types.get(name))
+            )
+
+        row_count = params.add(rows, "text::int")
+        sql = (
+            f"INSERT INTO {quote_ident(table['table'])} ({', '.join(columns)}) "
+            f"SELECT {', '.join(expressions)} "
+            f"FROM generate_series(1, {row_count}) AS g(i) {' '.join(joins)}"
+        ).rstrip()
+
+        statements.append(
+            {"table": table["table"], "rows": rows, "sql": sql, "args": params.args}
+        )
+
+    return statements
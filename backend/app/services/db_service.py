@@ -4,11 +4,15 @@
 
 import json
 import logging
+import time
 from typing import Any
 
+from app.core.config import settings
 from app.core.db import Database
 from app.core.error_codes import DB_EXECUTION_ERROR, DB_SCHEMA_ERROR
 from app.core.exceptions import DatabaseError
+from app.core.schema_cache import schema_cache
+from app.services.data_generator import build_generation_statements
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +20,14 @@ logger = logging.getLogger(__name__)
 class DatabaseService:
     """データベース操作サービスクラス"""
 
-    def __init__(self, db: Database) -> None:
+    def __init__(self, db: Database, schema: str = "public") -> None:
+        """
+        Args:
+            db: データベース接続管理インスタンス
+            schema: 学習用テーブルを配置するスキーマ(セッションスキーマ)
+        """
         self.db = db
+        self.schema = schema
 
     async def initialize_system_schema(self) -> None:
         """
@@ -46,6 +56,32 @@ class DatabaseService:
                 )
             """)
 
+            # 問題がどのセッションスキーマに属するかを記録
+            await self.db.execute("""
+                ALTER TABLE app_system.problems
+                ADD COLUMN IF NOT EXISTS schema_name VARCHAR(63)
+            """)
+
+            # 実行に成功したテーマ(DDL・データ・説明)のライブラリ
+            await self.db.execute("""
+                CREATE TABLE IF NOT EXISTS app_system.themes (
+                    id SERIAL PRIMARY KEY,
+                    theme_key TEXT NOT NULL,
+                    data_mode VARCHAR(20) NOT NULL,
+                    theme VARCHAR(255) NOT NULL,
+                    description TEXT,
+                    sql_statements JSONB NOT NULL,
+                    data_spec JSONB,
+                    use_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    last_used_at TIMESTAMP WITH TIME ZONE
+                )
+            """)
+            await self.db.execute("""
+                CREATE INDEX IF NOT EXISTS themes_key_idx
+                ON app_system.themes (data_mode, theme_key)
+            """)
+
             logger.info("System schema initialized successfully")
 
         except Exception as e:
@@ -56,166 +92,291 @@ class DatabaseService:
                 detail=str(e),
             ) from None
 
-    async def drop_all_user_tables(self) -> None:
+    async def drop_session_schema(self) -> None:
         """
-        publicスキーマのユーザーテーブルを全削除
+        セッションスキーマと、そのセッションの問題を削除
 
         Raises:
             DatabaseError: 削除失敗時
         """
         try:
-            # publicスキーマのテーブル一覧を取得
-            tables = await self.db.execute_select("""
-                SELECT table_name
-                FROM information_schema.tables
-                WHERE table_schema = 'public'
-                AND table_type = 'BASE TABLE'
-            """)
+            await self.db.drop_schema(self.schema)
+            schema_cache.invalidate(self.schema)
+            await self.db.execute(
+                """
+                DELETE FROM app_system.problems
+                WHERE schema_name = $1
+            """,
+                self.schema,
+            )
+            logger.info(f"Dropped session schema: {self.schema}")
 
-            if tables:
-                table_names = [table["table_name"] for table in tables]
+        except Exception as e:
+            logger.error(f"Failed to drop session schema {self.schema}: {e}")
+            raise DatabaseError(
+                message="セッションスキーマの削除に失敗しました",
+                error_code=DB_EXECUTION_ERROR,
+                detail=str(e),
+            ) from None
 
-                # CASCADEで全削除
-                for table_name in table_names:
-                    await self.db.execute(
-                        f'DROP TABLE IF EXISTS "{table_name}" CASCADE'
-                    )
+    async def reset_session_schema(self) -> None:
+        """
+        セッションスキーマを空の状態にリセット(未作成の場合は作成)
 
-                logger.info(f"Dropped {len(table_names)} user tables: {table_names}")
+        Raises:
+            DatabaseError: リセット失敗時
+        """
+        try:
+            await self.db.reset_schema(self.schema)
+            schema_cache.invalidate(self.schema)
+            logger.info(f"Session schema reset: {self.schema}")
 
         except Exception as e:
-            logger.error(f"Failed to drop user tables: {e}")
+            logger.error(f"Failed to reset session schema {self.schema}: {e}")
             raise DatabaseError(
                 message="ユーザーテーブルの削除に失敗しました",
                 error_code=DB_EXECUTION_ERROR,
                 detail=str(e),
             ) from None
 
-    async def execute_sql_statements(self, sql_statements: list[str]) -> None:
+    async def execute_sql_statements(
+        self, sql_statements: list[str], bulk_load: bool = True
+    ) -> dict[str, int]:
         """
-        SQL文を順次実行
+        SQL文を1つのトランザクションでまとめて実行
+
+        途中の文が失敗した場合は全体がロールバックされ、作りかけの状態は残らない
 
         Args:
             sql_statements: 実行するSQL文のリスト
+            bulk_load: INSERT文をCOPYに変換して投入するか
+
+        Returns:
+            ロード統計
 
         Raises:
-            DatabaseError: 実行失敗時
+            DatabaseError: 実行失敗時(dataに失敗した文の位置を含む)
         """
         try:
-            for sql in sql_statements:
-                if sql.strip():
-                    await self.db.execute(sql)
+            stats = await self.db.execute_batch(
+                sql_statements, schema=self.schema, bulk_load=bulk_load
+            )
 
-            logger.info(f"Executed {len(sql_statements)} SQL statements")
+            # イベントトリガーの通知を待たずに自ワーカーのキャッシュを破棄
+            schema_cache.invalidate(self.schema)
 
-        except Exception as e:
-            logger.error(f"Failed to execute SQL statements: {e}")
+            logger.info(f"Executed {len(sql_statements)} SQL statements: {stats}")
+            return stats
+
+        except DatabaseError as e:
+            logger.error(f"Failed to execute SQL statements: {e.detail}")
             raise DatabaseError(
                 message="SQL文の実行に失敗しました",
                 error_code=DB_EXECUTION_ERROR,
+                detail=e.detail,
+                data=e.data,
+            ) from None
+
+    async def generate_scaled_data(self, data_spec: dict[str, Any]) -> dict[str, Any]:
+        """
+        値の分布定義からサーバー側で大量のサンプルデータを生成
+
+        Args:
+            data_spec: LLMが出力した値の分布定義
+
+        Returns:
+            {"row_counts": {テーブル名: 行数}, "total_rows": int,
+             "load_time_ms": int}
+
+        Raises:
+            DatabaseError: 定義が不正な場合・生成失敗時
+        """
+        column_types = await self.db.get_column_types(self.schema)
+        try:
+            statements = build_generation_statements(
+                data_spec,
+                max_rows=settings.SCALED_DATA_MAX_ROWS,
+                column_types=column_types,
+            )
+        except (ValueError, TypeError) as e:
+            raise DatabaseError(
+                message="データ生成定義が不正です",
+                error_code=DB_EXECUTION_ERROR,
                 detail=str(e),
             ) from None
 
-    async def get_table_schemas(self) -> list[dict[str, Any]]:
+        started = time.perf_counter()
+        inserted = await self.db.execute_generation(
+            [(statement["sql"], statement["args"]) for statement in statements],
+            schema=self.schema,
+            command_timeout=settings.SCALED_DATA_LOAD_TIMEOUT,
+        )
+        load_time_ms = int((time.perf_counter() - started) * 1000)
+
+        row_counts = {
+            statement["table"]: rows
+            for statement, rows in zip(statements, inserted, strict=True)
+        }
+        logger.info(f"Generated scaled data in {load_time_ms}ms: {row_counts}")
+
+        return {
+            "row_counts": row_counts,
+            "total_rows": sum(row_counts.values()),
+            "load_time_ms": load_time_ms,
+        }
+
+    async def save_theme(
+        self,
+        theme_key: str,
+        data_mode: str,
+        table_info: dict[str, Any],
+    ) -> int:
         """
-        publicスキーマのテーブル構造を取得
+        実行に成功したテーマをライブラリに保存
+
+        Args:
+            theme_key: 正規化したプロンプト(プロンプトなしは空文字)
+            data_mode: "sample" または "scaled"
+            table_info: LLMが生成したテーブル情報(theme, description,
+                sql_statements, data_spec)
 
         Returns:
-            テーブル構造のリスト
+            テーマID
+
+        Raises:
+            DatabaseError: 保存失敗時
+        """
+        try:
+            data_spec = table_info.get("data_spec")
+            results = await self.db.execute_select(
+                """
+                INSERT INTO app_system.themes
+                (theme_key, data_mode, theme, description, sql_statements, data_spec)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                RETURNING id
+            """,
+                theme_key,
+                data_mode,
+                table_info.get("theme", "Unknown"),
+                table_info.get("description"),
+                json.dumps(table_info["sql_statements"], ensure_ascii=False),
+                json.dumps(data_spec, ensure_ascii=False) if data_spec else None,
+            )
+            theme_id: int = results[0]["id"]
+            logger.info(f"Saved theme to library with ID: {theme_id}")
+            return theme_id
+
+        except Exception as e:
+            logger.error(f"Failed to save theme: {e}")
+            raise DatabaseError(
+                message="テーマの保存に失敗しました",
+                error_code=DB_EXECUTION_ERROR,
+                detail=str(e),
+            ) from None
+
+    async def count_themes(self, theme_key: str, data_mode: str) -> int:
+        """
+        ライブラリ内の該当テーマ数を取得
+
+        theme_keyが空文字(プロンプトなし)の場合は0を返す。全テーマを数えると
+        autoの方針で件数の条件が常に満たされ、生成し直されなくなるため
 
         Raises:
             DatabaseError: 取得失敗時
         """
+        if not theme_key:
+            return 0
+
         try:
-            # テーブル一覧を取得
-            tables = await self.db.execute_select("""
-                SELECT table_name
-                FROM information_schema.tables
-                WHERE table_schema = 'public'
-                AND table_type = 'BASE TABLE'
-                ORDER BY table_name
-            """)
+            results = await self.db.execute_select(
+                """
+                SELECT count(*) AS count
+                FROM app_system.themes
+                WHERE data_mode = $1 AND theme_key = $2
+            """,
+                data_mode,
+                theme_key,
+            )
+            count: int = results[0]["count"]
+            return count
 
-            schemas = []
-            for table in tables:
-                table_name = table["table_name"]
-
-                # カラム情報を取得
-                columns = await self.db.execute_select(
-                    """
-                    SELECT
-                        column_name,
-                        data_type,
-                        is_nullable,
-                        column_default
-                    FROM information_schema.columns
-                    WHERE table_schema = 'public'
-                    AND table_name = $1
-                    ORDER BY ordinal_position
-                """,
-                    table_name,
-                )
+        except Exception as e:
+            logger.error(f"Failed to count themes: {e}")
+            raise DatabaseError(
+                message="テーマの取得に失敗しました",
+                error_code=DB_EXECUTION_ERROR,
+                detail=str(e),
+            ) from None
 
-                # 主キー情報を取得
-                primary_keys = await self.db.execute_select(
-                    """
-                    SELECT column_name
-                    FROM information_schema.key_column_usage kcu
-                    JOIN information_schema.table_constraints tc
-                        ON kcu.constraint_name = tc.constraint_name
-                    WHERE tc.table_schema = 'public'
-                    AND tc.table_name = $1
-                    AND tc.constraint_type = 'PRIMARY KEY'
-                """,
-                    table_name,
-                )
+    async def pick_theme(self, theme_key: str, data_mode: str) -> dict[str, Any] | None:
+        """
+        ライブラリから該当テーマを1件ランダムに選び、利用回数を更新
+
+        Args:
+            theme_key: 正規化したプロンプト(空文字の場合は全テーマから選ぶ)
+            data_mode: "sample" または "scaled"
+
+        Returns:
+            テーマ情報(該当なしの場合はNone)
 
-                pk_columns = {pk["column_name"] for pk in primary_keys}
-
-                # 外部キー情報を取得
-                foreign_keys = await self.db.execute_select(
-                    """
-                    SELECT
-                        kcu.column_name,
-                        ccu.table_name AS foreign_table_name,
-                        ccu.column_name AS foreign_column_name
-                    FROM information_schema.key_column_usage kcu
-                    JOIN information_schema.constraint_column_usage ccu
-                        ON kcu.constraint_name = ccu.constraint_name
-                    JOIN information_schema.table_constraints tc
-                        ON kcu.constraint_name = tc.constraint_name
-                    WHERE tc.table_schema = 'public'
-                    AND tc.table_name = $1
-                    AND tc.constraint_type = 'FOREIGN KEY'
-                """,
-                    table_name,
+        Raises:
+            DatabaseError: 取得失敗時
+        """
+        try:
+            results = await self.db.execute_select(
+                """
+                UPDATE app_system.themes
+                SET use_count = use_count + 1, last_used_at = NOW()
+                WHERE id = (
+                    SELECT id FROM app_system.themes
+                    WHERE data_mode = $1 AND ($2 = '' OR theme_key = $2)
+                    ORDER BY random()
+                    LIMIT 1
                 )
+                RETURNING id, theme, description, sql_statements, data_spec
+            """,
+                data_mode,
+                theme_key,
+            )
 
-                fk_dict = {
-                    fk["column_name"]: {
-                        "table": fk["foreign_table_name"],
-                        "column": fk["foreign_column_name"],
-                    }
-                    for fk in foreign_keys
-                }
+            if not results:
+                return None
+
+            theme = results[0]
+            for field in ("sql_statements", "data_spec"):
+                if isinstance(theme[field], str):
+                    theme[field] = json.loads(theme[field])
+
+            return theme
+
+        except Exception as e:
+            logger.error(f"Failed to pick theme: {e}")
+            raise DatabaseError(
+                message="テーマの取得に失敗しました",
+                error_code=DB_EXECUTION_ERROR,
+                detail=str(e),
+            ) from None
 
-                # カラム情報を整形
-                formatted_columns = []
-                for col in columns:
-                    column_info = {
-                        "name": col["column_name"],
-                        "type": col["data_type"].upper(),
-                        "nullable": col["is_nullable"] == "YES",
-                        "is_primary_key": col["column_name"] in pk_columns,
-                    }
+    async def get_table_schemas(self) -> list[dict[str, Any]]:
+        """
+        セッションスキーマのテーブル構造を取得
 
-                    if col["column_name"] in fk_dict:
-                        column_info["foreign_key"] = fk_dict[col["column_name"]]
+        DDLが発生するまではキャッシュから返す
 
-                    formatted_columns.append(column_info)
+        Returns:
+            テーブル構造のリスト
 
-                schemas.append({"table_name": table_name, "columns": formatted_columns})
+        Raises:
+            DatabaseError: 取得失敗時
+        """
+        try:
+            cached = schema_cache.get(self.schema)
+            if cached is not None:
+                return cached
 
+            version = schema_cache.version(self.schema)
+            schemas = await self.db.get_table_schemas(self.schema)
+            schema_cache.put(self.schema, version, schemas)
             return schemas
 
         except Exception as e:
@@ -227,28 +388,34 @@ class DatabaseService:
             ) from None
 
     async def execute_select_query(
-        self, sql: str, query_timeout: int = 5
-    ) -> list[dict[str, Any]]:
+        self, sql: str, query_timeout: float = 5, max_rows: int | None = None
+    ) -> tuple[list[dict[str, Any]], bool]:
         """
         SELECT文を実行して結果を取得
 
         Args:
             sql: 実行するSELECT文
             query_timeout: タイムアウト秒数
+            max_rows: 取得する最大行数(省略時はMAX_RESULT_ROWS)
 
         Returns:
-            クエリ結果
+            (クエリ結果, 最大行数で打ち切られたかどうか)
 
         Raises:
             DatabaseError: 実行失敗時
         """
         try:
-            # タイムアウト付きで実行
-            result = await self.db.execute_select(sql, query_timeout=query_timeout)
-
-            # すでに辞書形式なのでそのまま返す
-            return result
+            # タイムアウト付き・行数上限付きで実行
+            return await self.db.execute_bounded_select(
+                sql,
+                max_rows=max_rows or settings.MAX_RESULT_ROWS,
+                query_timeout=query_timeout,
+                schema=self.schema,
+            )
 
+        except DatabaseError:
+            # タイムアウト・構文エラー等のエラーコードを呼び出し元で区別できるよう維持
+            raise
         except Exception as e:
             logger.error(f"Failed to execute SELECT query: {e}")
             raise DatabaseError(
@@ -287,8 +454,9 @@ class DatabaseService:
             results = await self.db.execute_select(
                 """
                 INSERT INTO app_system.problems
-                (theme, difficulty, correct_sql, expected_result, table_schemas, hint)
-                VALUES ($1, $2, $3, $4, $5, $6)
+                (theme, difficulty, correct_sql, expected_result, table_schemas, hint,
+                 schema_name)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
                 RETURNING id
             """,
                 theme,
@@ -297,6 +465,7 @@ class DatabaseService:
                 json.dumps(expected_result, ensure_ascii=False),
                 json.dumps(table_schemas, ensure_ascii=False),
                 hint,
+                self.schema,
             )
 
             if not results:
@@ -319,7 +488,10 @@ class DatabaseService:
 
     async def get_problem(self, problem_id: int) -> dict[str, Any] | None:
         """
-        問題を取得
+        問題を取得(このセッションで作成された問題のみ)
+
+        セッションスキーマ導入前に保存された問題(schema_nameがNULL)は
+        全セッションで共有されていたため、どのセッションからも取得できる
 
         Args:
             problem_id: 問題ID
@@ -336,9 +508,10 @@ class DatabaseService:
                 SELECT id, theme, difficulty, correct_sql, expected_result,
                        table_schemas, hint, created_at
                 FROM app_system.problems
-                WHERE id = $1
+                WHERE id = $1 AND (schema_name = $2 OR schema_name IS NULL)
             """,
                 problem_id,
+                self.schema,
             )
 
             if not results:
@@ -3,14 +3,29 @@ LLM統合サービス
 LLMクライアントとプロンプト生成を組み合わせた高レベルサービス
 """
 
-import json
 import logging
-from typing import Any
-
-from app.core.error_codes import LLM_GENERATION_FAILED, LLM_INVALID_RESPONSE
+from collections.abc import AsyncGenerator, Callable
+from contextlib import aclosing
+from typing import Any, cast
+
+from app.core.config import settings
+from app.core.error_codes import (
+    LLM_CONNECTION,
+    LLM_GENERATION_FAILED,
+    LLM_INVALID_RESPONSE,
+    LLM_TIMEOUT,
+)
 from app.core.exceptions import LLMError
+from app.core.json_boundary import JsonBoundaryDetector
+from app.core.json_repair import extract_json_object
 from app.core.llm_client import LLMClient
+from app.core.llm_scheduler import INTERACTIVE, llm_priority
+from app.core.metrics import metrics
+from app.core.response_cache import cache_key, llm_response_cache
+from app.core.singleflight import SingleFlight
+from app.core.tokens import estimate_message_tokens, estimate_tokens
 from app.services.prompt_generator import PromptGenerator
+from app.services.response_schemas import get_response_schema
 
 logger = logging.getLogger(__name__)
 
@@ -41,15 +56,12 @@ class LLMService:
             # プロンプト生成
             messages = self.prompt_generator.create_table_generation_prompt(user_prompt)
 
-            # LLM呼び出し
-            response = await self.llm_client.chat_completion(messages)
-            content = self.llm_client.extract_content(response)
-
-            # JSON解析
-            result = self._parse_json_response(content)
-
-            # 結果検証
-            self._validate_table_generation_result(result)
+            # LLM呼び出しとJSON解析・結果検証
+            result = await self._complete_json(
+                messages,
+                task="generate_tables",
+                validate=self._validate_table_generation_result,
+            )
 
             # デバッグ: 生成されたSQL文をログ出力
             sql_statements = result.get("sql_statements", [])
@@ -68,8 +80,58 @@ class LLMService:
                 detail=str(e),
             ) from None
 
+    async def generate_scaled_tables(
+        self, target_rows: int, user_prompt: str | None = None
+    ) -> dict[str, Any]:
+        """
+        大規模データ用のテーブル定義と値の分布を生成
+
+        Args:
+            target_rows: 最も大きいテーブルの目標行数
+            user_prompt: ユーザーからの指示
+
+        Returns:
+            テーブル作成情報
+            {
+                "theme": str,
+                "description": str,
+                "sql_statements": List[str],
+                "data_spec": Dict
+            }
+        """
+        try:
+            # プロンプト生成
+            messages = self.prompt_generator.create_scaled_table_generation_prompt(
+                target_rows, user_prompt
+            )
+
+            # LLM呼び出しとJSON解析・結果検証
+            result = await self._complete_json(
+                messages,
+                task="generate_scaled_tables",
+                validate=self._validate_scaled_table_generation_result,
+            )
+
+            logger.info(
+                f"Generated scaled tables for theme: {result.get('theme', 'Unknown')}"
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"Scaled table generation failed: {e}")
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(
+                message="テーブル生成に失敗しました",
+                error_code=LLM_GENERATION_FAILED,
+                detail=str(e),
+            ) from None
+
     async def generate_problem(
-        self, table_schemas: list[dict[str, Any]], user_prompt: str | None = None
+        self,
+        table_schemas: list[dict[str, Any]],
+        user_prompt: str | None = None,
+        independent: bool = False,
     ) -> dict[str, Any]:
         """
         問題生成
@@ -77,6 +139,8 @@ class LLMService:
         Args:
             table_schemas: テーブルスキーマ情報
             user_prompt: ユーザーからの指示
+            independent: 同じ内容の呼び出しと合流せず、キャッシュも使わずに
+                生成する(複数の候補を並行して生成する場合に指定)
 
         Returns:
             問題情報
@@ -93,15 +157,13 @@ class LLMService:
                 table_schemas, user_prompt
             )
 
-            # LLM呼び出し
-            response = await self.llm_client.chat_completion(messages)
-            content = self.llm_client.extract_content(response)
-
-            # JSON解析
-            result = self._parse_json_response(content)
-
-            # 結果検証
-            self._validate_problem_generation_result(result)
+            # LLM呼び出しとJSON解析・結果検証
+            result = await self._complete_json(
+                messages,
+                task="generate_problem",
+                validate=self._validate_problem_generation_result,
+                shared=not independent,
+            )
 
             logger.info(
                 f"Generated problem with difficulty: "
@@ -151,15 +213,13 @@ class LLMService:
                 user_sql, user_result, expected_result, table_schemas
             )
 
-            # LLM呼び出し
-            response = await self.llm_client.chat_completion(messages)
-            content = self.llm_client.extract_content(response)
-
-            # JSON解析
-            result = self._parse_json_response(content)
-
-            # 結果検証
-            self._validate_answer_check_result(result)
+            # LLM呼び出しとJSON解析・結果検証(ユーザーが待っているため優先実行)
+            with llm_priority(INTERACTIVE):
+                result = await self._complete_json(
+                    messages,
+                    task="check_answer",
+                    validate=self._validate_answer_check_result,
+                )
 
             logger.info(f"Answer checked. Correct: {result.get('is_correct', False)}")
             return result
@@ -174,10 +234,226 @@ class LLMService:
                 detail=str(e),
             ) from None
 
+    async def stream_answer_feedback(
+        self,
+        user_sql: str,
+        user_result: list[dict[str, Any]],
+        expected_result: list[dict[str, Any]],
+        table_schemas: list[dict[str, Any]],
+        is_correct: bool,
+    ) -> AsyncGenerator[str, None]:
+        """
+        回答へのフィードバックをストリーミングで生成
+
+        Args:
+            user_sql: ユーザーSQL
+            user_result: ユーザーSQLの実行結果
+            expected_result: 期待される結果
+            table_schemas: テーブルスキーマ情報
+            is_correct: サーバー側での判定結果
+
+        Yields:
+            フィードバック文の断片
+
+        Raises:
+            LLMError: 生成失敗時
+        """
+        messages = self.prompt_generator.create_answer_feedback_prompt(
+            user_sql, user_result, expected_result, table_schemas, is_correct
+        )
+        metrics.observe(
+            "llm.prompt_tokens.answer_feedback", estimate_message_tokens(messages)
+        )
+
+        async for text in self.llm_client.chat_completion_stream(
+            messages, priority=INTERACTIVE
+        ):
+            yield text
+
+    async def _complete_json(
+        self,
+        messages: list[dict[str, str]],
+        task: str,
+        validate: Callable[[dict[str, Any]], None],
+        shared: bool = True,
+    ) -> dict[str, Any]:
+        """
+        LLMを呼び出して検証済みのJSONオブジェクトを取得
+
+        - LLM_CACHE_TTLSでTTLが設定されたタスクは、(モデル, 温度, メッセージ)が
+          同じ検証済みの応答をキャッシュから返す
+        - LLM_COALESCE_TASKSに含まれるタスクは、同じ内容で実行中の呼び出しが
+          あればそれに合流し、同じ結果を受け取る
+        - 解析・検証に失敗した応答はLLM_JSON_MAX_REGENERATIONS回まで生成し直す
+
+        Args:
+            messages: チャットメッセージのリスト
+            task: タスク種別(キャッシュ・合流の設定とキーに使用)
+            validate: 結果の検証関数(不正な応答はキャッシュしない)
+            shared: Falseならキャッシュ・合流を使わず、常に新しく生成する
+
+        Returns:
+            解析・検証済みのJSON
+        """
+        metrics.observe(f"llm.prompt_tokens.{task}", estimate_message_tokens(messages))
+        if not shared:
+            return await self._generate_valid_json(messages, task, validate)
+
+        key = cache_key(
+            task, self.llm_client.model_name, self.llm_client.temperature, messages
+        )
+        ttl = settings.get_llm_cache_ttl(task)
+
+        if ttl:
+            cached = await llm_response_cache.get(key, task)
+            if cached is not None:
+                return cast(dict[str, Any], cached)
+
+        async def fetch() -> dict[str, Any]:
+            result = await self._generate_valid_json(messages, task, validate)
+            if ttl:
+                await llm_response_cache.put(key, task, result, ttl)
+            return result
+
+        if task not in settings.get_coalesce_tasks():
+            return await fetch()
+
+        return cast(dict[str, Any], await llm_singleflight.do(key, fetch))
+
+    async def _generate_valid_json(
+        self,
+        messages: list[dict[str, str]],
+        task: str,
+        validate: Callable[[dict[str, Any]], None],
+    ) -> dict[str, Any]:
+        """
+        タスクの応答スキーマで構造化出力を要求し、検証済みのJSONを取得
+
+        解析失敗・検証失敗の件数と生成し直した回数をタスクごとに記録する
+        (llm.json.{task}.responses / parse_failures / validation_failures /
+        regenerations)
+
+        Raises:
+            LLMError: 呼び出し失敗時、または生成し直しても不正な応答が続いた場合
+        """
+        schema = get_response_schema(task)
+        error: LLMError | None = None
+
+        for attempt in range(settings.LLM_JSON_MAX_REGENERATIONS + 1):
+            if attempt:
+                logger.warning(f"Regenerating invalid {task} response: {error}")
+                metrics.increment(f"llm.json.{task}.regenerations")
+            metrics.increment(f"llm.json.{task}.responses")
+
+            try:
+                result = await self._request_json(messages, schema)
+            except LLMError as e:
+                if e.error_code != LLM_INVALID_RESPONSE:
+                    raise
+                metrics.increment(f"llm.json.{task}.parse_failures")
+                error = e
+                continue
+
+            try:
+                validate(result)
+            except LLMError as e:
+                metrics.increment(f"llm.json.{task}.validation_failures")
+                error = e
+                continue
+
+            return result
+
+        assert error is not None
+        raise error
+
+    async def _request_json(
+        self,
+        messages: list[dict[str, str]],
+        schema: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """
+        LLMを呼び出してJSONオブジェクトを取得
+
+        ストリーミングで受信しながらトップレベルのJSONオブジェクトの終端を検出し、
+        閉じた時点でストリームを閉じる(LLMサーバー側の生成も打ち切られる)。
+        JSONの後に続く説明文の生成を待たずに済む
+
+        Args:
+            messages: チャットメッセージのリスト
+            schema: 応答のJSONスキーマ(構造化出力に使用)
+
+        Returns:
+            解析されたJSON
+
+        Raises:
+            LLMError: 呼び出し・JSON解析失敗時
+        """
+        if not settings.LLM_STREAM_JSON_EARLY_STOP:
+            response = await self.llm_client.chat_completion(
+                messages, response_schema=schema
+            )
+            return self._parse_json_response(self.llm_client.extract_content(response))
+
+        detector = JsonBoundaryDetector()
+        chunks = 0
+        try:
+            async with aclosing(
+                self.llm_client.chat_completion_stream(messages, response_schema=schema)
+            ) as stream:
+                async for text in stream:
+                    chunks += 1
+                    boundary = detector.feed(text)
+                    while boundary is not None:
+                        start, end = boundary
+                        try:
+                            parsed, repairs = extract_json_object(
+                                detector.text[start:end]
+                            )
+                        except ValueError:
+                            # 前置きの文章中の括弧などはJSONではないので続きを探す
+                            boundary = detector.feed()
+                            continue
+                        self._record_repairs(repairs)
+                        self._record_early_stop(detector.text)
+                        return parsed
+
+        except LLMError as e:
+            # 応答を受け取る前の接続失敗はリトライ付きの通常呼び出しで再試行
+            if chunks or e.error_code not in (LLM_CONNECTION, LLM_TIMEOUT):
+                raise
+            logger.warning(f"Streaming completion failed, retrying without: {e}")
+            response = await self.llm_client.chat_completion(
+                messages, response_schema=schema
+            )
+            return self._parse_json_response(self.llm_client.extract_content(response))
+
+        # 最後まで受信した場合は従来どおり全体から抽出
+        metrics.increment("llm.early_stop.completed_without_stop")
+        return self._parse_json_response(detector.text)
+
+    def _record_early_stop(self, received_text: str) -> None:
+        """
+        早期終了時に受信した量をメトリクスに記録
+
+        受信したトークン数は受信したテキストから概算する。多くの応答はJSONの
+        直後にEOSで終わるため実際の節約量は分からず、max_tokensまでの残りは
+        節約できた量の上限(saved_tokens_upper_bound)として記録する
+        """
+        received = estimate_tokens(received_text)
+        metrics.increment("llm.early_stop.count")
+        metrics.observe("llm.early_stop.received_tokens", received)
+        metrics.increment(
+            "llm.early_stop.saved_tokens_upper_bound",
+            max(self.llm_client.max_tokens - received, 0),
+        )
+
     def _parse_json_response(self, content: str) -> dict[str, Any]:
         """
         LLMレスポンスからJSONを解析
 
+        前置きの文章やコードフェンスの中からJSONオブジェクトを取り出し、
+        軽微な書式の誤りは修復して解析する(修復の種類ごとに件数を記録)
+
         Args:
             content: LLMからのレスポンステキスト
 
@@ -188,26 +464,8 @@ class LLMService:
             LLMError: JSON解析失敗時
         """
         try:
-            # JSONブロックを探して抽出
-            content = content.strip()
-
-            # ```json から ``` までを抽出
-            if "```json" in content:
-                json_tag = "```json"
-                start = content.find(json_tag) + len(json_tag)
-                end = content.find("```", start)
-                if end != -1:
-                    json_text = content[start:end].strip()
-                else:
-                    json_text = content[start:].strip()
-            else:
-                # JSONブロックがない場合は全体をJSONとして扱う
-                json_text = content
-
-            parsed_json: dict[str, Any] = json.loads(json_text)
-            return parsed_json
-
-        except (json.JSONDecodeError, ValueError) as e:
+            parsed_json, repairs = extract_json_object(content)
+        except ValueError as e:
             logger.error(f"JSON parse error: {e}. Content: {content[:200]}...")
             raise LLMError(
                 message="LLM応答の解析に失敗しました",
@@ -215,6 +473,18 @@ class LLMService:
                 detail=f"JSONフォーマットエラー: {e!s}",
             ) from None
 
+        self._record_repairs(repairs)
+        return parsed_json
+
+    def _record_repairs(self, repairs: list[str]) -> None:
+        """JSONに適用した修復をメトリクスに記録"""
+        if not repairs:
+            return
+        logger.info(f"Repaired LLM JSON response: {', '.join(repairs)}")
+        metrics.increment("llm.json_repair.repaired")
+        for repair in repairs:
+            metrics.increment(f"llm.json_repair.{repair}")
+
     def _validate_table_generation_result(self, result: dict[str, Any]) -> None:
         """テーブル生成結果の検証"""
         required_fields = ["theme", "sql_statements"]
@@ -233,6 +503,16 @@ class LLMService:
                 detail="sql_statements は配列である必要があります",
             )
 
+    def _validate_scaled_table_generation_result(self, result: dict[str, Any]) -> None:
+        """大規模データ用テーブル生成結果の検証"""
+        self._validate_table_generation_result(result)
+        if not isinstance(result.get("data_spec"), dict):
+            raise LLMError(
+                message="テーブル生成結果が不正です",
+                error_code=LLM_INVALID_RESPONSE,
+                detail="data_spec はオブジェクトである必要があります",
+            )
+
     def _validate_problem_generation_result(self, result: dict[str, Any]) -> None:
         """問題生成結果の検証"""
         required_fields = ["difficulty", "correct_sql", "expected_result"]
@@ -277,3 +557,7 @@ class LLMService:
             正常に動作するかどうか
         """
         return await self.llm_client.check_health()
+
+
+# グローバル呼び出し合流インスタンス(LLMServiceはリクエストごとに作成されるため共有)
+llm_singleflight = SingleFlight("llm")
@@ -0,0 +1,188 @@
+"""
+問題生成
+LLMに問題を生成させ、正解SQLを実行して期待結果を確定する
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.core.config import settings
+from app.core.error_codes import PROBLEM_GENERATION_ERROR
+from app.core.exceptions import DatabaseError
+from app.core.metrics import metrics
+from app.services.db_service import DatabaseService
+from app.services.llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+# 出題に適した期待結果の行数
+MIN_RESULT_ROWS = 3
+MAX_RESULT_ROWS = 10
+
+# 検証済みの問題を1件生成する関数
+ProblemFactory = Callable[[], Awaitable[dict[str, Any]]]
+
+
+def is_servable(problem: dict[str, Any]) -> bool:
+    """期待結果が出題に適した行数(3-10行で打ち切りなし)かどうか"""
+    return not problem["truncated"] and (
+        MIN_RESULT_ROWS <= len(problem["expected_result"]) <= MAX_RESULT_ROWS
+    )
+
+
+async def generate_validated_problem(
+    llm_service: LLMService,
+    db_service: DatabaseService,
+    table_schemas: list[dict[str, Any]],
+    user_prompt: str | None = None,
+    independent: bool = False,
+) -> dict[str, Any]:
+    """
+    問題を生成し、正解SQLを実行して期待結果を取得(保存はしない)
+
+    Args:
+        llm_service: LLMサービス
+        db_service: 問題を実行するセッションのデータベースサービス
+        table_schemas: テーブル構造
+        user_prompt: ユーザーからの指示
+        independent: 同じ内容のLLM呼び出しと合流せずに生成する
+
+    Returns:
+        {"difficulty": str, "correct_sql": str, "hint": str | None,
+         "expected_result": list[dict], "truncated": bool}
+
+    Raises:
+        LLMError: 問題生成失敗時
+        DatabaseError: 正解SQLが実行できない場合
+    """
+    problem_info = await llm_service.generate_problem(
+        table_schemas, user_prompt, independent=independent
+    )
+
+    correct_sql = problem_info["correct_sql"]
+    try:
+        expected_result, truncated = await db_service.execute_select_query(
+            correct_sql, query_timeout=10
+        )
+    except DatabaseError:
+        logger.exception(f"Generated SQL failed to execute: {correct_sql}")
+        raise DatabaseError(
+            message="生成された問題のSQLが実行できませんでした",
+            error_code=PROBLEM_GENERATION_ERROR,
+            detail=f"SQL: {correct_sql[:100]}...",
+        ) from None
+
+    return {
+        "difficulty": problem_info.get("difficulty", "medium"),
+        "correct_sql": correct_sql,
+        "hint": problem_info.get("hint"),
+        "expected_result": expected_result,
+        "truncated": truncated,
+    }
+
+
+def _discard_result(task: asyncio.Future[dict[str, Any]]) -> None:
+    """打ち切った候補の例外を回収(未回収の警告を出さない)"""
+    if not task.cancelled():
+        task.exception()
+
+
+async def race_problem_candidates(
+    factory: ProblemFactory, candidates: int
+) -> dict[str, Any]:
+    """
+    問題の候補を並行して生成し、最初に出題条件を満たしたものを返す
+
+    条件を満たす候補が得られた時点で残りの候補を打ち切る(LLMのストリームと
+    実行中のSQLもキャンセルされる)。条件を満たす候補がなければ、実行できた
+    最初の候補を返す
+
+    Args:
+        factory: 検証済みの問題を1件生成する関数
+        candidates: 並行して生成する候補数
+
+    Returns:
+        問題(generate_validated_problemの形式)
+
+    Raises:
+        LLMError | DatabaseError: すべての候補が失敗した場合(最初の失敗)
+    """
+    started = time.perf_counter()
+    pending: set[asyncio.Future[dict[str, Any]]] = {
+        asyncio.ensure_future(factory()) for _ in range(max(candidates, 1))
+    }
+    metrics.increment("problem_candidates.started", len(pending))
+    done: set[asyncio.Future[dict[str, Any]]] = set()
+    fallback: dict[str, Any] | None = None
+    error: BaseException | None = None
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    metrics.increment("problem_candidates.failed")
+                    error = error or task.exception()
+                    continue
+
+                problem = task.result()
+                if is_servable(problem):
+                    metrics.increment("problem_candidates.cancelled", len(pending))
+                    metrics.observe(
+                        "problem_candidates.latency_ms",
+                        (time.perf_counter() - started) * 1000,
+                    )
+                    return problem
+                metrics.increment("problem_candidates.rejected")
+                fallback = fallback or problem
+    finally:
+        # 同時に完了して未確認の候補と、打ち切る候補の例外を回収する
+        for task in done:
+            _discard_result(task)
+        for task in pending:
+            task.add_done_callback(_discard_result)
+            task.cancel()
+
+    metrics.observe(
+        "problem_candidates.latency_ms", (time.perf_counter() - started) * 1000
+    )
+    if fallback is not None:
+        metrics.increment("problem_candidates.unservable")
+        logger.warning(
+            f"No candidate had {MIN_RESULT_ROWS}-{MAX_RESULT_ROWS} rows, "
+            f"serving one with {len(fallback['expected_result'])} rows"
+        )
+        return fallback
+    assert error is not None
+    raise error
+
+
+async def generate_servable_problem(
+    llm_service: LLMService,
+    db_service: DatabaseService,
+    table_schemas: list[dict[str, Any]],
+    user_prompt: str | None = None,
+) -> dict[str, Any]:
+    """
+    PROBLEM_CANDIDATES件の候補を並行して生成し、行数が3-10行の問題を返す
+
+    順に生成し直す場合と異なり、1件目が不適格でも他の候補の完了を待つだけで
+    済むため、応答時間のばらつきが小さくなる。正解SQLは候補ごとに別の接続で
+    実行する
+    """
+    if settings.PROBLEM_CANDIDATES <= 1:
+        return await generate_validated_problem(
+            llm_service, db_service, table_schemas, user_prompt
+        )
+
+    async def factory() -> dict[str, Any]:
+        return await generate_validated_problem(
+            llm_service, db_service, table_schemas, user_prompt, independent=True
+        )
+
+    return await race_problem_candidates(factory, settings.PROBLEM_CANDIDATES)
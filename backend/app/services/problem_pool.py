@@ -0,0 +1,257 @@
+"""
+問題の事前生成プール
+検証済み(正解SQLを実行し期待結果を確定済み)の問題をセッションスキーマごとに蓄えておき、
+問題生成APIでLLMを待たずに出題する
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict, defaultdict, deque
+from typing import Any
+
+from app.core.config import settings
+from app.core.llm_scheduler import BACKGROUND, llm_priority
+from app.core.metrics import metrics
+from app.core.schema_cache import schema_cache
+from app.services.db_service import DatabaseService
+from app.services.llm_service import LLMService
+from app.services.problem_generator import (
+    ProblemFactory,
+    generate_validated_problem,
+    is_servable,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def schema_fingerprint(table_schemas: list[dict[str, Any]]) -> str:
+    """テーブル構造のハッシュ(構造が変われば別のプールになる)"""
+    return hashlib.sha256(
+        json.dumps(table_schemas, ensure_ascii=False, sort_keys=True).encode()
+    ).hexdigest()
+
+
+class ProblemPool:
+    """
+    スキーマごとの問題プール
+
+    (スキーマ名, テーブル構造のハッシュ)をキーに問題を蓄える。スキーマが
+    リセット・変更されたら(SchemaCacheの無効化通知)そのスキーマの問題を破棄し、
+    生成途中の問題も古いデータに基づくため格納しない。
+    同時実行のLLM呼び出しは合流するため、出題済みと同じSQLの問題は格納しない
+    """
+
+    def __init__(self, size: int, max_schemas: int) -> None:
+        """
+        Args:
+            size: キーごとに蓄える問題数
+            max_schemas: 保持するキーの最大数(超えたら最も古いキーを破棄)
+        """
+        self.size = size
+        self.max_schemas = max_schemas
+        self._pools: OrderedDict[tuple[str, str], deque[dict[str, Any]]] = OrderedDict()
+        self._generations: defaultdict[str, int] = defaultdict(int)
+        self._refills: dict[tuple[str, str], asyncio.Task[None]] = {}
+        # キー -> 直近に出題した問題の正解SQL
+        self._served: dict[tuple[str, str], deque[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PROBLEM_POOL_ENABLED and self.size > 0
+
+    def pop(
+        self,
+        schema: str,
+        table_schemas: list[dict[str, Any]],
+        difficulty: str | None = None,
+    ) -> dict[str, Any] | None:
+        """
+        プールから問題を1件取り出す
+
+        Args:
+            schema: セッションスキーマ名
+            table_schemas: 現在のテーブル構造
+            difficulty: 指定した難易度の問題のみ取り出す(省略時は問わない)
+
+        Returns:
+            問題(プールが空の場合はNone)
+        """
+        if not self.enabled:
+            return None
+
+        key = (schema, schema_fingerprint(table_schemas))
+        pool = self._pools.get(key)
+        problem = None
+        if pool:
+            for candidate in pool:
+                if difficulty is None or candidate["difficulty"] == difficulty:
+                    problem = candidate
+                    break
+            if problem is not None:
+                pool.remove(problem)
+                self._remember_served(key, problem["correct_sql"])
+
+        metrics.increment("problem_pool.hits" if problem else "problem_pool.misses")
+        self._record_depth()
+        return problem
+
+    def note_served(
+        self, schema: str, table_schemas: list[dict[str, Any]], correct_sql: str
+    ) -> None:
+        """プールを経由せずに出題した問題を記録(同じ問題を再び格納しないため)"""
+        if self.enabled:
+            self._remember_served(
+                (schema, schema_fingerprint(table_schemas)), correct_sql
+            )
+
+    def request_refill(
+        self,
+        schema: str,
+        table_schemas: list[dict[str, Any]],
+        factory: ProblemFactory,
+    ) -> None:
+        """
+        プールが目標数に満たなければバックグラウンドで補充を開始
+
+        Args:
+            schema: セッションスキーマ名
+            table_schemas: 現在のテーブル構造
+            factory: 検証済みの問題を1件生成する関数
+        """
+        if not self.enabled:
+            return
+
+        key = (schema, schema_fingerprint(table_schemas))
+        task = self._refills.get(key)
+        if task is not None and not task.done():
+            return
+        if len(self._pools.get(key, ())) >= self.size:
+            return
+
+        task = asyncio.create_task(self._refill(key, factory))
+        self._refills[key] = task
+        task.add_done_callback(lambda _task: self._forget_refill(key, _task))
+
+    def invalidate(self, schema: str | None = None) -> None:
+        """
+        スキーマの問題を破棄(Noneの場合は全スキーマ)
+
+        SchemaCacheの無効化通知から呼ばれる
+        """
+        keys = [key for key in self._pools if schema is None or key[0] == schema]
+        if schema is None:
+            for name in list(self._generations):
+                self._generations[name] += 1
+        else:
+            self._generations[schema] += 1
+
+        for key in keys:
+            del self._pools[key]
+        for key in list(self._served):
+            if schema is None or key[0] == schema:
+                del self._served[key]
+        for key, task in list(self._refills.items()):
+            if schema is None or key[0] == schema:
+                task.cancel()
+
+        if keys:
+            metrics.increment("problem_pool.invalidations")
+        self._record_depth()
+
+    async def stop(self) -> None:
+        """補充タスクを停止してプールを空にする(アプリ終了時)"""
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pools.clear()
+        self._served.clear()
+        self._record_depth()
+
+    def depth(self) -> int:
+        """全キーの問題数の合計"""
+        return sum(len(pool) for pool in self._pools.values())
+
+    async def _refill(self, key: tuple[str, str], factory: ProblemFactory) -> None:
+        """目標数に達するまで問題を生成して格納"""
+        schema = key[0]
+        generation = self._generations[schema]
+        failures = 0
+
+        while len(self._pools.get(key, ())) < self.size:
+            try:
+                problem = await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                metrics.increment("problem_pool.refill_failures")
+                logger.warning(f"Problem pool refill failed for {schema}: {e}")
+                if failures >= settings.PROBLEM_POOL_MAX_FAILURES:
+                    return
+                continue
+
+            # 生成中にスキーマがリセットされた場合は古いデータに基づく問題なので捨てる
+            if self._generations[schema] != generation:
+                return
+
+            pool = self._pools.setdefault(key, deque())
+            self._pools.move_to_end(key)
+            duplicate = problem["correct_sql"] in self._served.get(key, ()) or any(
+                pooled["correct_sql"] == problem["correct_sql"] for pooled in pool
+            )
+            if duplicate or not is_servable(problem):
+                failures += 1
+                metrics.increment("problem_pool.rejected")
+                if failures >= settings.PROBLEM_POOL_MAX_FAILURES:
+                    return
+                continue
+
+            pool.append(problem)
+            metrics.increment("problem_pool.refilled")
+
+            while len(self._pools) > self.max_schemas:
+                evicted, _ = self._pools.popitem(last=False)
+                self._served.pop(evicted, None)
+            self._record_depth()
+
+    def _remember_served(self, key: tuple[str, str], correct_sql: str) -> None:
+        served = self._served.pop(key, None) or deque(maxlen=self.size * 4)
+        served.append(correct_sql)
+        self._served[key] = served
+        while len(self._served) > self.max_schemas:
+            del self._served[next(iter(self._served))]
+
+    def _forget_refill(self, key: tuple[str, str], task: asyncio.Task[None]) -> None:
+        if self._refills.get(key) is task:
+            del self._refills[key]
+
+    def _record_depth(self) -> None:
+        metrics.set_gauge("problem_pool.depth", self.depth())
+        metrics.set_gauge("problem_pool.schemas", len(self._pools))
+
+
+def schedule_refill(
+    llm_service: LLMService,
+    db_service: DatabaseService,
+    table_schemas: list[dict[str, Any]],
+) -> None:
+    """セッションスキーマのプールの補充をバックグラウンドで開始"""
+
+    async def factory() -> dict[str, Any]:
+        # 誰も待っていない事前生成なので、ユーザーの呼び出しを優先させる
+        with llm_priority(BACKGROUND):
+            return await generate_validated_problem(
+                llm_service, db_service, table_schemas
+            )
+
+    problem_pool.request_refill(db_service.schema, table_schemas, factory)
+
+
+# グローバル問題プールインスタンス
+problem_pool = ProblemPool(
+    size=settings.PROBLEM_POOL_SIZE, max_schemas=settings.PROBLEM_POOL_MAX_SCHEMAS
+)
+schema_cache.add_invalidation_listener(problem_pool.invalidate)
@@ -6,9 +6,20 @@ LLMに送信するプロンプトを生成する
 import json
 from typing import Any
 
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+from app.services.result_diff import summarize_result_diff
+
 
 class PromptGenerator:
-    """LLM用プロンプト生成クラス"""
+    """
+    LLM用プロンプト生成クラス
+
+    システムメッセージは呼び出しごとに変わらない指示だけにし、テーブル構造や
+    実行結果などの可変部分はユーザーメッセージに置く。先頭が同じプロンプトは
+    LLMサーバー(llama.cpp/Ollama)のKVキャッシュを再利用でき、prefillを省ける
+    """
 
     @staticmethod
     def create_table_generation_prompt(
@@ -105,6 +116,93 @@ JSONのみを出力してください。説明や補足は不要です。
             {"role": "user", "content": user_message},
         ]
 
+    @staticmethod
+    def create_scaled_table_generation_prompt(
+        target_rows: int, user_prompt: str | None = None
+    ) -> list[dict[str, str]]:
+        """
+        大規模データ用のテーブル作成プロンプトを生成
+
+        LLMにはテーブル定義と値の分布のみを出力させ、行データはサーバー側で生成する
+
+        Args:
+            target_rows: 最も大きいテーブルの目標行数
+            user_prompt: ユーザーからの指示(オプション)
+
+        Returns:
+            LLMに送信するメッセージリスト
+        """
+        system_message = """あなたはSQL学習アプリのためのテーブル設計アシスタントです。
+
+**目的**: クエリのパフォーマンスチューニングを練習するための、
+大量データを持つテーブル群を設計してください。
+行データはサーバー側で生成するため、あなたはテーブル定義と値の分布だけを出力します。
+
+**要件**:
+1. 2-4個のテーブルを作成
+2. テーブル間に適切なリレーション(外部キー)を設定
+3. 最も大きいテーブル(明細・履歴など)は指示された目標行数、
+   マスタ系のテーブルは現実的な行数(数十〜数千行)にする
+4. 主キーはSERIALにし、data_specのcolumnsには含めない
+
+**出力形式**:
+JSONのみを出力してください。説明や補足は不要です。
+```json
+{
+  "theme": "テーマ名",
+  "description": "テーマの簡単な説明",
+  "sql_statements": ["CREATE TABLE ...", ...],
+  "data_spec": {
+    "tables": [
+      {
+        "table": "テーブル名",
+        "rows": 行数,
+        "columns": {
+          "カラム名": {"kind": "生成方法", ...パラメータ}
+        }
+      }
+    ]
+  }
+}
+```
+
+**生成方法(kind)とパラメータ**:
+- "sequence": 連番(start: 開始値、省略時1)
+- "int_range": 整数の一様乱数(min, max)
+- "numeric_range": 小数の一様乱数(min, max, scale: 小数点以下桁数)
+- "date_range": 日付の一様乱数(start, end: YYYY-MM-DD)
+- "timestamp_range": 日時の一様乱数(start, end: YYYY-MM-DD HH:MM:SS)
+- "choice": 候補からランダムに選択(values: 配列)
+- "text_pattern": 接頭辞+連番の文字列(prefix, suffix: 省略可)
+- "bool": 真偽値(probability: trueになる確率)
+- "fk": 参照先テーブルの既存の値から選択(ref_table, ref_column: 省略時id)
+- どのkindでも null_ratio(0-1) を指定するとその割合でNULLになる
+
+**注意事項**:
+- sql_statementsにはCREATE TABLE文のみを出力(INSERT文は不要)
+- PostgreSQL互換のSQL構文を使用
+- 外部キー制約がある場合、必ず親テーブルを先に作成すること
+- NOT NULLでデフォルト値のないカラムは必ずdata_specのcolumnsに含めること
+- UNIQUE制約のあるカラムには"sequence"か"text_pattern"を使うこと
+- choiceの値には日本語のデータを含める(名前、地域等)
+"""
+
+        user_message = f"最も大きいテーブルの目標行数: 約{target_rows}行\n\n"
+        if user_prompt:
+            user_message += (
+                f"以下の指示に従ってテーブルを設計してください:\n{user_prompt}"
+            )
+        else:
+            user_message += (
+                "パフォーマンスチューニングの練習に適したテーブルを設計してください。"
+                "テーマはランダムに選んでください。"
+            )
+
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message},
+        ]
+
     @staticmethod
     def create_problem_generation_prompt(
         table_schemas: list[dict[str, Any]], user_prompt: str | None = None
@@ -119,16 +217,13 @@ JSONのみを出力してください。説明や補足は不要です。
         Returns:
             LLMに送信するメッセージリスト
         """
-        # テーブル情報を整理
+        # テーブル情報は可変部分なのでユーザーメッセージに入れる
         schema_info = PromptGenerator._format_table_schemas(table_schemas)
 
-        system_message = f"""あなたはSQL学習アプリの問題作成アシスタントです。
+        system_message = """あなたはSQL学習アプリの問題作成アシスタントです。
 
 **目的**: 与えられたテーブル構造に基づいて、SQL学習問題を作成してください。
 
-**現在のテーブル構造**:
-{schema_info}
-
 **要件**:
 1. 学習者が結果を見てSQLを推測する「逆引き学習」形式
 2. 適切な難易度(初級〜中級)
@@ -137,15 +232,15 @@ JSONのみを出力してください。説明や補足は不要です。
 
 **出力形式**:
 ```json
-{{
+{
   "difficulty": "easy|medium|hard",
   "correct_sql": "実際のSELECT文",
   "expected_result": [
-    {{"column1": "value1", "column2": "value2"}},
+    {"column1": "value1", "column2": "value2"},
     ...
   ],
   "hint": "ヒント文(オプション)"
-}}
+}
 ```
 
 **注意事項**:
@@ -159,10 +254,11 @@ JSONのみを出力してください。説明や補足は不要です。
 - JSONのみを出力し、説明や補足は不要
 """
 
+        user_message = f"**現在のテーブル構造**:\n{schema_info}\n\n"
         if user_prompt:
-            user_message = f"以下の条件で問題を作成してください:\n{user_prompt}"
+            user_message += f"以下の条件で問題を作成してください:\n{user_prompt}"
         else:
-            user_message = "適切な難易度のSQL学習問題を作成してください。"
+            user_message += "適切な難易度のSQL学習問題を作成してください。"
 
         return [
             {"role": "system", "content": system_message},
@@ -179,6 +275,9 @@ JSONのみを出力してください。説明や補足は不要です。
         """
         回答チェック用プロンプトを生成
 
+        実行結果は全行ではなく差分の要約(LLM_ANSWER_CHECK_TOKEN_BUDGET以内)を渡し、
+        結果の行数によらずプロンプトの長さを抑える
+
         Args:
             user_sql: ユーザーが入力したSQL
             user_result: ユーザーSQLの実行結果
@@ -189,26 +288,26 @@ JSONのみを出力してください。説明や補足は不要です。
             LLMに送信するメッセージリスト
         """
         schema_info = PromptGenerator._format_table_schemas(table_schemas)
+        result_diff = PromptGenerator._summarize_results(
+            "check_answer", user_result, expected_result
+        )
 
-        system_message = f"""あなたはSQL学習アプリの採点アシスタントです。
-
-**テーブル構造**:
-{schema_info}
+        system_message = """あなたはSQL学習アプリの採点アシスタントです。
 
 **採点基準**:
-1. 実行結果が期待結果と完全一致するか
+1. 実行結果が期待結果と完全一致するか(行の順序は問わない)
 2. SQLの記述が適切か(効率性、可読性)
 3. 学習者にとって有益なフィードバック
 
 **出力形式**:
 ```json
-{{
+{
   "is_correct": true/false,
   "score": 0-100,
   "feedback": "詳細なフィードバック",
   "improvement_suggestions": ["改善提案1", "改善提案2"],
   "hint": "ヒント(間違っている場合)"
-}}
+}
 ```
 
 **フィードバック指針**:
@@ -218,23 +317,78 @@ JSONのみを出力してください。説明や補足は不要です。
 - 日本語で回答
 """
 
-        user_message = f"""
+        user_message = f"""**テーブル構造**:
+{schema_info}
+
 **学習者のSQL**:
 ```sql
 {user_sql}
 ```
 
-**学習者の実行結果**:
-```json
-{json.dumps(user_result, ensure_ascii=False, indent=2)}
-```
+**実行結果と期待結果の差分**(表は列を|で区切ったもの):
+{result_diff}
 
-**期待される結果**:
-```json
-{json.dumps(expected_result, ensure_ascii=False, indent=2)}
+この学習者の回答を採点し、フィードバックを提供してください。
+"""
+
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message},
+        ]
+
+    @staticmethod
+    def create_answer_feedback_prompt(
+        user_sql: str,
+        user_result: list[dict[str, Any]],
+        expected_result: list[dict[str, Any]],
+        table_schemas: list[dict[str, Any]],
+        is_correct: bool,
+    ) -> list[dict[str, str]]:
+        """
+        ストリーミング表示用のフィードバックプロンプトを生成
+
+        正誤はサーバー側で判定済みのため、LLMには画面にそのまま表示する
+        プレーンテキストのフィードバックだけを書かせる
+
+        Args:
+            user_sql: ユーザーが入力したSQL
+            user_result: ユーザーSQLの実行結果
+            expected_result: 期待される実行結果
+            table_schemas: テーブルスキーマ情報
+            is_correct: 判定結果
+
+        Returns:
+            LLMに送信するメッセージリスト
+        """
+        schema_info = PromptGenerator._format_table_schemas(table_schemas)
+        verdict = "正解" if is_correct else "不正解"
+        result_diff = PromptGenerator._summarize_results(
+            "answer_feedback", user_result, expected_result
+        )
+
+        system_message = """あなたはSQL学習アプリの採点アシスタントです。
+
+**フィードバック指針**:
+- 正解の場合:よい点を褒め、より良い書き方があれば紹介する
+- 不正解の場合:何が間違っているか具体的に指摘し、正解に近づくヒントを示す
+- 常に建設的で学習促進的な内容
+- 日本語のプレーンテキストで、300文字程度にまとめる(JSONやコードブロックは不要)
+"""
+
+        user_message = f"""**テーブル構造**:
+{schema_info}
+
+**判定結果**: {verdict}
+
+**学習者のSQL**:
+```sql
+{user_sql}
 ```
 
-この学習者の回答を採点し、フィードバックを提供してください。
+**実行結果と期待結果の差分**(表は列を|で区切ったもの):
+{result_diff}
+
+この学習者へのフィードバックを書いてください。
 """
 
         return [
@@ -242,13 +396,41 @@ JSONのみを出力してください。説明や補足は不要です。
             {"role": "user", "content": user_message},
         ]
 
+    @staticmethod
+    def _summarize_results(
+        task: str,
+        user_result: list[dict[str, Any]],
+        expected_result: list[dict[str, Any]],
+    ) -> str:
+        """
+        実行結果の差分要約を作成し、全行を埋め込んだ場合とのトークン数を記録
+
+        Args:
+            task: メトリクス名に使うタスク種別
+            user_result: ユーザーSQLの実行結果
+            expected_result: 期待される実行結果
+
+        Returns:
+            差分の要約
+        """
+        summary = summarize_result_diff(
+            user_result, expected_result, settings.LLM_ANSWER_CHECK_TOKEN_BUDGET
+        )
+
+        full = json.dumps(
+            [user_result, expected_result], ensure_ascii=False, indent=2, default=str
+        )
+        metrics.observe(f"prompt.{task}.full_result_tokens", estimate_tokens(full))
+        metrics.observe(f"prompt.{task}.diff_tokens", estimate_tokens(summary))
+        return summary
+
     @staticmethod
     def _format_table_schemas(table_schemas: list[dict[str, Any]]) -> str:
         """
         テーブルスキーマ情報を読みやすい形式にフォーマット
 
         Args:
-            table_schemas: テーブルスキーマ情報
+            table_schemas: テーブルスキーマ情報(DatabaseService.get_table_schemasの形式)
 
         Returns:
             フォーマット済みのスキーマ情報
@@ -263,14 +445,19 @@ JSONのみを出力してください。説明や補足は不要です。
 
             column_info = []
             for col in columns:
-                col_name = col.get("column_name", "unknown")
-                data_type = col.get("data_type", "unknown")
-                is_nullable = col.get("is_nullable", "YES")
-                # RDBMSによる大文字小文字やスペースの違いに対応
-                nullable_str = (
-                    "NULL" if is_nullable.upper().strip() == "YES" else "NOT NULL"
-                )
-                column_info.append(f"  - {col_name}: {data_type} {nullable_str}")
+                parts = [
+                    f"  - {col.get('name', 'unknown')}: {col.get('type', 'unknown')}"
+                ]
+                if col.get("is_primary_key"):
+                    parts.append("PRIMARY KEY")
+                elif not col.get("nullable", True):
+                    parts.append("NOT NULL")
+                foreign_key = col.get("foreign_key")
+                if foreign_key:
+                    parts.append(
+                        f"REFERENCES {foreign_key['table']}({foreign_key['column']})"
+                    )
+                column_info.append(" ".join(parts))
 
             table_info = f"テーブル: {table_name}\n" + "\n".join(column_info)
             formatted_schemas.append(table_info)
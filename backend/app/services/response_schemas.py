@@ -0,0 +1,84 @@
+"""
+LLM応答のJSONスキーマ
+タスクごとの出力形式をJSONスキーマで定義し、構造化出力(制約付きデコード)に使う
+
+プロンプトの「出力形式」と_validate_*_resultの検証内容に合わせること
+"""
+
+from typing import Any
+
+_STRING = {"type": "string"}
+_STRING_LIST = {"type": "array", "items": _STRING}
+
+_TABLE_PROPERTIES: dict[str, Any] = {
+    "theme": _STRING,
+    "description": _STRING,
+    "sql_statements": {"type": "array", "items": _STRING, "minItems": 1},
+}
+
+_DATA_SPEC = {
+    "type": "object",
+    "properties": {
+        "tables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "table": _STRING,
+                    "rows": {"type": "integer", "minimum": 1},
+                    # 列ごとの生成方法(kindとパラメータ)はkindによって形が異なる
+                    "columns": {
+                        "type": "object",
+                        "additionalProperties": {
+                            "type": "object",
+                            "properties": {"kind": _STRING},
+                            "required": ["kind"],
+                        },
+                    },
+                },
+                "required": ["table", "rows", "columns"],
+            },
+        }
+    },
+    "required": ["tables"],
+}
+
+RESPONSE_SCHEMAS: dict[str, dict[str, Any]] = {
+    "generate_tables": {
+        "type": "object",
+        "properties": _TABLE_PROPERTIES,
+        "required": ["theme", "description", "sql_statements"],
+    },
+    "generate_scaled_tables": {
+        "type": "object",
+        "properties": {**_TABLE_PROPERTIES, "data_spec": _DATA_SPEC},
+        "required": ["theme", "description", "sql_statements", "data_spec"],
+    },
+    "generate_problem": {
+        "type": "object",
+        "properties": {
+            "difficulty": {"type": "string", "enum": ["easy", "medium", "hard"]},
+            "correct_sql": _STRING,
+            # 期待結果は正解SQLの実行結果で置き換えるため、行の形は問わない
+            "expected_result": {"type": "array", "items": {"type": "object"}},
+            "hint": _STRING,
+        },
+        "required": ["difficulty", "correct_sql", "expected_result"],
+    },
+    "check_answer": {
+        "type": "object",
+        "properties": {
+            "is_correct": {"type": "boolean"},
+            "score": {"type": "integer", "minimum": 0, "maximum": 100},
+            "feedback": _STRING,
+            "improvement_suggestions": _STRING_LIST,
+            "hint": _STRING,
+        },
+        "required": ["is_correct", "score", "feedback"],
+    },
+}
+
+
+def get_response_schema(task: str) -> dict[str, Any] | None:
+    """タスクの応答のJSONスキーマ(未定義のタスクはNone)"""
+    return RESPONSE_SCHEMAS.get(task)
@@ -0,0 +1,178 @@
+"""
+実行結果の差分要約
+学習者の結果と期待結果の違いだけを、トークン数の上限内のコンパクトな表形式にまとめる
+"""
+
+import json
+from collections import Counter
+from typing import Any
+
+from app.core.tokens import estimate_tokens
+
+# 1セルに表示する最大文字数
+MAX_CELL_CHARS = 40
+
+
+def _format_cell(value: Any) -> str:
+    """セルの値を1行の短い文字列に変換"""
+    if value is None:
+        return "NULL"
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    text = text.replace("\n", " ").replace("|", "/")
+    if len(text) > MAX_CELL_CHARS:
+        text = text[: MAX_CELL_CHARS - 1] + "…"
+    return text
+
+
+def _row_key(row: dict[str, Any], columns: list[str]) -> str:
+    """行の比較キー(指定した列の値のみ、列の順序に依存しない)"""
+    return json.dumps([row.get(column) for column in columns], default=str)
+
+
+def _columns(rows: list[dict[str, Any]]) -> list[str]:
+    return list(rows[0].keys()) if rows else []
+
+
+def _table_lines(rows: list[dict[str, Any]], columns: list[str]) -> list[str]:
+    """ヘッダー行を除く表の各行(列は|区切り)"""
+    return [" | ".join(_format_cell(row.get(c)) for c in columns) for row in rows]
+
+
+def _take_lines(lines: list[str], budget: int) -> tuple[list[str], int]:
+    """
+    トークン数の上限まで先頭から行を採用
+
+    Returns:
+        (採用した行, 省略した行数)
+    """
+    taken: list[str] = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        taken.append(line)
+        used += cost
+    return taken, len(lines) - len(taken)
+
+
+def _section(title: str, header: str, lines: list[str], budget: int) -> str:
+    """見出し・ヘッダー付きの表を上限内で作成"""
+    # 見出し・ヘッダーと省略行の表示分を除いた残りを行に使う
+    overhead = estimate_tokens(f"{title}:\n{header}\n…他{len(lines)}行省略") + 2
+    taken, omitted = _take_lines(lines, budget - overhead)
+    parts = [f"{title}:", header, *taken]
+    if omitted:
+        parts.append(f"…他{omitted}行省略")
+    return "\n".join(parts)
+
+
+def summarize_result_diff(
+    user_result: list[dict[str, Any]],
+    expected_result: list[dict[str, Any]],
+    token_budget: int,
+) -> str:
+    """
+    学習者の結果と期待結果の差分を要約
+
+    行数・列の違いと、一方にしかない行(行の順序は無視し、共通の列で比較)だけを
+    列を|で区切った表で示す。行が多い場合はtoken_budgetに収まるよう切り詰める
+
+    Args:
+        user_result: 学習者の実行結果
+        expected_result: 期待される実行結果
+        token_budget: 要約全体のトークン数の上限(概算)
+
+    Returns:
+        LLMに渡す差分の要約
+    """
+    user_columns = _columns(user_result)
+    expected_columns = _columns(expected_result)
+    common = [c for c in expected_columns if c in user_columns]
+    missing_columns = [c for c in expected_columns if c not in user_columns]
+    extra_columns = [c for c in user_columns if c not in expected_columns]
+
+    user_counts = Counter(_row_key(row, common) for row in user_result)
+    expected_counts = Counter(_row_key(row, common) for row in expected_result)
+    matched = sum((user_counts & expected_counts).values()) if common else 0
+
+    lines = [
+        f"行数: 学習者 {len(user_result)} / 期待 {len(expected_result)} "
+        f"(共通の列で一致 {matched})",
+        f"期待結果の列: {', '.join(expected_columns) or '(なし)'}",
+    ]
+    if missing_columns:
+        lines.append(f"学習者の結果に不足している列: {', '.join(missing_columns)}")
+    if extra_columns:
+        lines.append(f"学習者の結果の余分な列: {', '.join(extra_columns)}")
+
+    # 一方にしかない行(同じ行が複数ある場合は超過分のみ)
+    missing_rows = []
+    remaining = expected_counts - user_counts
+    for row in expected_result:
+        key = _row_key(row, common)
+        if remaining[key]:
+            remaining[key] -= 1
+            missing_rows.append(row)
+    extra_rows = []
+    remaining = user_counts - expected_counts
+    for row in user_result:
+        key = _row_key(row, common)
+        if remaining[key]:
+            remaining[key] -= 1
+            extra_rows.append(row)
+
+    if not missing_rows and not extra_rows and not missing_columns:
+        lines.append("共通の列の値はすべて期待結果と一致しています")
+        return "\n".join(lines)
+
+    summary = "\n".join(lines)
+    rows_budget = max(token_budget - estimate_tokens(summary), 0)
+    sections = []
+
+    if not common:
+        # 共通の列がなければ行を比較できないので、両方の結果をそのまま示す
+        for title, rows, columns in (
+            ("期待結果", expected_result, expected_columns),
+            ("学習者の結果", user_result, user_columns),
+        ):
+            if rows:
+                section = _section(
+                    f"{title} ({len(rows)})",
+                    " | ".join(columns),
+                    _table_lines(rows, columns),
+                    rows_budget // 2,
+                )
+                sections.append(section)
+        return "\n\n".join([summary, *sections])
+
+    if missing_rows or (missing_columns and expected_result):
+        title = f"期待結果にあって学習者の結果にない行 ({len(missing_rows)})"
+        columns = common
+        if missing_columns:
+            # 列が不足している場合は期待結果の形が分かるよう全列を示す
+            columns = expected_columns
+            if not missing_rows:
+                title = f"期待結果 ({len(expected_result)})"
+                missing_rows = expected_result
+        # 余った分は学習者側の行に回す
+        section = _section(
+            title,
+            " | ".join(columns),
+            _table_lines(missing_rows, columns),
+            rows_budget // 2 if extra_rows else rows_budget,
+        )
+        sections.append(section)
+        rows_budget -= estimate_tokens(section)
+
+    if extra_rows:
+        sections.append(
+            _section(
+                f"学習者の結果にあって期待結果にない行 ({len(extra_rows)})",
+                " | ".join(common),
+                _table_lines(extra_rows, common),
+                rows_budget,
+            )
+        )
+
+    return "\n\n".join([summary, *sections])
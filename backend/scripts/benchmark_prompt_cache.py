@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+プロンプトキャッシュのベンチマーク
+タスクごとに最初のトークンが返るまでの時間(TTFT)を、KVキャッシュが効かない場合
+(cold)と効く場合(warm)で比較する
+
+- cold: システムメッセージの先頭に毎回異なる文字列を入れ、先頭一致を崩す
+  (可変部分をシステムメッセージに埋め込んでいた従来のプロンプト構成に相当)
+- warm: 同じ固定の先頭部分で繰り返し呼び出す(現在のプロンプト構成)
+
+使い方:
+    python /app/scripts/benchmark_prompt_cache.py --runs 3
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# プロジェクトルートをPythonパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.llm_client import LLMClient
+from app.core.metrics import metrics
+from app.services.prompt_generator import PromptGenerator
+
+# ベンチマーク用のテーブル構造と実行結果
+TABLE_SCHEMAS = [
+    {
+        "table_name": "departments",
+        "columns": [
+            {
+                "name": "id",
+                "type": "INTEGER",
+                "nullable": False,
+                "is_primary_key": True,
+            },
+            {"name": "name", "type": "VARCHAR", "nullable": False},
+        ],
+    },
+    {
+        "table_name": "employees",
+        "columns": [
+            {
+                "name": "id",
+                "type": "INTEGER",
+                "nullable": False,
+                "is_primary_key": True,
+            },
+            {"name": "name", "type": "VARCHAR", "nullable": False},
+            {
+                "name": "department_id",
+                "type": "INTEGER",
+                "nullable": True,
+                "foreign_key": {"table": "departments", "column": "id"},
+            },
+            {"name": "salary", "type": "INTEGER", "nullable": True},
+        ],
+    },
+]
+EXPECTED_RESULT = [{"name": f"社員{i}", "salary": 300000 + i * 1000} for i in range(8)]
+USER_RESULT = EXPECTED_RESULT[:6]
+
+TASKS = {
+    "generate_tables": lambda: PromptGenerator.create_table_generation_prompt(),
+    "generate_problem": lambda: PromptGenerator.create_problem_generation_prompt(
+        TABLE_SCHEMAS
+    ),
+    "check_answer": lambda: PromptGenerator.create_answer_check_prompt(
+        "SELECT name, salary FROM employees LIMIT 6",
+        USER_RESULT,
+        EXPECTED_RESULT,
+        TABLE_SCHEMAS,
+    ),
+}
+
+
+def _break_prefix(messages: list[dict[str, str]]) -> list[dict[str, str]]:
+    """システムメッセージの先頭に毎回異なる文字列を入れてKVキャッシュを無効にする"""
+    head, *rest = messages
+    return [{**head, "content": f"[{uuid.uuid4()}]\n{head['content']}"}, *rest]
+
+
+async def _time_to_first_token(
+    client: LLMClient, messages: list[dict[str, str]]
+) -> float:
+    """最初のトークンまでの秒数(1トークン受け取った時点で打ち切る)"""
+    started = time.perf_counter()
+    stream = client.chat_completion_stream(messages, max_tokens=8)
+    try:
+        async for _ in stream:
+            break
+    finally:
+        await stream.aclose()
+    return time.perf_counter() - started
+
+
+async def benchmark(runs: int) -> None:
+    client = LLMClient()
+    await client.start()
+    print(
+        f"endpoint={client.endpoint_type} ollama_native={client.ollama_native} "
+        f"model={client.model_name} runs={runs}"
+    )
+    print(f"{'task':<18}{'cold TTFT(s)':>14}{'warm TTFT(s)':>14}{'speedup':>10}")
+
+    try:
+        for task, build in TASKS.items():
+            messages = build()
+            cold = [
+                await _time_to_first_token(client, _break_prefix(messages))
+                for _ in range(runs)
+            ]
+            # 1回目でキャッシュを作ってから計測
+            await _time_to_first_token(client, messages)
+            warm = [await _time_to_first_token(client, messages) for _ in range(runs)]
+
+            cold_median = statistics.median(cold)
+            warm_median = statistics.median(warm)
+            print(
+                f"{task:<18}{cold_median:>14.2f}{warm_median:>14.2f}"
+                f"{cold_median / warm_median:>9.1f}x"
+            )
+    finally:
+        await client.close()
+
+    observations = metrics.snapshot()["observations"]
+    if "llm.ollama.prompt_eval_tokens" in observations:
+        summary = observations["llm.ollama.prompt_eval_tokens"]
+        print(f"ollama prompt_eval_tokens avg={summary['avg']:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=3, help="モードごとの試行回数")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.runs))
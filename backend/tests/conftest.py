@@ -8,6 +8,16 @@ from collections.abc import Generator
 import pytest
 
 
+class FakeClock:
+    """テスト用の時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
 @pytest.fixture(scope="session")
 def event_loop() -> Generator:
     """セッション全体で使用するイベントループ"""
@@ -16,6 +26,12 @@ def event_loop() -> Generator:
     loop.close()
 
 
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    """nowを書き換えて時間を進められる時計"""
+    return FakeClock()
+
+
 @pytest.fixture
 def sample_valid_sql():
     """有効なSQLサンプル"""
@@ -0,0 +1,204 @@
+"""
+INSERT文のCOPY変換のテスト
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.core.bulk_loader import convert_literal, load_statements, parse_insert
+
+
+class TestParseInsert:
+    """INSERT文解析のテスト"""
+
+    def test_multi_row_insert(self):
+        """複数行INSERTの解析"""
+        parsed = parse_insert(
+            "INSERT INTO employees (name, department_id, salary, hire_date) VALUES "
+            "('田中太郎', 1, 450000, '2020-04-01'), ('佐藤花子', 2, 520000.5, NULL);"
+        )
+
+        assert parsed is not None
+        assert parsed["schema"] is None
+        assert parsed["table"] == "employees"
+        assert parsed["columns"] == ["name", "department_id", "salary", "hire_date"]
+        assert parsed["rows"] == [
+            [
+                ("str", "田中太郎"),
+                ("num", "1"),
+                ("num", "450000"),
+                ("str", "2020-04-01"),
+            ],
+            [("str", "佐藤花子"), ("num", "2"), ("num", "520000.5"), ("null", None)],
+        ]
+
+    def test_escaped_quote_and_punctuation_in_string(self):
+        """エスケープされた引用符や区切り文字を含む文字列"""
+        parsed = parse_insert(
+            "insert into books (title) values ('It''s (vol. 1), part; two')"
+        )
+
+        assert parsed is not None
+        assert parsed["rows"] == [[("str", "It's (vol. 1), part; two")]]
+
+    def test_quoted_and_qualified_identifiers(self):
+        """クォート付き識別子・スキーマ修飾の解析"""
+        parsed = parse_insert(
+            'INSERT INTO app."Orders" ("OrderId", total) VALUES (1, TRUE)'
+        )
+
+        assert parsed is not None
+        assert parsed["schema"] == "app"
+        assert parsed["table"] == "Orders"
+        assert parsed["columns"] == ["OrderId", "total"]
+        assert parsed["rows"] == [[("num", "1"), ("bool", True)]]
+
+    def test_casts_and_typed_literals(self):
+        """型キャストと型付きリテラル"""
+        parsed = parse_insert(
+            "INSERT INTO events (day, at) VALUES "
+            "('2024-01-01'::date, TIMESTAMP '2024-01-01 10:00:00')"
+        )
+
+        assert parsed is not None
+        assert parsed["rows"] == [
+            [("str", "2024-01-01"), ("str", "2024-01-01 10:00:00")]
+        ]
+
+    def test_without_column_list(self):
+        """カラム指定なしのINSERT"""
+        parsed = parse_insert("INSERT INTO departments VALUES (1, '営業部')")
+
+        assert parsed is not None
+        assert parsed["columns"] is None
+        assert len(parsed["rows"][0]) == 2
+
+    def test_not_convertible_statements(self):
+        """COPYに変換できない文はNone"""
+        statements = [
+            "CREATE TABLE departments (id SERIAL PRIMARY KEY)",
+            "INSERT INTO logs (created_at) VALUES (NOW())",
+            "INSERT INTO t (a) VALUES (1) ON CONFLICT DO NOTHING",
+            "INSERT INTO t (a) SELECT 1",
+            "INSERT INTO t (a, b) VALUES (1)",
+            "INSERT INTO t (a) VALUES ('unterminated)",
+        ]
+
+        for sql in statements:
+            assert parse_insert(sql) is None, sql
+
+
+class TestConvertLiteral:
+    """リテラル変換のテスト"""
+
+    def test_numeric_types(self):
+        """数値型への変換"""
+        assert convert_literal(("num", "42"), "integer") == 42
+        assert convert_literal(("str", "42"), "bigint") == 42
+        assert convert_literal(("num", "1.50"), "numeric") == Decimal("1.50")
+        assert convert_literal(("num", "2.5"), "double precision") == 2.5
+
+    def test_date_and_time_types(self):
+        """日付・時刻型への変換"""
+        assert convert_literal(("str", "2020-04-01"), "date") == date(2020, 4, 1)
+        assert convert_literal(
+            ("str", "2020-04-01 09:30:00"), "timestamp without time zone"
+        ) == datetime(2020, 4, 1, 9, 30)
+
+    def test_text_and_boolean_types(self):
+        """文字列型・真偽値型への変換"""
+        assert convert_literal(("str", "営業部"), "character varying") == "営業部"
+        assert convert_literal(("num", "123"), "text") == "123"
+        assert convert_literal(("bool", False), "boolean") is False
+        assert convert_literal(("str", "t"), "boolean") is True
+
+    def test_null(self):
+        """NULLは型に関係なくNone"""
+        assert convert_literal(("null", None), "integer") is None
+
+    def test_not_convertible(self):
+        """変換できない値・型はValueError"""
+        cases = [
+            (("num", "1.5"), "integer"),
+            (("str", "abc"), "integer"),
+            (("str", "2020/04/01"), "date"),
+            (("str", "2020-04-01 09:30:00"), "timestamp with time zone"),
+            (("str", "2024-01-01T10:00:00+09:00"), "timestamp without time zone"),
+            (("str", "1 day"), "interval"),
+            (("bool", True), "text"),
+            (("str", "Infinity"), "integer"),
+            (("num", "40000"), "smallint"),
+            (("num", "1e999"), "double precision"),
+            (("num", "1"), "boolean"),
+            (("num", "20200401"), "date"),
+            (("num", "1"), "jsonb"),
+        ]
+
+        for literal, pg_type in cases:
+            with pytest.raises(ValueError):
+                convert_literal(literal, pg_type)
+
+
+class FakeConnection:
+    """カラムの型を返し、実行したSQLとCOPYを記録する接続"""
+
+    def __init__(self, column_types: dict[str, list[tuple[str, str]]]) -> None:
+        self.column_types = column_types
+        self.executed: list[str] = []
+        self.copies: list[tuple[str, list[str], list[tuple]]] = []
+
+    async def fetch(self, _sql: str, qualified: str) -> list[dict]:
+        columns = self.column_types.get(qualified.strip('"'), [])
+        return [{"attname": name, "type_name": type_} for name, type_ in columns]
+
+    async def execute(self, sql: str) -> str:
+        self.executed.append(sql)
+        return "OK"
+
+    async def copy_records_to_table(
+        self, table: str, records: list, columns: list[str], schema_name=None
+    ) -> None:
+        self.copies.append((table, columns, records))
+
+
+class TestLoadStatements:
+    """INSERT文のCOPYへの振り分けのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_consecutive_inserts_are_copied_together(self):
+        """同じテーブルへの連続するINSERTは1回のCOPYにまとめる"""
+        conn = FakeConnection({"events": [("id", "integer"), ("name", "text")]})
+        statements = [
+            "CREATE TABLE events (id integer, name text)",
+            "INSERT INTO events (id, name) VALUES (1, 'a'), (2, 'b')",
+            "INSERT INTO events (id, name) VALUES (3, 'c')",
+        ]
+
+        stats = await load_statements(conn, statements)
+
+        assert conn.executed == [statements[0]]
+        assert conn.copies == [
+            ("events", ["id", "name"], [(1, "a"), (2, "b"), (3, "c")])
+        ]
+        assert stats == {"copied_rows": 3, "copy_batches": 1, "executed_statements": 1}
+
+    @pytest.mark.asyncio
+    async def test_timestamp_with_offset_falls_back_to_insert(self):
+        """オフセット付きの値をtimestamp列に入れるINSERTは通常実行する"""
+        conn = FakeConnection(
+            {"events": [("id", "integer"), ("at", "timestamp without time zone")]}
+        )
+        statements = [
+            "INSERT INTO events (id, at) VALUES (1, '2024-01-01T10:00:00')",
+            "INSERT INTO events (id, at) VALUES (2, '2024-01-01T10:00:00+09:00')",
+        ]
+
+        stats = await load_statements(conn, statements)
+
+        assert conn.copies == [
+            ("events", ["id", "at"], [(1, datetime(2024, 1, 1, 10, 0))])
+        ]
+        assert conn.executed == [statements[1]]
+        assert stats == {"copied_rows": 1, "copy_batches": 1, "executed_statements": 1}
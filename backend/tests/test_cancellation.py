@@ -0,0 +1,89 @@
+"""
+クライアント切断時の処理中断のテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.core import cancellation
+from app.core.cancellation import cancel_on_disconnect
+from app.core.error_codes import DB_CANCELLED_ERROR
+from app.core.exceptions import DatabaseError
+
+
+class FakeRequest:
+    """指定回数の確認の後に切断したことにするリクエスト"""
+
+    def __init__(self, disconnect_after: int | None) -> None:
+        self.disconnect_after = disconnect_after
+        self.checks = 0
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.disconnect_after is not None and self.checks > self.disconnect_after
+
+
+class TestCancelOnDisconnect:
+    """cancel_on_disconnectのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def fast_poll(self, monkeypatch):
+        monkeypatch.setattr(cancellation, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    @pytest.mark.asyncio
+    async def test_returns_result(self):
+        """切断されなければ処理結果を返す"""
+
+        async def work():
+            await asyncio.sleep(0.03)
+            return "done"
+
+        request = FakeRequest(disconnect_after=None)
+
+        assert await cancel_on_disconnect(request, work()) == "done"  # type: ignore[arg-type]
+
+    @pytest.mark.asyncio
+    async def test_cancels_work_on_disconnect(self):
+        """切断されたら処理をキャンセルしてDB_CANCELLED_ERRORを送出する"""
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        request = FakeRequest(disconnect_after=1)
+
+        with pytest.raises(DatabaseError) as exc_info:
+            await cancel_on_disconnect(request, work())  # type: ignore[arg-type]
+
+        assert exc_info.value.error_code == DB_CANCELLED_ERROR
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_caller_cancellation_cancels_work(self):
+        """呼び出し元がキャンセルされた場合も処理をキャンセルする"""
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.ensure_future(
+            cancel_on_disconnect(FakeRequest(None), work())  # type: ignore[arg-type]
+        )
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+        assert cancelled.is_set()
@@ -0,0 +1,123 @@
+"""
+回答チェックAPIのテスト
+"""
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.check_answer import DEFAULT_HINT
+from app.core.dependencies import get_db_service, get_llm
+from app.core.exceptions import LLMError
+from app.main import app
+
+PROBLEM = {
+    "id": 1,
+    "expected_result": [{"name": "営業部"}, {"name": "開発部"}],
+    "table_schemas": [],
+}
+
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    """text/event-streamの本文を(イベント名, データ)のリストに変換"""
+    events = []
+    for raw in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestCheckAnswerStream:
+    """/check-answer/streamのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        self.db_service = AsyncMock()
+        self.db_service.get_problem.return_value = dict(PROBLEM)
+        self.llm_service = AsyncMock()
+        self.texts = ["よい", "SQLです"]
+        self.llm_error: LLMError | None = None
+
+        async def stream_answer_feedback(**_kwargs):
+            for text in self.texts:
+                yield text
+            if self.llm_error:
+                raise self.llm_error
+
+        self.llm_service.stream_answer_feedback = stream_answer_feedback
+        app.dependency_overrides[get_db_service] = lambda: self.db_service
+        app.dependency_overrides[get_llm] = lambda: self.llm_service
+        self.client = TestClient(app)
+
+    def teardown_method(self):
+        """依存性の差し替えを元に戻す"""
+        app.dependency_overrides.clear()
+
+    def check(self, user_result: list[dict]) -> list[tuple[str, dict]]:
+        self.db_service.execute_select_query.return_value = (user_result, False)
+        response = self.client.post(
+            "/api/check-answer/stream",
+            json={"context": {"problem_id": 1, "user_sql": "SELECT name FROM d"}},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return parse_events(response.text)
+
+    def test_correct_answer(self):
+        """判定結果、フィードバック文、採点情報、終了の順に送る"""
+        events = self.check(PROBLEM["expected_result"])
+
+        assert events == [
+            (
+                "result",
+                {
+                    "success": True,
+                    "message": "回答をチェックしました",
+                    "data": {"is_correct": True},
+                },
+            ),
+            ("token", {"text": "よい"}),
+            ("token", {"text": "SQLです"}),
+            ("feedback", {"score": 100}),
+            ("done", {}),
+        ]
+
+    def test_incorrect_answer_includes_hint(self):
+        """不正解の場合は/check-answerと同じくヒントと改善提案を送る"""
+        events = self.check([{"name": "営業部"}])
+
+        assert [name for name, _ in events] == [
+            "result",
+            "token",
+            "token",
+            "feedback",
+            "done",
+        ]
+        assert events[0][1]["data"]["is_correct"] is False
+        assert events[0][1]["data"]["user_result"] == [{"name": "営業部"}]
+        assert events[3][1] == {
+            "score": 0,
+            "hint": DEFAULT_HINT,
+            "improvement_suggestions": [],
+        }
+
+    def test_llm_error_still_sends_feedback(self):
+        """フィードバック生成に失敗しても採点情報と終了を送る"""
+        self.texts = []
+        self.llm_error = LLMError("LLMに接続できません", "LLM_CONNECTION_ERROR")
+
+        events = self.check([{"name": "営業部"}])
+
+        assert [name for name, _ in events] == ["result", "error", "feedback", "done"]
+        assert events[1][1]["error_code"] == "LLM_CONNECTION_ERROR"
+
+    @pytest.mark.parametrize("context", [{}, {"problem_id": 1}])
+    def test_invalid_request_is_rejected_before_streaming(self, context):
+        """リクエストが不正な場合はストリームを開始せず400"""
+        response = self.client.post(
+            "/api/check-answer/stream", json={"context": context}
+        )
+
+        assert response.status_code == 400
@@ -0,0 +1,94 @@
+"""
+サーキットブレーカーのテスト
+"""
+
+import pytest
+
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.core.metrics import metrics
+
+
+class TestCircuitBreaker:
+    """CircuitBreakerのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, fake_clock):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.clock = fake_clock
+        self.breaker = CircuitBreaker(
+            "test",
+            failure_rate_threshold=0.5,
+            window_size=10,
+            min_calls=4,
+            recovery_timeout=30.0,
+            clock=self.clock,
+        )
+
+    def test_stays_closed_below_min_calls(self):
+        """呼び出し数が少ない間はエラーでもopenにならない"""
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        assert self.breaker.state == CLOSED
+        assert self.breaker.allow_request()
+
+    def test_opens_when_failure_rate_exceeds_threshold(self):
+        """エラー率が閾値を超えるとopenになり呼び出しを拒否"""
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        assert self.breaker.state == CLOSED
+
+        self.breaker.record_failure()
+
+        assert self.breaker.state == OPEN
+        assert not self.breaker.allow_request()
+        assert self.breaker.retry_after() == 30.0
+        assert metrics.counter("test.circuit.opened") == 1
+        assert metrics.counter("test.circuit.rejected") == 1
+
+    def test_half_open_allows_single_probe(self):
+        """回復待ち後はhalf_openになり試験呼び出しを1件だけ許可"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 30.0
+
+        assert self.breaker.state == HALF_OPEN
+        assert self.breaker.allow_request()
+        assert not self.breaker.allow_request()
+
+    def test_probe_success_closes(self):
+        """試験呼び出しが成功するとclosedに戻る"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 30.0
+        assert self.breaker.allow_request()
+
+        self.breaker.record_success()
+
+        assert self.breaker.state == CLOSED
+        assert self.breaker.snapshot()["window_calls"] == 0
+
+    def test_probe_failure_reopens(self):
+        """試験呼び出しが失敗すると再びopenになる"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 30.0
+        assert self.breaker.allow_request()
+
+        self.breaker.record_failure()
+
+        assert self.breaker.state == OPEN
+        assert metrics.counter("test.circuit.opened") == 2
+
+    def test_abandoned_probe_is_replaced(self):
+        """結果が記録されない試験呼び出しがあっても次の試験を許可"""
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 30.0
+        assert self.breaker.allow_request()
+
+        self.clock.now = 60.0
+
+        assert self.breaker.allow_request()
@@ -0,0 +1,128 @@
+"""
+大規模データ生成文の組み立てのテスト
+"""
+
+import pytest
+
+from app.services.data_generator import build_generation_statements
+
+
+class TestBuildGenerationStatements:
+    """build_generation_statementsのテスト"""
+
+    def test_referenced_tables_first(self):
+        """外部キーの参照先テーブルが先に生成される"""
+        statements = build_generation_statements(
+            {
+                "tables": [
+                    {
+                        "table": "orders",
+                        "rows": 500000,
+                        "columns": {
+                            "customer_id": {"kind": "fk", "ref_table": "customers"},
+                            "amount": {"kind": "numeric_range", "min": 1, "max": 100},
+                        },
+                    },
+                    {
+                        "table": "customers",
+                        "rows": 10000,
+                        "columns": {
+                            "id": {"kind": "sequence"},
+                            "name": {"kind": "text_pattern", "prefix": "顧客"},
+                        },
+                    },
+                ]
+            },
+            max_rows=1_000_000,
+        )
+
+        assert [statement["table"] for statement in statements] == [
+            "customers",
+            "orders",
+        ]
+        orders = statements[1]
+        assert orders["rows"] == 500000
+        assert 'FROM "customers"' in orders["sql"]
+        assert "generate_series(1, $4::text::int)" in orders["sql"]
+        assert orders["args"] == ["1", "100", "2", "500000"]
+
+    def test_values_are_parameters(self):
+        """値はSQL文に埋め込まずパラメータとして渡す"""
+        statements = build_generation_statements(
+            {
+                "tables": [
+                    {
+                        "table": "products",
+                        "rows": 100,
+                        "columns": {
+                            "category": {
+                                "kind": "choice",
+                                "values": ["食品'); DROP TABLE x; --", "家電"],
+                                "null_ratio": 0.1,
+                            }
+                        },
+                    }
+                ]
+            },
+            max_rows=1000,
+        )
+
+        sql = statements[0]["sql"]
+        assert "DROP TABLE" not in sql
+        assert "CASE WHEN random() < $2::text::float8 THEN NULL" in sql
+        assert statements[0]["args"][0] == ["食品'); DROP TABLE x; --", "家電"]
+
+    def test_choice_is_cast_to_column_type(self):
+        """選択肢は挿入先カラムの型の配列にキャストする(不明ならtext[])"""
+        spec = {
+            "tables": [
+                {
+                    "table": "events",
+                    "rows": 10,
+                    "columns": {
+                        "day": {"kind": "choice", "values": ["2024-01-01"]},
+                        "note": {"kind": "choice", "values": ["a"]},
+                    },
+                }
+            ]
+        }
+
+        sql = build_generation_statements(
+            spec, max_rows=100, column_types={"events": {"day": "date"}}
+        )[0]["sql"]
+
+        assert "$1::text[]::date[]" in sql
+        assert "$2::text[])" in sql
+
+    def test_rows_are_capped(self):
+        """行数は上限で切り詰める"""
+        statements = build_generation_statements(
+            {
+                "tables": [
+                    {"table": "t", "rows": 10**9, "columns": {"b": {"kind": "bool"}}}
+                ]
+            },
+            max_rows=1000,
+        )
+
+        assert statements[0]["rows"] == 1000
+
+    @pytest.mark.parametrize(
+        "data_spec",
+        [
+            {},
+            {"tables": []},
+            {"tables": [{"table": "t", "columns": {}}]},
+            {"tables": [{"table": "t", "columns": {"a": {"kind": "unknown"}}}]},
+            {"tables": [{"table": "t", "columns": {"a": {"kind": "int_range"}}}]},
+            {
+                "tables": [
+                    {"table": "t", "columns": {"a": {"kind": "choice", "values": []}}}
+                ]
+            },
+        ],
+    )
+    def test_invalid_spec(self, data_spec):
+        """不正な定義はValueError"""
+        with pytest.raises(ValueError):
+            build_generation_statements(data_spec, max_rows=1000)
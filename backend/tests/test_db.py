@@ -0,0 +1,279 @@
+"""
+データベース接続管理のテスト(asyncpgの接続を模したオブジェクトで検証)
+"""
+
+import json
+from contextlib import asynccontextmanager
+
+import asyncpg
+import pytest
+
+from app.core.db import Database
+from app.core.exceptions import DatabaseError
+from app.core.schema_cache import schema_cache
+from app.services.db_service import DatabaseService
+
+
+class FakeTransaction:
+    """トランザクションの終了(commit/rollback)を記録する"""
+
+    def __init__(self, conn: "FakeConnection") -> None:
+        self.conn = conn
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.transactions.append("rollback" if exc_type else "commit")
+        return False
+
+
+class FakeCursor:
+    """fetchで先頭から指定行数を返すサーバーサイドカーソル"""
+
+    def __init__(self, conn: "FakeConnection") -> None:
+        self.conn = conn
+
+    async def fetch(self, count: int, timeout=None) -> list[dict]:
+        self.conn.fetch_timeouts.append(timeout)
+        self.conn.fetched_limit = count
+        return self.conn.rows[:count]
+
+
+class FakeConnection:
+    """実行したSQLを記録し、failで指定した文を失敗させる接続"""
+
+    def __init__(self, fail=lambda sql: False, rows=None, fetch_error=None) -> None:
+        self.fail = fail
+        self.rows = rows or []
+        self.fetch_error = fetch_error
+        self.executed: list[str] = []
+        self.transactions: list[str] = []
+        self.fetch_timeouts: list[float | None] = []
+        self.fetched_limit: int | None = None
+        self.queries: list[tuple[str, tuple]] = []
+
+    def transaction(self, **_kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    async def execute(self, sql: str, *_args, **_kwargs) -> str:
+        self.executed.append(sql)
+        if self.fail(sql):
+            raise asyncpg.PostgresError(f"failed: {sql}")
+        return "OK"
+
+    async def fetch(self, sql: str, *args, timeout=None) -> list[dict]:
+        self.queries.append((sql, args))
+        self.fetch_timeouts.append(timeout)
+        if self.fetch_error:
+            raise self.fetch_error
+        return self.rows
+
+    async def cursor(self, _sql: str, *_args, timeout=None) -> FakeCursor:
+        if self.fetch_error:
+            raise self.fetch_error
+        return FakeCursor(self)
+
+
+def make_db(conn: FakeConnection) -> Database:
+    """常にconnを返すDatabase"""
+    db = Database()
+
+    @asynccontextmanager
+    async def acquire(schema=None):
+        yield conn
+
+    db.acquire = acquire  # type: ignore[method-assign]
+    return db
+
+
+class TestExecuteBatch:
+    """Database.execute_batchのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_statements_are_sent_in_one_round_trip(self):
+        """全文を1回のexecuteにまとめ、1トランザクションでコミットする"""
+        conn = FakeConnection()
+
+        await make_db(conn).execute_batch(
+            ["CREATE TABLE a (id int);", "  ", "INSERT INTO a VALUES (1)"]
+        )
+
+        assert conn.executed == ["CREATE TABLE a (id int)\n;\nINSERT INTO a VALUES (1)"]
+        assert conn.transactions == ["commit"]
+
+    @pytest.mark.asyncio
+    async def test_failed_statement_is_located_and_rolled_back(self):
+        """失敗した文の位置を返し、一括実行も再実行もロールバックする"""
+        conn = FakeConnection(fail=lambda sql: "bad" in sql)
+        statements = ["CREATE TABLE a (id int)", "INSERT INTO bad VALUES (1)", "X"]
+
+        with pytest.raises(DatabaseError) as exc_info:
+            await make_db(conn).execute_batch(statements)
+
+        assert exc_info.value.data == {
+            "statement_index": 1,
+            "statement": "INSERT INTO bad VALUES (1)",
+        }
+        # 失敗した文より後は再実行しない
+        assert conn.executed[1:] == statements[:2]
+        assert conn.transactions == ["rollback", "rollback"]
+
+    @pytest.mark.asyncio
+    async def test_replay_success_is_rolled_back_and_reported(self):
+        """一時的な失敗で再実行が成功しても、結果を残さず元のエラーを返す"""
+        batches = []
+
+        def fail_first_call(sql: str) -> bool:
+            batches.append(sql)
+            return len(batches) == 1
+
+        conn = FakeConnection(fail=fail_first_call)
+
+        with pytest.raises(DatabaseError) as exc_info:
+            await make_db(conn).execute_batch(["INSERT INTO a VALUES (1)", "SELECT 1"])
+
+        assert "failed" in exc_info.value.detail
+        assert exc_info.value.data is None
+        assert conn.transactions == ["rollback", "rollback"]
+
+
+class TestGuardedSelect:
+    """実行時間・行数を制限したSELECTのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_timeouts_on_server_and_client(self):
+        """statement_timeoutを設定し、クライアント側は猶予を足して待つ"""
+        conn = FakeConnection(rows=[{"id": 1}])
+
+        rows = await make_db(conn).execute_select("SELECT 1", query_timeout=2)
+
+        assert rows == [{"id": 1}]
+        assert conn.executed == ["SET LOCAL statement_timeout = 2000"]
+        assert conn.fetch_timeouts == [3.0]
+        assert conn.transactions == ["commit"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "error", [TimeoutError(), asyncpg.QueryCanceledError("canceling statement")]
+    )
+    async def test_timeout_is_reported(self, error):
+        """クライアント・サーバーどちらのタイムアウトもDB_TIMEOUT_ERROR"""
+        conn = FakeConnection(fetch_error=error)
+
+        with pytest.raises(DatabaseError) as exc_info:
+            await make_db(conn).execute_select("SELECT pg_sleep(10)", query_timeout=1)
+
+        assert exc_info.value.error_code == "DB_TIMEOUT_ERROR"
+        assert conn.transactions == ["rollback"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(("row_count", "truncated"), [(3, True), (2, False)])
+    async def test_bounded_select_reads_one_extra_row(self, row_count, truncated):
+        """max_rows + 1行だけ読み、超えた場合は打ち切りとして報告する"""
+        conn = FakeConnection(rows=[{"id": i} for i in range(row_count)])
+
+        rows, is_truncated = await make_db(conn).execute_bounded_select(
+            "SELECT id FROM t", max_rows=2
+        )
+
+        assert rows == [{"id": 0}, {"id": 1}]
+        assert is_truncated is truncated
+        assert conn.fetched_limit == 3
+
+
+class TestTableSchemas:
+    """テーブル構造の取得のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_columns_are_parsed_from_catalog_json(self):
+        """サーバー側で集約したJSONを解析し、外部キーでないカラムはキーを含めない"""
+        columns = [
+            {
+                "name": "id",
+                "type": "INTEGER",
+                "nullable": False,
+                "is_primary_key": True,
+                "foreign_key": None,
+            },
+            {
+                "name": "department_id",
+                "type": "INTEGER",
+                "nullable": True,
+                "is_primary_key": False,
+                "foreign_key": {"table": "departments", "column": "id"},
+            },
+        ]
+        conn = FakeConnection(
+            rows=[{"table_name": "employees", "columns": json.dumps(columns)}]
+        )
+
+        schemas = await make_db(conn).get_table_schemas("session_abc")
+
+        assert schemas == [
+            {
+                "table_name": "employees",
+                "columns": [
+                    {
+                        "name": "id",
+                        "type": "INTEGER",
+                        "nullable": False,
+                        "is_primary_key": True,
+                    },
+                    {
+                        "name": "department_id",
+                        "type": "INTEGER",
+                        "nullable": True,
+                        "is_primary_key": False,
+                        "foreign_key": {"table": "departments", "column": "id"},
+                    },
+                ],
+            }
+        ]
+        ((query, args),) = conn.queries
+        assert args == ("session_abc",)
+        assert "information_schema" not in query
+        for key in ("name", "type", "nullable", "is_primary_key", "foreign_key"):
+            assert f"'{key}'" in query
+
+    @pytest.mark.asyncio
+    async def test_empty_schema(self):
+        """テーブルがない場合は空のリスト"""
+        assert await make_db(FakeConnection()).get_table_schemas("session_abc") == []
+
+
+class TestResetSchema:
+    """スキーマのリセットのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_drop_and_create_in_one_transaction(self):
+        """DROPとCREATEを1往復・1トランザクションで実行する"""
+        conn = FakeConnection()
+
+        await make_db(conn).reset_schema("session_abc")
+
+        assert conn.executed == [
+            'DROP SCHEMA IF EXISTS "session_abc" CASCADE;\nCREATE SCHEMA "session_abc";'
+        ]
+        assert conn.transactions == ["commit"]
+
+    @pytest.mark.asyncio
+    async def test_failure_is_rolled_back(self):
+        """失敗した場合はロールバックしてDatabaseErrorを送出する"""
+        conn = FakeConnection(fail=lambda sql: True)
+
+        with pytest.raises(DatabaseError):
+            await make_db(conn).reset_schema("session_abc")
+
+        assert conn.transactions == ["rollback"]
+
+    @pytest.mark.asyncio
+    async def test_session_reset_invalidates_schema_cache(self):
+        """セッションスキーマのリセットでテーブル構造のキャッシュを無効化する"""
+        version = schema_cache.version("session_abc")
+
+        await DatabaseService(
+            make_db(FakeConnection()), "session_abc"
+        ).reset_session_schema()
+
+        assert schema_cache.version("session_abc") != version
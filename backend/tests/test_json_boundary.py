@@ -0,0 +1,116 @@
+"""
+JSON終端検出と早期終了のテスト
+"""
+
+import pytest
+
+from app.core.exceptions import LLMError
+from app.core.json_boundary import JsonBoundaryDetector
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+from app.services.llm_service import LLMService
+
+
+class TestJsonBoundaryDetector:
+    """JsonBoundaryDetectorのテスト"""
+
+    def test_detects_end_across_chunks(self):
+        """断片に分かれたオブジェクトの終端を検出"""
+        detector = JsonBoundaryDetector()
+        chunks = ["```json\n{", '"a": {"b": [1, ', "2]}", "}\n```\n以上です"]
+
+        results = [detector.feed(chunk) for chunk in chunks]
+
+        assert results[:3] == [None, None, None]
+        start, end = results[3]
+        assert detector.text[start:end] == '{"a": {"b": [1, 2]}}'
+
+    def test_braces_inside_strings(self):
+        """文字列内の括弧やエスケープされた引用符は無視"""
+        detector = JsonBoundaryDetector()
+        text = '{"sql": "SELECT \'}\' AS x", "note": "say \\"{\\""}'
+
+        assert detector.feed(text) == (0, len(text))
+
+    def test_continues_after_non_json_candidate(self):
+        """JSONでない候補の後も続きから探せる"""
+        detector = JsonBoundaryDetector()
+
+        first = detector.feed('置換は {name} を使います。{"ok": true}')
+        assert first is not None
+        assert detector.text[first[0] : first[1]] == "{name}"
+
+        second = detector.feed()
+        assert second is not None
+        assert detector.text[second[0] : second[1]] == '{"ok": true}'
+
+
+class FakeStreamingClient:
+    """ストリーミング応答を返すテスト用LLMクライアント"""
+
+    max_tokens = 100
+
+    def __init__(self, chunks: list[str]) -> None:
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    async def chat_completion_stream(self, _messages, response_schema=None):
+        try:
+            for chunk in self.chunks:
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+class TestRequestJson:
+    """LLMService._request_jsonのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_stops_stream_when_object_closes(self):
+        """オブジェクトが閉じた時点でストリームを閉じる"""
+        client = FakeStreamingClient(
+            ["```json\n", '{"theme": "社員管理"', "}", "\n```\n", "補足", "説明"]
+        )
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        result = await service._request_json([{"role": "user", "content": "hi"}])
+
+        assert result == {"theme": "社員管理"}
+        assert client.sent == 3
+        assert client.closed
+        assert metrics.counter("llm.early_stop.count") == 1
+        received = estimate_tokens('```json\n{"theme": "社員管理"}')
+        assert (
+            metrics.snapshot()["observations"]["llm.early_stop.received_tokens"]["sum"]
+            == received
+        )
+        assert metrics.counter("llm.early_stop.saved_tokens_upper_bound") == (
+            100 - received
+        )
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_full_text(self):
+        """オブジェクトが閉じないまま終わった場合は全体を修復して解析"""
+        client = FakeStreamingClient(['{"theme": ', '"途中で終了'])
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        result = await service._request_json([{"role": "user", "content": "hi"}])
+
+        assert result == {"theme": "途中で終了"}
+        assert metrics.counter("llm.early_stop.completed_without_stop") == 1
+        assert metrics.counter("llm.json_repair.unterminated_string") == 1
+
+    @pytest.mark.asyncio
+    async def test_unparseable_text_raises(self):
+        """JSONオブジェクトがない場合はLLMError"""
+        client = FakeStreamingClient(["JSONは", "ありません"])
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        with pytest.raises(LLMError):
+            await service._request_json([{"role": "user", "content": "hi"}])
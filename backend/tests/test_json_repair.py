@@ -0,0 +1,63 @@
+"""
+JSONの抽出と修復のテスト
+"""
+
+import pytest
+
+from app.core.json_repair import extract_json_object
+
+
+class TestExtractJsonObject:
+    """extract_json_objectのテスト"""
+
+    def test_valid_object_needs_no_repair(self):
+        """正しいJSONは修復せずに返す"""
+        assert extract_json_object('{"a": [1, {"b": "}"}]}') == (
+            {"a": [1, {"b": "}"}]},
+            [],
+        )
+
+    def test_object_embedded_in_prose(self):
+        """前置きの文章・コードフェンス・JSONでない括弧を読み飛ばす"""
+        text = '回答です {これは違う}\n```json\n{"a": 1}\n```\n補足 {"b": 2}'
+
+        assert extract_json_object(text) == ({"a": 1}, [])
+
+    def test_trailing_commas(self):
+        """閉じ括弧の直前のカンマを削除"""
+        parsed, repairs = extract_json_object('{"a": [1, 2, ],\n}')
+
+        assert parsed == {"a": [1, 2]}
+        assert repairs == ["trailing_comma"]
+
+    def test_smart_quotes_as_delimiters(self):
+        """区切りのスマートクォートは置換し、文字列内のものは残す"""
+        parsed, repairs = extract_json_object('{“theme”: “社員”, "q": "“引用”"}')
+
+        assert parsed == {"theme": "社員", "q": "“引用”"}
+        assert repairs == ["smart_quotes"]
+
+    def test_raw_newlines_in_strings(self):
+        """文字列内の改行をエスケープ"""
+        parsed, repairs = extract_json_object('{"sql": "SELECT *\n  FROM t"}')
+
+        assert parsed == {"sql": "SELECT *\n  FROM t"}
+        assert repairs == ["control_character"]
+
+    def test_truncated_output(self):
+        """途中で終わった文字列と括弧を閉じる"""
+        parsed, repairs = extract_json_object('{"a": ["x", "yz')
+
+        assert parsed == {"a": ["x", "yz"]}
+        assert repairs == ["unterminated_string", "unclosed_bracket"]
+
+    def test_unclosed_brace_in_prose_does_not_hide_object(self):
+        """対応しない "{" の後にあるオブジェクトも見つける"""
+        assert extract_json_object('{ 補足 { "a": 1}')[0] == {"a": 1}
+
+    def test_no_object_raises(self):
+        """オブジェクトがない場合はValueError"""
+        with pytest.raises(ValueError):
+            extract_json_object('["配列だけ"]')
+        with pytest.raises(ValueError):
+            extract_json_object('{"a": }')
@@ -0,0 +1,383 @@
+"""
+LLMクライアントのテスト
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.core.circuit_breaker import HALF_OPEN
+from app.core.config import settings
+from app.core.error_codes import LLM_CIRCUIT_OPEN
+from app.core.exceptions import LLMError
+from app.core.llm_client import LLMClient
+from app.core.metrics import metrics
+
+
+def chat_response(content: str) -> dict:
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+class TestLLMClientPool:
+    """共有HTTPクライアントのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_start_is_idempotent_and_close_releases(self):
+        """startは1つのクライアントだけを作成し、closeで解放する"""
+        client = LLMClient()
+
+        await client.start()
+        first = client._client
+        await client.start()
+
+        assert first is not None
+        assert client._client is first
+
+        await client.close()
+        assert client._client is None
+        assert first.is_closed
+
+    @pytest.mark.asyncio
+    async def test_requests_share_one_client(self):
+        """複数回の呼び出しで同じクライアントを使い回す"""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json=chat_response("ok"))
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        shared = client._client
+
+        for _ in range(2):
+            response = await client.chat_completion([{"role": "user", "content": "hi"}])
+            assert client.extract_content(response) == "ok"
+
+        assert client._client is shared
+        assert len(requests) == 2
+        assert metrics.counter("llm_http.requests") == 2
+
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_lazy_start_outside_lifespan(self):
+        """lifespan外で使われた場合は初回に作成する"""
+        client = LLMClient()
+
+        shared = await client._get_client()
+
+        assert await client._get_client() is shared
+        await client.close()
+
+
+class TestChatCompletionStream:
+    """ストリーミング呼び出しのテスト"""
+
+    @staticmethod
+    def make_client(handler) -> LLMClient:
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return client
+
+    @pytest.mark.asyncio
+    async def test_yields_delta_contents(self):
+        """SSEのdeltaを順に返し、[DONE]で終了する"""
+        body = (
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": "よい"}}]}\n\n'
+            ": keep-alive\n\n"
+            'data: {"choices": [{"delta": {"content": "回答です"}}]}\n\n'
+            "data: [DONE]\n\n"
+        )
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(
+                200, text=body, headers={"content-type": "text/event-stream"}
+            )
+
+        client = self.make_client(handler)
+        chunks = [
+            text
+            async for text in client.chat_completion_stream(
+                [{"role": "user", "content": "hi"}]
+            )
+        ]
+
+        assert chunks == ["よい", "回答です"]
+        assert b'"stream":true' in requests[0].content.replace(b" ", b"")
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_error_status_raises(self):
+        """200以外のステータスはLLMError"""
+        client = self.make_client(lambda request: httpx.Response(503, text="busy"))
+
+        with pytest.raises(LLMError) as exc_info:
+            async for _ in client.chat_completion_stream(
+                [{"role": "user", "content": "hi"}]
+            ):
+                pass
+
+        assert exc_info.value.detail == "busy"
+        await client.close()
+
+
+class TestRetryAndCircuitBreaker:
+    """リトライとサーキットブレーカーのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_retries_server_errors_with_backoff(self, monkeypatch):
+        """5xxはバックオフしてリトライする"""
+        statuses = iter([503, 200])
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+
+        monkeypatch.setattr("app.core.llm_client.asyncio.sleep", fake_sleep)
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            status = next(statuses)
+            if status == 200:
+                return httpx.Response(200, json=chat_response("ok"))
+            return httpx.Response(status, text="loading model")
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        response = await client.chat_completion([{"role": "user", "content": "hi"}])
+
+        assert client.extract_content(response) == "ok"
+        assert len(delays) == 1
+        assert 0 <= delays[0] <= 0.5
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self):
+        """4xxはリトライしない"""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(400, text="bad request")
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(LLMError):
+            await client.chat_completion([{"role": "user", "content": "hi"}])
+
+        assert len(calls) == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self):
+        """ブレーカーがopenの間はLLMを呼ばずに503で失敗する"""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(200, json=chat_response("ok"))
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        breaker = client.router.backends[0].breaker
+        for _ in range(breaker.min_calls):
+            breaker.record_failure()
+
+        with pytest.raises(LLMError) as exc_info:
+            await client.chat_completion([{"role": "user", "content": "hi"}])
+
+        assert exc_info.value.error_code == LLM_CIRCUIT_OPEN
+        assert exc_info.value.status_code == 503
+        assert calls == []
+        await client.close()
+
+
+class TestHealthCheck:
+    """死活確認のテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_probes_model_list_without_inference(self):
+        """推論ではなくGET /modelsで確認する"""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json={"data": [{"id": "model"}]})
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        assert await client.check_health() is True
+        assert [(r.method, r.url.path) for r in requests] == [("GET", "/v1/models")]
+        assert client.cached_health() is True
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_result_is_cached_within_ttl(self):
+        """TTL内は再確認せずキャッシュした結果を返す"""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(503, text="loading")
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        assert await client.check_health() is False
+        assert await client.check_health() is False
+
+        assert len(requests) == 1
+        assert metrics.counter("llm_health.cache_hits") == 1
+        assert metrics.counter("llm_backend.0.probe_failures") == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status", [200, 503])
+    async def test_probe_does_not_change_breaker(self, status, fake_clock):
+        """確認の結果は回復待ちのブレーカーを閉じも開き直しもしない"""
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(status, json={"data": [{"id": "model"}]})
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        breaker = client.router.backends[0].breaker
+        breaker._clock = fake_clock
+        for _ in range(breaker.min_calls):
+            breaker.record_failure()
+        fake_clock.now = breaker.recovery_timeout
+        assert breaker.state == HALF_OPEN
+
+        await client.check_health()
+
+        assert breaker.state == HALF_OPEN
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_stale_result_refreshes_in_background(self, monkeypatch):
+        """期限切れの場合は前回の結果を返しつつバックグラウンドで再確認する"""
+        statuses = iter([503, 200])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(next(statuses), json={"data": []})
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        assert await client.check_health() is False
+
+        monkeypatch.setattr("app.core.config.settings.LLM_HEALTH_CACHE_TTL", 0.0)
+        assert await client.check_health() is False
+        assert client._health_refresh is not None
+        await client._health_refresh
+
+        assert client.cached_health() is True
+        await client.close()
+
+
+class TestOllamaNativeAPI:
+    """OllamaのネイティブAPI(/api/chat)のテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @staticmethod
+    def make_client(handler) -> LLMClient:
+        client = LLMClient()
+        client.ollama_native = True
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return client
+
+    @pytest.mark.asyncio
+    async def test_keeps_model_loaded_and_converts_response(self):
+        """keep_alive付きで/api/chatに送り、応答をOpenAI互換の形式に変換する"""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(
+                200,
+                json={
+                    "message": {"role": "assistant", "content": "ok"},
+                    "done": True,
+                    "prompt_eval_count": 12,
+                    "prompt_eval_duration": 3_000_000,
+                },
+            )
+
+        client = self.make_client(handler)
+        response = await client.chat_completion([{"role": "user", "content": "hi"}])
+
+        assert client.extract_content(response) == "ok"
+        assert requests[0].url.path.endswith("/api/chat")
+        assert "/v1/" not in requests[0].url.path
+        payload = json.loads(requests[0].content)
+        assert payload["keep_alive"] == settings.LLM_OLLAMA_KEEP_ALIVE
+        assert "num_predict" in payload["options"]
+        observations = metrics.snapshot()["observations"]
+        assert observations["llm.ollama.prompt_eval_tokens"]["sum"] == 12
+        assert observations["llm.ollama.prompt_eval_ms"]["sum"] == 3
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_stream_reads_ndjson(self):
+        """NDJSONの行を順に返し、done=trueで終了する"""
+        body = (
+            '{"message": {"content": "よい"}, "done": false}\n'
+            '{"message": {"content": "回答です"}, "done": false}\n'
+            '{"message": {"content": ""}, "done": true, "prompt_eval_count": 5}\n'
+        )
+        client = self.make_client(lambda request: httpx.Response(200, text=body))
+
+        chunks = [
+            text
+            async for text in client.chat_completion_stream(
+                [{"role": "user", "content": "hi"}]
+            )
+        ]
+
+        assert chunks == ["よい", "回答です"]
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_stream_error_line_raises(self):
+        """ストリーム途中のエラー行はLLMError"""
+        body = '{"error": "model not found"}\n'
+        client = self.make_client(lambda request: httpx.Response(200, text=body))
+
+        with pytest.raises(LLMError) as exc_info:
+            async for _ in client.chat_completion_stream(
+                [{"role": "user", "content": "hi"}]
+            ):
+                pass
+
+        assert "model not found" in exc_info.value.detail
+        await client.close()
+
+    def test_openai_payload_requests_prompt_cache(self):
+        """OpenAI互換APIではcache_promptを付ける"""
+        client = LLMClient()
+        client.ollama_native = False
+
+        payload = client._chat_payload([], None, None, stream=False)
+
+        assert payload.get("cache_prompt", False) == settings.LLM_CACHE_PROMPT
@@ -0,0 +1,132 @@
+"""
+LLMバックエンド振り分けのテスト
+"""
+
+import httpx
+import pytest
+
+from app.core.circuit_breaker import HALF_OPEN, OPEN
+from app.core.error_codes import LLM_CIRCUIT_OPEN
+from app.core.exceptions import LLMError
+from app.core.llm_client import LLMClient
+from app.core.llm_router import LLMRouter
+from app.core.metrics import metrics
+
+URLS = ["http://llm-a:8080/v1", "http://llm-b:8080/v1"]
+
+
+def _eject(backend) -> None:
+    """バックエンドのブレーカーをopenにする"""
+    for _ in range(backend.breaker.min_calls):
+        backend.breaker.record_failure()
+
+
+class TestLLMRouter:
+    """LLMRouterのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, fake_clock):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.clock = fake_clock
+        self.router = LLMRouter(URLS, clock=self.clock)
+        self.a, self.b = self.router.backends
+
+    def test_requires_endpoint(self):
+        """URLが空ならエラー"""
+        with pytest.raises(ValueError):
+            LLMRouter([])
+
+    def test_selects_least_outstanding(self):
+        """処理中のリクエストが少ないバックエンドを選ぶ"""
+        self.a.begin()
+
+        assert self.router.select() is self.b
+
+    def test_ties_broken_by_latency(self):
+        """処理中の件数が同じなら応答時間の短いバックエンドを選ぶ"""
+        self.a.latency_ms = 900.0
+        self.b.latency_ms = 100.0
+
+        assert self.router.select() is self.b
+
+    def test_records_latency_and_errors(self):
+        """バックエンドごとに応答時間とエラー数を記録"""
+        self.a.end(self.a.begin(), success=True)
+        self.a.end(self.a.begin(), success=False)
+
+        assert self.a.outstanding == 0
+        assert self.a.latency_ms is not None
+        assert metrics.counter("llm_backend.0.requests") == 2
+        assert metrics.counter("llm_backend.0.errors") == 1
+        summary = metrics.snapshot()["observations"]["llm_backend.0.latency_ms"]
+        assert summary["count"] == 2
+
+    def test_exclude_prefers_other_backends(self):
+        """失敗したバックエンドは他に候補があれば避ける"""
+        assert self.router.select(exclude={self.a.url}) is self.b
+        assert self.router.select(exclude={self.a.url, self.b.url}) is self.a
+
+    def test_ejects_and_readmits_backend(self):
+        """失敗が続いたバックエンドを外し、回復待ち後の試験呼び出しで復帰させる"""
+        _eject(self.a)
+        self.b.begin()
+
+        assert self.a.breaker.state == OPEN
+        assert self.router.select() is self.b
+
+        self.clock.now = self.a.breaker.recovery_timeout
+        assert self.a.breaker.state == HALF_OPEN
+        probe = self.router.select()
+        assert probe is self.a
+        probe.end(probe.begin(), success=True)
+
+        assert self.a.breaker.state == "closed"
+
+    def test_all_open_raises(self):
+        """全バックエンドが外れていれば503"""
+        _eject(self.a)
+        _eject(self.b)
+
+        with pytest.raises(LLMError) as exc_info:
+            self.router.select()
+
+        assert exc_info.value.error_code == LLM_CIRCUIT_OPEN
+        assert exc_info.value.status_code == 503
+
+
+class TestLLMClientFailover:
+    """複数バックエンドでのLLMClientのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_retry_goes_to_other_backend(self, monkeypatch):
+        """失敗したバックエンドを避けて別のバックエンドで再試行する"""
+        monkeypatch.setattr("app.core.config.settings.LLM_API_URLS", URLS)
+
+        async def fake_sleep(_delay):
+            pass
+
+        monkeypatch.setattr("app.core.llm_client.asyncio.sleep", fake_sleep)
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if request.url.host == "llm-a":
+                return httpx.Response(503, text="loading model")
+            return httpx.Response(
+                200, json={"choices": [{"message": {"content": "ok"}}]}
+            )
+
+        client = LLMClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        response = await client.chat_completion([{"role": "user", "content": "hi"}])
+
+        assert client.extract_content(response) == "ok"
+        assert hosts == ["llm-a", "llm-b"]
+        assert metrics.counter("llm_backend.0.errors") == 1
+        await client.close()
@@ -0,0 +1,123 @@
+"""
+LLMスケジューラのテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.error_codes import LLM_OVERLOADED
+from app.core.exceptions import LLMError
+from app.core.llm_scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    NORMAL,
+    LLMScheduler,
+    current_priority,
+    llm_priority,
+)
+from app.core.metrics import metrics
+
+
+class TestLLMScheduler:
+    """LLMSchedulerのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.scheduler = LLMScheduler(
+            max_concurrency=1,
+            queue_limits={INTERACTIVE: 5, NORMAL: 5, BACKGROUND: 1},
+        )
+
+    async def _hold(self, release: asyncio.Event, priority: str, order: list[str]):
+        async with self.scheduler.slot(priority):
+            order.append(priority)
+            await release.wait()
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrency_and_runs_by_priority(self):
+        """上限を超えた呼び出しは待機し、優先度の高い順に実行"""
+        release = asyncio.Event()
+        order: list[str] = []
+
+        first = asyncio.create_task(self._hold(release, NORMAL, order))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(self._hold(release, priority, order))
+            for priority in (BACKGROUND, NORMAL, INTERACTIVE)
+        ]
+        await asyncio.sleep(0)
+
+        assert order == [NORMAL]
+        assert self.scheduler.snapshot() == {
+            "active": 1,
+            INTERACTIVE: 1,
+            NORMAL: 1,
+            BACKGROUND: 1,
+        }
+
+        release.set()
+        await asyncio.gather(first, *waiters)
+
+        assert order == [NORMAL, INTERACTIVE, NORMAL, BACKGROUND]
+        assert self.scheduler.snapshot()["active"] == 0
+        summary = metrics.snapshot()["observations"]["llm_scheduler.wait_ms"]
+        assert summary["count"] == 4
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_is_full(self):
+        """優先度ごとの待ち行列が上限に達したら503で拒否"""
+        release = asyncio.Event()
+        order: list[str] = []
+
+        first = asyncio.create_task(self._hold(release, NORMAL, order))
+        queued = asyncio.create_task(self._hold(release, BACKGROUND, order))
+        await asyncio.sleep(0)
+
+        with pytest.raises(LLMError) as exc_info:
+            async with self.scheduler.slot(BACKGROUND):
+                pass
+
+        assert exc_info.value.error_code == LLM_OVERLOADED
+        assert exc_info.value.status_code == 503
+        assert metrics.counter("llm_scheduler.background.rejected") == 1
+
+        release.set()
+        await asyncio.gather(first, queued)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """待機中にキャンセルされた呼び出しは待ち行列から外れる"""
+        release = asyncio.Event()
+        order: list[str] = []
+
+        first = asyncio.create_task(self._hold(release, NORMAL, order))
+        waiter = asyncio.create_task(self._hold(release, NORMAL, order))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert self.scheduler.snapshot()[NORMAL] == 0
+
+        release.set()
+        await first
+        assert self.scheduler.snapshot()["active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unlimited_when_concurrency_is_zero(self):
+        """同時実行数0以下では制限しない"""
+        scheduler = LLMScheduler(max_concurrency=0, queue_limits={})
+        async with scheduler.slot(NORMAL), scheduler.slot(NORMAL):
+            assert scheduler.snapshot()["active"] == 2
+
+    def test_priority_context(self):
+        """llm_priorityでブロック内の既定の優先度を設定"""
+        assert current_priority() == NORMAL
+        with llm_priority(BACKGROUND):
+            assert current_priority() == BACKGROUND
+        assert current_priority() == NORMAL
+
+        with pytest.raises(ValueError), llm_priority("urgent"):
+            pass
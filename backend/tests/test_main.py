@@ -96,6 +96,48 @@ class TestHealthEndpoint:
             assert isinstance(data["services"]["llm"], bool)
 
 
+class TestProbeEndpoints:
+    """liveness/readinessエンドポイントのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        self.client = TestClient(app)
+
+    @patch("app.core.db.db.check_health", new_callable=AsyncMock)
+    def test_liveness_checks_nothing(self, mock_check_health):
+        """livenessは依存サービスを確認しない"""
+        response = self.client.get("/api/health/live")
+
+        assert response.status_code == 200
+        assert response.json()["status"] == "alive"
+        mock_check_health.assert_not_called()
+
+    @patch("app.core.llm_client.llm_client.check_health", new_callable=AsyncMock)
+    @patch("app.core.db.db.check_health", new_callable=AsyncMock)
+    def test_readiness_does_not_probe_llm(self, mock_db_health, mock_llm_health):
+        """readinessはデータベースのみ確認し、LLMは直近の結果を返す"""
+        mock_db_health.return_value = True
+
+        response = self.client.get("/api/health/ready")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["services"]["database"] is True
+        assert "llm" in data["services"]
+        mock_llm_health.assert_not_called()
+
+    @patch("app.core.db.db.check_health", new_callable=AsyncMock)
+    def test_readiness_fails_without_database(self, mock_check_health):
+        """データベースに接続できなければ503"""
+        mock_check_health.return_value = False
+
+        response = self.client.get("/api/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "not_ready"
+
+
 class TestErrorHandling:
     """エラーハンドリングのテスト"""
 
@@ -0,0 +1,111 @@
+"""
+問題候補の並行生成のテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.exceptions import LLMError
+from app.core.metrics import metrics
+from app.services.problem_generator import race_problem_candidates
+
+
+def _problem(sql: str, rows: int) -> dict:
+    return {
+        "difficulty": "easy",
+        "correct_sql": sql,
+        "hint": None,
+        "expected_result": [{"id": i} for i in range(rows)],
+        "truncated": False,
+    }
+
+
+def _factory(outcomes: list[tuple[float, dict | Exception]]):
+    """候補ごとに(所要秒数, 結果または例外)を順に返す生成関数"""
+    queue = list(outcomes)
+    cancelled = []
+
+    async def factory():
+        delay, outcome = queue.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(outcome)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return factory, cancelled
+
+
+class TestRaceProblemCandidates:
+    """race_problem_candidatesのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_first_servable_candidate_wins(self):
+        """不適格な候補を飛ばし、最初に条件を満たした候補を返して残りを打ち切る"""
+        slow = _problem("SELECT slow", rows=5)
+        factory, cancelled = _factory(
+            [
+                (0, _problem("SELECT many", rows=50)),
+                (0.01, _problem("SELECT ok", rows=4)),
+                (10, slow),
+            ]
+        )
+
+        problem = await race_problem_candidates(factory, 3)
+        await asyncio.sleep(0)
+
+        assert problem["correct_sql"] == "SELECT ok"
+        assert cancelled == [slow]
+        assert metrics.counter("problem_candidates.rejected") == 1
+        assert metrics.counter("problem_candidates.cancelled") == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_candidates_are_skipped(self):
+        """失敗した候補は無視する"""
+        factory, _ = _factory(
+            [
+                (0, LLMError(message="invalid", error_code="E")),
+                (0.01, _problem("SELECT ok", rows=3)),
+            ]
+        )
+
+        problem = await race_problem_candidates(factory, 2)
+
+        assert problem["correct_sql"] == "SELECT ok"
+        assert metrics.counter("problem_candidates.failed") == 1
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_unservable_candidate(self):
+        """条件を満たす候補がなければ実行できた最初の候補を返す"""
+        factory, _ = _factory(
+            [
+                (0.01, LLMError(message="invalid", error_code="E")),
+                (0, _problem("SELECT one", rows=1)),
+            ]
+        )
+
+        problem = await race_problem_candidates(factory, 2)
+
+        assert problem["correct_sql"] == "SELECT one"
+        assert metrics.counter("problem_candidates.unservable") == 1
+
+    @pytest.mark.asyncio
+    async def test_raises_when_all_candidates_fail(self):
+        """すべての候補が失敗したら最初の失敗を送出する"""
+        first = LLMError(message="first", error_code="E")
+        factory, _ = _factory(
+            [(0, first), (0.01, LLMError(message="second", error_code="E"))]
+        )
+
+        with pytest.raises(LLMError) as exc_info:
+            await race_problem_candidates(factory, 2)
+
+        assert exc_info.value is first
@@ -0,0 +1,173 @@
+"""
+問題の事前生成プールのテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.metrics import metrics
+from app.services.problem_pool import ProblemPool
+
+TABLES = [{"table_name": "users", "columns": [{"name": "id", "type": "integer"}]}]
+
+
+def _problem(sql: str, rows: int = 3, difficulty: str = "easy") -> dict:
+    return {
+        "difficulty": difficulty,
+        "correct_sql": sql,
+        "hint": None,
+        "expected_result": [{"id": i} for i in range(rows)],
+        "truncated": False,
+    }
+
+
+def _factory(problems: list[dict]):
+    """用意した問題を順に返す生成関数"""
+    queue = list(problems)
+
+    async def factory():
+        if not queue:
+            raise RuntimeError("no more problems")
+        return queue.pop(0)
+
+    return factory
+
+
+async def _drain() -> None:
+    """補充タスクを最後まで進める"""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class TestProblemPool:
+    """ProblemPoolのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.pool = ProblemPool(size=2, max_schemas=10)
+
+    @pytest.mark.asyncio
+    async def test_refill_then_pop(self):
+        """補充した問題を取り出せる"""
+        self.pool.request_refill(
+            "s1", TABLES, _factory([_problem("SELECT 1"), _problem("SELECT 2")])
+        )
+        await _drain()
+
+        assert self.pool.depth() == 2
+        assert self.pool.pop("s1", TABLES)["correct_sql"] == "SELECT 1"
+        assert metrics.counter("problem_pool.hits") == 1
+        assert metrics.gauge("problem_pool.depth") == 1
+
+    @pytest.mark.asyncio
+    async def test_pop_misses_for_other_schema_or_structure(self):
+        """別スキーマ・別のテーブル構造の問題は取り出さない"""
+        self.pool.request_refill("s1", TABLES, _factory([_problem("SELECT 1")] * 2))
+        await _drain()
+
+        assert self.pool.pop("s2", TABLES) is None
+        assert self.pool.pop("s1", [{"table_name": "orders"}]) is None
+        assert metrics.counter("problem_pool.misses") == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_unservable_and_duplicate_problems(self):
+        """行数が範囲外の問題や出題済みの問題は格納しない"""
+        self.pool.note_served("s1", TABLES, "SELECT served")
+        factory = _factory(
+            [
+                _problem("SELECT many", rows=50),
+                _problem("SELECT served"),
+                _problem("SELECT ok"),
+            ]
+        )
+        self.pool.request_refill("s1", TABLES, factory)
+        await _drain()
+
+        assert self.pool.depth() == 1
+        assert self.pool.pop("s1", TABLES)["correct_sql"] == "SELECT ok"
+        assert metrics.counter("problem_pool.rejected") == 2
+
+    @pytest.mark.asyncio
+    async def test_refill_stops_after_repeated_failures(self):
+        """生成失敗が続いたら補充を打ち切る"""
+        self.pool.request_refill("s1", TABLES, _factory([]))
+        await _drain()
+
+        assert self.pool.depth() == 0
+        assert metrics.counter("problem_pool.refill_failures") == 3
+
+    @pytest.mark.asyncio
+    async def test_single_refill_task_per_key(self):
+        """同じキーの補充は同時に1つだけ"""
+        calls = 0
+        release = asyncio.Event()
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return _problem(f"SELECT {calls}")
+
+        self.pool.request_refill("s1", TABLES, factory)
+        self.pool.request_refill("s1", TABLES, factory)
+        await asyncio.sleep(0)
+        assert calls == 1
+
+        release.set()
+        await _drain()
+        assert self.pool.depth() == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_discards_pool_and_in_flight_problem(self):
+        """スキーマの無効化で蓄えた問題と生成中の問題を破棄"""
+        self.pool.request_refill("s1", TABLES, _factory([_problem("SELECT 1")] * 2))
+        await _drain()
+
+        release = asyncio.Event()
+
+        async def slow_factory():
+            await release.wait()
+            return _problem("SELECT stale")
+
+        self.pool.pop("s1", TABLES)
+        self.pool.request_refill("s1", TABLES, slow_factory)
+        await asyncio.sleep(0)
+        self.pool.invalidate("s1")
+        release.set()
+        await _drain()
+
+        assert self.pool.depth() == 0
+        assert metrics.counter("problem_pool.invalidations") == 1
+
+    @pytest.mark.asyncio
+    async def test_schema_cache_invalidation_clears_global_pool(self):
+        """SchemaCacheの無効化通知でグローバルプールも破棄される"""
+        from app.core.schema_cache import schema_cache
+        from app.services.problem_pool import problem_pool
+
+        problem_pool.request_refill(
+            "s_global", TABLES, _factory([_problem("SELECT 1"), _problem("SELECT 2")])
+        )
+        await _drain()
+        assert problem_pool.depth() == 2
+
+        schema_cache.invalidate("s_global")
+        assert problem_pool.depth() == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_refills(self):
+        """停止時に補充タスクをキャンセルしてプールを空にする"""
+        never = asyncio.Event()
+
+        async def factory():
+            await never.wait()
+            return _problem("SELECT 1")
+
+        self.pool.request_refill("s1", TABLES, factory)
+        await asyncio.sleep(0)
+        await self.pool.stop()
+
+        assert self.pool.depth() == 0
+        assert not self.pool._refills
@@ -0,0 +1,79 @@
+"""
+プロンプト生成のテスト
+"""
+
+from app.services.prompt_generator import PromptGenerator
+
+SCHEMAS = [
+    {
+        "table_name": "departments",
+        "columns": [
+            {
+                "name": "id",
+                "type": "integer",
+                "nullable": False,
+                "is_primary_key": True,
+            },
+            {"name": "name", "type": "text", "nullable": False},
+        ],
+    },
+    {
+        "table_name": "employees",
+        "columns": [
+            {
+                "name": "id",
+                "type": "integer",
+                "nullable": False,
+                "is_primary_key": True,
+            },
+            {
+                "name": "department_id",
+                "type": "integer",
+                "nullable": True,
+                "foreign_key": {"table": "departments", "column": "id"},
+            },
+        ],
+    },
+]
+
+
+class TestStaticPrefix:
+    """KVキャッシュを再利用できるよう、可変部分を後ろに置くことのテスト"""
+
+    def test_system_message_does_not_depend_on_inputs(self):
+        """システムメッセージは入力によらず同一で、入力はユーザーメッセージに入る"""
+        first = PromptGenerator.create_problem_generation_prompt(SCHEMAS[:1])
+        second = PromptGenerator.create_problem_generation_prompt(SCHEMAS)
+
+        assert first[0] == second[0]
+        assert "employees" not in second[0]["content"]
+        assert "employees" in second[1]["content"]
+
+    def test_answer_check_system_message_is_static(self):
+        """回答チェックのシステムメッセージも結果によらず同一"""
+        first = PromptGenerator.create_answer_check_prompt(
+            "SELECT 1", [{"a": 1}], [{"a": 1}], SCHEMAS
+        )
+        second = PromptGenerator.create_answer_check_prompt(
+            "SELECT 2", [{"a": 2}], [{"a": 3}], []
+        )
+
+        assert first[0] == second[0]
+        assert first[1] != second[1]
+
+
+class TestFormatTableSchemas:
+    """テーブル構造の整形のテスト"""
+
+    def test_includes_constraints(self):
+        """型・主キー・NOT NULL・外部キーを示す"""
+        formatted = PromptGenerator._format_table_schemas(SCHEMAS)
+
+        assert "テーブル: departments" in formatted
+        assert "  - id: integer PRIMARY KEY" in formatted
+        assert "  - name: text NOT NULL" in formatted
+        assert "  - department_id: integer REFERENCES departments(id)" in formatted
+
+    def test_empty(self):
+        """テーブルがない場合"""
+        assert PromptGenerator._format_table_schemas([]) == "(テーブル情報なし)"
@@ -0,0 +1,86 @@
+"""
+LLM応答キャッシュのテスト
+"""
+
+import pytest
+
+from app.core.metrics import metrics
+from app.core.response_cache import ResponseCache, cache_key
+
+
+MESSAGES = [{"role": "user", "content": "採点してください"}]
+
+
+class TestCacheKey:
+    """キャッシュキーのテスト"""
+
+    def test_key_depends_on_model_temperature_and_messages(self):
+        """モデル・温度・メッセージのいずれかが違えば別のキー"""
+        base = cache_key("check_answer", "model-a", 0.7, MESSAGES)
+
+        assert base == cache_key("check_answer", "model-a", 0.7, list(MESSAGES))
+        assert base != cache_key("check_answer", "model-b", 0.7, MESSAGES)
+        assert base != cache_key("check_answer", "model-a", 0.2, MESSAGES)
+        assert base != cache_key(
+            "check_answer", "model-a", 0.7, [{"role": "user", "content": "別"}]
+        )
+        assert base.startswith("check_answer:")
+
+
+class TestResponseCache:
+    """ResponseCacheのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, fake_clock):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.clock = fake_clock
+        self.cache = ResponseCache(max_entries=2, max_bytes=1024, clock=self.clock)
+
+    @pytest.mark.asyncio
+    async def test_hit_returns_independent_copy(self):
+        """ヒット時は格納時と同じ内容の別オブジェクトを返す"""
+        await self.cache.put("k", "check_answer", {"feedback": "良い"}, ttl=60)
+
+        first = await self.cache.get("k", "check_answer")
+        first["feedback"] = "changed"
+
+        assert await self.cache.get("k", "check_answer") == {"feedback": "良い"}
+        assert metrics.counter("llm_cache.hits") == 2
+        assert metrics.counter("llm_cache.check_answer.hits") == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_a_miss(self):
+        """TTLを過ぎたエントリはミス"""
+        await self.cache.put("k", "check_answer", {"a": 1}, ttl=60)
+        self.clock.now = 60.0
+
+        assert await self.cache.get("k", "check_answer") is None
+        assert metrics.counter("llm_cache.expirations") == 1
+        assert metrics.gauge("llm_cache.entries") == 0
+        assert metrics.gauge("llm_cache.hit_rate") == 0.0
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_entries(self):
+        """件数上限を超えると最も長く使われていないエントリを追い出す"""
+        await self.cache.put("a", "t", {"v": "a"}, ttl=60)
+        await self.cache.put("b", "t", {"v": "b"}, ttl=60)
+        await self.cache.get("a", "t")
+        await self.cache.put("c", "t", {"v": "c"}, ttl=60)
+
+        assert await self.cache.get("b", "t") is None
+        assert await self.cache.get("a", "t") == {"v": "a"}
+        assert await self.cache.get("c", "t") == {"v": "c"}
+        assert metrics.counter("llm_cache.evictions") == 1
+
+    @pytest.mark.asyncio
+    async def test_eviction_by_bytes(self):
+        """バイト数上限を超えると追い出し、上限より大きい値は格納しない"""
+        await self.cache.put("a", "t", {"v": "x" * 600}, ttl=60)
+        await self.cache.put("b", "t", {"v": "y" * 600}, ttl=60)
+
+        assert await self.cache.get("a", "t") is None
+        assert metrics.gauge("llm_cache.bytes") <= 1024
+
+        await self.cache.put("huge", "t", {"v": "z" * 2000}, ttl=60)
+        assert await self.cache.get("huge", "t") is None
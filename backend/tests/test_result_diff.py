@@ -0,0 +1,108 @@
+"""
+実行結果の差分要約のテスト
+"""
+
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+from app.services.prompt_generator import PromptGenerator
+from app.services.result_diff import summarize_result_diff
+
+
+def _rows(count: int, offset: int = 0) -> list[dict]:
+    return [{"name": f"社員{i}", "salary": 1000 + i} for i in range(offset, count)]
+
+
+class TestEstimateTokens:
+    """トークン数の見積もりのテスト"""
+
+    def test_ascii_and_japanese(self):
+        """英数字は4文字で1トークン、日本語は1文字1トークン"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+        assert estimate_tokens("社員") == 2
+
+
+class TestSummarizeResultDiff:
+    """summarize_result_diffのテスト"""
+
+    def test_identical_results_show_no_rows(self):
+        """一致している場合は行を含めない(行の順序は無視)"""
+        rows = _rows(5)
+
+        summary = summarize_result_diff(list(reversed(rows)), rows, 500)
+
+        assert "一致 5" in summary
+        assert "すべて期待結果と一致" in summary
+        assert "社員" not in summary
+
+    def test_only_differing_rows_are_listed(self):
+        """一方にしかない行だけを示す"""
+        expected = _rows(5)
+        user = _rows(4) + [{"name": "部外者", "salary": 1}]
+
+        summary = summarize_result_diff(user, expected, 500)
+
+        assert "行数: 学習者 5 / 期待 5 (共通の列で一致 4)" in summary
+        assert "期待結果にあって学習者の結果にない行 (1)" in summary
+        assert "社員4 | 1004" in summary
+        assert "学習者の結果にあって期待結果にない行 (1)" in summary
+        assert "部外者 | 1" in summary
+        assert "社員0" not in summary
+
+    def test_duplicate_rows_are_counted(self):
+        """重複行は超過分だけを差分とする"""
+        expected = _rows(2)
+        user = expected + [expected[0]]
+
+        summary = summarize_result_diff(user, expected, 500)
+
+        assert "学習者の結果にあって期待結果にない行 (1)" in summary
+        assert "期待結果にあって" not in summary
+
+    def test_missing_columns_show_expected_shape(self):
+        """列が不足している場合は期待結果の列を示す"""
+        expected = _rows(3)
+        user = [{"name": row["name"]} for row in expected]
+
+        summary = summarize_result_diff(user, expected, 500)
+
+        assert "不足している列: salary" in summary
+        assert "name | salary" in summary
+
+    def test_no_common_columns(self):
+        """共通の列がない場合は両方の結果を示す"""
+        summary = summarize_result_diff([{"x": 1}], [{"y": 2}], 500)
+
+        assert "期待結果 (1)" in summary
+        assert "学習者の結果 (1)" in summary
+
+    def test_stays_within_budget(self):
+        """結果の行数によらずトークン数の上限に収める"""
+        expected = _rows(1000)
+        user = _rows(2000, offset=1000)
+
+        summary = summarize_result_diff(user, expected, 300)
+
+        assert estimate_tokens(summary) <= 300
+        assert "行省略" in summary
+
+
+class TestAnswerCheckPrompt:
+    """回答チェックプロンプトのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    def test_prompt_is_bounded_and_measured(self):
+        """大きな結果でもプロンプトは小さく、全行埋め込み時との比較を記録"""
+        messages = PromptGenerator.create_answer_check_prompt(
+            "SELECT * FROM employees", _rows(500, offset=1), _rows(500), []
+        )
+
+        assert "社員0 | 1000" in messages[1]["content"]
+        observations = metrics.snapshot()["observations"]
+        full = observations["prompt.check_answer.full_result_tokens"]["sum"]
+        diff = observations["prompt.check_answer.diff_tokens"]["sum"]
+        assert diff < full / 10
@@ -0,0 +1,189 @@
+"""
+テーブル構造キャッシュのテスト
+"""
+
+import pytest
+
+from app.core import schema_cache as schema_cache_module
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.schema_cache import SCHEMA_CHANGE_CHANNEL, SchemaCache
+
+SAMPLE_SCHEMAS = [
+    {
+        "table_name": "employees",
+        "columns": [
+            {"name": "id", "type": "INTEGER", "nullable": False, "is_primary_key": True}
+        ],
+    }
+]
+
+
+class FakeListenConnection:
+    """LISTENと切断時のコールバックを記録する接続"""
+
+    def __init__(self) -> None:
+        self.listeners: list[str] = []
+        self.termination_listeners: list = []
+        self.closed = False
+
+    async def add_listener(self, channel: str, _callback) -> None:
+        self.listeners.append(channel)
+
+    def add_termination_listener(self, callback) -> None:
+        self.termination_listeners.append(callback)
+
+    def remove_termination_listener(self, callback) -> None:
+        self.termination_listeners.remove(callback)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class TestSchemaCache:
+    """SchemaCacheのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.cache = SchemaCache(require_listener=False)
+
+    def test_miss_then_hit(self):
+        """格納前はミス、格納後はヒット"""
+        assert self.cache.get("sess_a") is None
+
+        version = self.cache.version("sess_a")
+        self.cache.put("sess_a", version, SAMPLE_SCHEMAS)
+
+        assert self.cache.get("sess_a") == SAMPLE_SCHEMAS
+        assert metrics.counter("schema_cache.misses") == 1
+        assert metrics.counter("schema_cache.hits") == 1
+
+    def test_returned_value_is_a_copy(self):
+        """取得した値を変更してもキャッシュは変わらない"""
+        self.cache.put("sess_a", self.cache.version("sess_a"), SAMPLE_SCHEMAS)
+
+        cached = self.cache.get("sess_a")
+        assert cached is not None
+        cached[0]["table_name"] = "changed"
+
+        assert self.cache.get("sess_a") == SAMPLE_SCHEMAS
+
+    def test_invalidate_schema(self):
+        """スキーマ単位の無効化は他のスキーマに影響しない"""
+        self.cache.put("sess_a", self.cache.version("sess_a"), SAMPLE_SCHEMAS)
+        self.cache.put("sess_b", self.cache.version("sess_b"), SAMPLE_SCHEMAS)
+
+        self.cache.invalidate("sess_a")
+
+        assert self.cache.get("sess_a") is None
+        assert self.cache.get("sess_b") == SAMPLE_SCHEMAS
+
+    def test_invalidate_all(self):
+        """全体の無効化"""
+        self.cache.put("sess_a", self.cache.version("sess_a"), SAMPLE_SCHEMAS)
+        self.cache.invalidate()
+
+        assert self.cache.get("sess_a") is None
+
+    def test_stale_put_is_ignored(self):
+        """取得中にDDLが発生した場合は古い結果を格納しない"""
+        version = self.cache.version("sess_a")
+        self.cache.invalidate("sess_a")
+        self.cache.put("sess_a", version, SAMPLE_SCHEMAS)
+
+        assert self.cache.get("sess_a") is None
+
+    def test_stale_put_after_new_version_is_ignored(self):
+        """無効化後に新しいバージョンを取得しても、古い結果は格納しない"""
+        version = self.cache.version("sess_a")
+        self.cache.invalidate("sess_a")
+        self.cache.version("sess_a")
+        self.cache.put("sess_a", version, SAMPLE_SCHEMAS)
+
+        assert self.cache.get("sess_a") is None
+
+    def test_invalidated_schema_is_evicted(self):
+        """削除されたスキーマの情報は残らない"""
+        self.cache.put("sess_a", self.cache.version("sess_a"), SAMPLE_SCHEMAS)
+        self.cache.put("sess_b", self.cache.version("sess_b"), SAMPLE_SCHEMAS)
+
+        self.cache.invalidate("sess_a")
+        self.cache.get("sess_a")
+
+        assert list(self.cache._versions) == ["sess_b"]
+        assert list(self.cache._entries) == ["sess_b"]
+        assert metrics.snapshot()["gauges"]["schema_cache.entries"] == 1
+
+    def test_notification_invalidates(self):
+        """NOTIFYのペイロードで該当スキーマが無効化される"""
+        self.cache.put("sess_a", self.cache.version("sess_a"), SAMPLE_SCHEMAS)
+
+        self.cache._on_notification(None, 1, "app_schema_changed", "sess_a")
+
+        assert self.cache.get("sess_a") is None
+
+    def test_disabled_without_listener(self):
+        """通知を購読していない場合はキャッシュしない"""
+        cache = SchemaCache(require_listener=True)
+        cache.put("sess_a", cache.version("sess_a"), SAMPLE_SCHEMAS)
+
+        assert cache.enabled is False
+        assert cache.get("sess_a") is None
+
+
+class TestListenerReconnect:
+    """購読用接続の再接続のテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_reconnects_after_termination(self, monkeypatch):
+        """切断後はバックオフしながら再接続し、キャッシュを再開する"""
+        connections = [FakeListenConnection(), FakeListenConnection()]
+        attempts = []
+
+        async def connect(_url):
+            attempts.append(_url)
+            if len(attempts) == 2:
+                raise OSError("connection refused")
+            return connections.pop(0)
+
+        monkeypatch.setattr(schema_cache_module.asyncpg, "connect", connect)
+        monkeypatch.setattr(settings, "SCHEMA_CACHE_RECONNECT_DELAY", 0.0)
+        cache = SchemaCache()
+        await cache._listen()
+        cache.put("sess_a", cache.version("sess_a"), SAMPLE_SCHEMAS)
+
+        cache._on_termination(None)
+
+        assert cache.enabled is False
+        assert cache.get("sess_a") is None
+        assert cache._reconnect_task is not None
+        await cache._reconnect_task
+
+        assert len(attempts) == 3
+        assert cache.enabled is True
+        assert cache._connection.listeners == [SCHEMA_CHANGE_CHANNEL]
+        assert metrics.counter("schema_cache.reconnects") == 1
+
+    @pytest.mark.asyncio
+    async def test_stop_does_not_reconnect(self, monkeypatch):
+        """停止時に閉じた接続では再接続しない"""
+        connection = FakeListenConnection()
+
+        async def connect(_url):
+            return connection
+
+        monkeypatch.setattr(schema_cache_module.asyncpg, "connect", connect)
+        cache = SchemaCache()
+        await cache._listen()
+
+        await cache.stop()
+
+        assert connection.closed is True
+        assert connection.termination_listeners == []
+        assert cache._reconnect_task is None
+        assert cache.enabled is False
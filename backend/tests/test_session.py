@@ -0,0 +1,87 @@
+"""
+セッション管理のテスト
+"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.core.error_codes import VALIDATION_INVALID_SESSION
+from app.core.exceptions import ValidationError
+from app.core.session import (
+    DEFAULT_SESSION_ID,
+    SESSION_SCHEMA_PREFIX,
+    get_session_id,
+    quote_ident,
+    session_schema_name,
+)
+from app.services.db_service import DatabaseService
+
+
+class TestSessionSchemaName:
+    """セッションスキーマ名生成のテスト"""
+
+    def test_schema_name_is_stable(self):
+        """同じセッションIDからは同じスキーマ名が生成される"""
+        assert session_schema_name("abc") == session_schema_name("abc")
+
+    def test_schema_name_differs_per_session(self):
+        """セッションごとに異なるスキーマ名が生成される"""
+        assert session_schema_name("user-1") != session_schema_name("user-2")
+
+    def test_schema_name_is_safe_identifier(self):
+        """スキーマ名は安全な識別子でPostgreSQLの長さ制限内"""
+        name = session_schema_name("x" * 128)
+
+        assert name.startswith(SESSION_SCHEMA_PREFIX)
+        assert len(name) <= 63
+        assert name.replace("_", "").isalnum()
+        assert name == name.lower()
+
+    def test_quote_ident(self):
+        """識別子のエスケープ"""
+        assert quote_ident("sess_abc") == '"sess_abc"'
+        assert quote_ident('a"b') == '"a""b"'
+
+
+class TestGetSessionId:
+    """セッションID取得のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_missing_header_uses_default(self):
+        """ヘッダー未指定時はデフォルトセッション"""
+        assert await get_session_id(None) == DEFAULT_SESSION_ID
+
+    @pytest.mark.asyncio
+    async def test_valid_session_id(self):
+        """UUID形式のセッションIDは許可される"""
+        session_id = "3f2b6c1e-8a2d-4c1b-9f4e-2a7d5e9c0b11"
+        assert await get_session_id(session_id) == session_id
+
+    @pytest.mark.asyncio
+    async def test_invalid_session_id(self):
+        """不正な文字を含むセッションIDは拒否される"""
+        with pytest.raises(ValidationError) as exc_info:
+            await get_session_id("abc; DROP SCHEMA public")
+
+        assert exc_info.value.error_code == VALIDATION_INVALID_SESSION
+        assert exc_info.value.status_code == 400
+
+
+class TestSessionProblems:
+    """セッションごとの問題の取得のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_problem_is_scoped_to_session_or_legacy(self):
+        """自セッションの問題と、セッション導入前(schema_nameがNULL)の問題を取得する"""
+        db = AsyncMock()
+        db.execute_select.return_value = [
+            {"id": 1, "expected_result": "[]", "table_schemas": "[]"}
+        ]
+
+        problem = await DatabaseService(db, "session_abc").get_problem(1)
+
+        assert problem == {"id": 1, "expected_result": [], "table_schemas": []}
+        query, *args = db.execute_select.call_args.args
+        assert args == [1, "session_abc"]
+        assert "schema_name = $2 OR schema_name IS NULL" in query
@@ -0,0 +1,112 @@
+"""
+同一リクエスト合流のテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.metrics import metrics
+from app.core.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """SingleFlightのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+        self.flight = SingleFlight("test")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """同じキーの同時呼び出しは1回だけ実行し結果を共有"""
+        calls = 0
+        release = asyncio.Event()
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"rows": [1, 2]}
+
+        waiters = [asyncio.create_task(self.flight.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert calls == 1
+        assert all(result == {"rows": [1, 2]} for result in results)
+        # 呼び出し元ごとに別のオブジェクト
+        assert results[0] is not results[1]
+        assert metrics.counter("test.singleflight.leaders") == 1
+        assert metrics.counter("test.singleflight.shared") == 4
+        assert self.flight.in_flight() == 0
+
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        """異なるキーはそれぞれ実行"""
+        calls = []
+
+        async def work(key):
+            calls.append(key)
+            return key
+
+        results = await asyncio.gather(
+            self.flight.do("a", lambda: work("a")),
+            self.flight.do("b", lambda: work("b")),
+        )
+
+        assert results == ["a", "b"]
+        assert sorted(calls) == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_error_is_shared(self):
+        """処理の例外は全呼び出し元に伝わる"""
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("failed")
+
+        results = await asyncio.gather(
+            self.flight.do("key", work),
+            self.flight.do("key", work),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelling_one_waiter_keeps_others(self):
+        """1人がキャンセルしても処理は続き、全員がキャンセルすると中断する"""
+        release = asyncio.Event()
+        cancelled = False
+
+        async def work():
+            nonlocal cancelled
+            try:
+                await release.wait()
+                return "done"
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        first = asyncio.create_task(self.flight.do("key", work))
+        second = asyncio.create_task(self.flight.do("key", work))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled
+
+        release.set()
+        assert await second == "done"
+
+        release.clear()
+        third = asyncio.create_task(self.flight.do("key", work))
+        await asyncio.sleep(0)
+        third.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert cancelled
@@ -0,0 +1,123 @@
+"""
+構造化出力(応答のJSONスキーマ)と生成し直しのテスト
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.core.exceptions import LLMError
+from app.core.llm_client import LLMClient
+from app.core.metrics import metrics
+from app.services.llm_service import LLMService
+from app.services.response_schemas import get_response_schema
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class ScriptedClient:
+    """呼び出しごとに用意した応答を順に返すテスト用LLMクライアント"""
+
+    model_name = "test-model"
+    temperature = 0.7
+    max_tokens = 100
+
+    def __init__(self, responses: list[str]) -> None:
+        self.responses = responses
+        self.schemas: list[dict | None] = []
+
+    async def chat_completion_stream(self, _messages, response_schema=None):
+        self.schemas.append(response_schema)
+        yield self.responses[len(self.schemas) - 1]
+
+
+class TestCompleteJson:
+    """LLMService._complete_jsonのテスト"""
+
+    def setup_method(self):
+        """テストメソッドごとの初期化"""
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_sends_task_schema(self):
+        """タスクの応答スキーマを構造化出力として要求する"""
+        client = ScriptedClient(['{"theme": "図書館", "sql_statements": []}'])
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        await service.generate_tables()
+
+        assert client.schemas == [get_response_schema("generate_tables")]
+        assert metrics.counter("llm.json.generate_tables.responses") == 1
+        assert metrics.counter("llm.json.generate_tables.regenerations") == 0
+
+    @pytest.mark.asyncio
+    async def test_regenerates_invalid_response(self):
+        """解析できない応答は生成し直し、失敗件数を記録する"""
+        client = ScriptedClient(
+            ['{"theme": ', '{"theme": "図書館", "sql_statements": ["CREATE"]}']
+        )
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        result = await service.generate_tables()
+
+        assert result["sql_statements"] == ["CREATE"]
+        assert metrics.counter("llm.json.generate_tables.parse_failures") == 1
+        assert metrics.counter("llm.json.generate_tables.regenerations") == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_regenerations(self, monkeypatch):
+        """上限まで生成し直しても不正なら最後のエラーを返す"""
+        monkeypatch.setattr(
+            "app.services.llm_service.settings.LLM_JSON_MAX_REGENERATIONS", 1
+        )
+        client = ScriptedClient(['{"theme": "a"}', '{"theme": "b"}', "unused"])
+        service = LLMService(client)  # type: ignore[arg-type]
+
+        with pytest.raises(LLMError) as exc_info:
+            await service.generate_tables()
+
+        assert "sql_statements" in exc_info.value.detail
+        assert len(client.schemas) == 2
+        assert metrics.counter("llm.json.generate_tables.validation_failures") == 2
+
+
+class TestStructuredOutputPayload:
+    """構造化出力のリクエストボディのテスト"""
+
+    @staticmethod
+    async def sent_payload(ollama_native: bool) -> dict:
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [{"message": {"content": "{}"}}],
+                    "message": {"content": "{}"},
+                },
+            )
+
+        client = LLMClient()
+        client.ollama_native = ollama_native
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await client.chat_completion(MESSAGES, response_schema={"type": "object"})
+        await client.close()
+        return json.loads(requests[0].content)
+
+    @pytest.mark.asyncio
+    async def test_openai_compatible_uses_response_format(self):
+        """OpenAI互換APIではresponse_formatのjson_schemaで指定する"""
+        payload = await self.sent_payload(ollama_native=False)
+
+        assert payload["response_format"]["type"] == "json_schema"
+        assert payload["response_format"]["json_schema"]["schema"] == {"type": "object"}
+
+    @pytest.mark.asyncio
+    async def test_ollama_uses_format(self):
+        """OllamaのネイティブAPIではformatにJSONスキーマを指定する"""
+        payload = await self.sent_payload(ollama_native=True)
+
+        assert payload["format"] == {"type": "object"}
+        assert "response_format" not in payload
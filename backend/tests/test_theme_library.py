@@ -0,0 +1,105 @@
+"""
+テーマライブラリの選択方針のテスト
+"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.api.create_tables import _restore_theme, _theme_key
+from app.core.config import settings
+from app.core.exceptions import DatabaseError
+from app.services.db_service import DatabaseService
+
+STORED_THEME = {
+    "id": 1,
+    "theme": "社員管理",
+    "description": "社員管理システム",
+    "sql_statements": ["CREATE TABLE employees (id SERIAL PRIMARY KEY)"],
+    "data_spec": None,
+}
+
+
+def make_db_service(variants: int, theme: dict | None = STORED_THEME) -> AsyncMock:
+    db_service = AsyncMock()
+    db_service.count_themes.return_value = variants
+    db_service.pick_theme.return_value = dict(theme) if theme else None
+    return db_service
+
+
+class TestThemeKey:
+    """プロンプト正規化のテスト"""
+
+    def test_normalizes_width_case_and_spaces(self):
+        """全角・大文字・空白の違いは同じキーになる"""
+        assert _theme_key("  ＥＣサイト　の\n注文 ") == _theme_key("ecサイト の 注文")
+
+    def test_empty_prompt(self):
+        """プロンプトなしは空文字"""
+        assert _theme_key(None) == ""
+        assert _theme_key("") == ""
+
+
+class TestRestoreTheme:
+    """_restore_themeのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_fresh_never_restores(self):
+        """freshでは常にLLMで生成する"""
+        db_service = make_db_service(variants=10)
+
+        assert await _restore_theme(db_service, "", "sample", "fresh") is None
+        db_service.pick_theme.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_auto_requires_enough_variants(self):
+        """autoではテーマ数が足りない間はLLMで生成する"""
+        db_service = make_db_service(variants=settings.THEME_LIBRARY_MIN_VARIANTS - 1)
+
+        assert await _restore_theme(db_service, "", "sample", "auto") is None
+        db_service.pick_theme.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reuse_restores_stored_statements(self):
+        """reuseでは保存済みのSQLをそのまま実行する"""
+        db_service = make_db_service(variants=1)
+
+        restored = await _restore_theme(db_service, "社員管理", "sample", "reuse")
+
+        assert restored is not None
+        assert restored["theme"] == "社員管理"
+        db_service.execute_sql_statements.assert_awaited_once_with(
+            STORED_THEME["sql_statements"]
+        )
+
+    @pytest.mark.asyncio
+    async def test_restore_failure_falls_back(self):
+        """復元に失敗した場合はスキーマを戻してLLMでの生成に切り替える"""
+        db_service = make_db_service(variants=1)
+        db_service.execute_sql_statements.side_effect = DatabaseError(
+            message="error", error_code="DB_EXECUTION_ERROR"
+        )
+
+        assert await _restore_theme(db_service, "", "sample", "reuse") is None
+        db_service.reset_session_schema.assert_awaited_once()
+
+
+class TestCountThemes:
+    """テーマ数の取得のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_empty_key_counts_nothing(self):
+        """プロンプトなしの場合は全テーマを数えず0を返す"""
+        db = AsyncMock()
+
+        assert await DatabaseService(db).count_themes("", "sample") == 0
+        db.execute_select.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_counts_matching_key(self):
+        """該当するテーマ数を返す"""
+        db = AsyncMock()
+        db.execute_select.return_value = [{"count": 3}]
+
+        assert await DatabaseService(db).count_themes("社員管理", "sample") == 3
+        assert db.execute_select.call_args.args[1:] == ("sample", "社員管理")
@@ -10,7 +10,7 @@ import {
   ErrorMessage,
 } from '../components';
 import { api, ApiError } from '../utils/api';
-import { type AppState } from '../types/api';
+import { type AppState, type CheckAnswerResponse } from '../types/api';
 
 export default function Home() {
   const [state, setState] = useState<AppState>({
@@ -104,16 +104,51 @@ export default function Home() {
     setError(null);
 
     try {
-      const response = await api.checkAnswer({
-        sql: sqlInput,
-        problem_id: state.currentProblem.problem_id,
-      });
-
-      setState((prev) => ({
-        ...prev,
-        lastCheckResult: response,
-        isLoading: false,
-      }));
+      // 判定結果が届いた時点で表示し、フィードバックは生成された順に追記する
+      await api.checkAnswerStream(
+        {
+          sql: sqlInput,
+          problem_id: state.currentProblem.problem_id,
+        },
+        {
+          onResult: (result) => {
+            const data = (result.data ?? {}) as Partial<CheckAnswerResponse>;
+            setState((prev) => ({
+              ...prev,
+              lastCheckResult: {
+                ...data,
+                is_correct: data.is_correct ?? false,
+                message: result.success ? '' : result.message,
+                execution_time: data.execution_time ?? 0,
+              },
+              isLoading: false,
+            }));
+          },
+          onToken: (text) => {
+            setState((prev) =>
+              prev.lastCheckResult
+                ? {
+                    ...prev,
+                    lastCheckResult: {
+                      ...prev.lastCheckResult,
+                      message: prev.lastCheckResult.message + text,
+                    },
+                  }
+                : prev,
+            );
+          },
+          onFeedback: (feedback) => {
+            setState((prev) =>
+              prev.lastCheckResult
+                ? {
+                    ...prev,
+                    lastCheckResult: { ...prev.lastCheckResult, ...feedback },
+                  }
+                : prev,
+            );
+          },
+        },
+      );
     } catch (error) {
       console.error('回答チェックエラー:', error);
       setError(
@@ -56,9 +56,21 @@ export interface CheckAnswerResponse {
   error_type?: 'syntax' | 'logic' | 'none';
   error_message?: string;
   hint?: string;
+  score?: number;
+  improvement_suggestions?: string[];
   execution_time: number;
 }
 
+// /api/check-answer/stream のイベント
+export interface CheckAnswerStreamHandlers {
+  // LLMを待たずに届く判定結果
+  onResult: (result: UniversalResponse) => void;
+  // フィードバック文の断片
+  onToken: (text: string) => void;
+  // フィードバック文の後に届く採点情報(score, 不正解の場合はhintなど)
+  onFeedback: (feedback: Partial<CheckAnswerResponse>) => void;
+}
+
 export interface TableSchemasResponse {
   tables: TableSchema[];
   total_count: number;
@@ -5,14 +5,37 @@ import {
   type GenerateProblemResponse,
   type CheckAnswerRequest,
   type CheckAnswerResponse,
+  type CheckAnswerStreamHandlers,
   type TableSchemasResponse,
   type HealthResponse,
   type ErrorResponse,
+  type UniversalResponse,
 } from '../types/api';
 
 const API_BASE_URL =
   process.env.NODE_ENV === 'production' ? '/api' : 'http://localhost:8001/api';
 
+const SESSION_STORAGE_KEY = 'sql-study-session-id';
+
+// ブラウザごとのセッションID（バックエンドでは専用スキーマに対応する）
+function getSessionId(): string | undefined {
+  if (typeof window === 'undefined') {
+    return undefined;
+  }
+
+  let sessionId = window.localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    sessionId = window.crypto.randomUUID();
+    window.localStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+  }
+  return sessionId;
+}
+
+function buildHeaders(headers: Record<string, string> = {}): HeadersInit {
+  const sessionId = getSessionId();
+  return sessionId ? { ...headers, 'X-Session-ID': sessionId } : headers;
+}
+
 class ApiError extends Error {
   constructor(
     message: string,
@@ -57,9 +80,9 @@ export const api = {
   ): Promise<CreateTablesResponse> {
     const response = await fetch(`${API_BASE_URL}/create-tables`, {
       method: 'POST',
-      headers: {
+      headers: buildHeaders({
         'Content-Type': 'application/json',
-      },
+      }),
       body: JSON.stringify(request),
     });
 
@@ -71,9 +94,9 @@ export const api = {
   ): Promise<GenerateProblemResponse> {
     const response = await fetch(`${API_BASE_URL}/generate-problem`, {
       method: 'POST',
-      headers: {
+      headers: buildHeaders({
         'Content-Type': 'application/json',
-      },
+      }),
       body: JSON.stringify(request),
     });
 
@@ -91,20 +114,105 @@ export const api = {
 
     const response = await fetch(`${API_BASE_URL}/check-answer`, {
       method: 'POST',
-      headers: {
+      headers: buildHeaders({
         'Content-Type': 'application/json',
-      },
+      }),
       body: JSON.stringify(universalRequest),
     });
 
     return handleResponse<CheckAnswerResponse>(response);
   },
 
+  // フィードバックをServer-Sent Eventsで受け取り、届いた順にハンドラーへ渡す
+  async checkAnswerStream(
+    request: CheckAnswerRequest,
+    handlers: CheckAnswerStreamHandlers,
+  ): Promise<void> {
+    const universalRequest = {
+      context: {
+        problem_id: request.problem_id,
+        user_sql: request.sql,
+      },
+    };
+
+    const response = await fetch(`${API_BASE_URL}/check-answer/stream`, {
+      method: 'POST',
+      headers: buildHeaders({
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      }),
+      body: JSON.stringify(universalRequest),
+    });
+
+    if (!response.ok || !response.body) {
+      await handleResponse<unknown>(response);
+      throw new ApiError('ストリームを開始できませんでした', response.status);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        for (const line of rawEvent.split('\n')) {
+          if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+          }
+        }
+        if (!data) {
+          continue;
+        }
+
+        const payload = JSON.parse(data) as Record<string, unknown>;
+        if (event === 'result') {
+          handlers.onResult(payload as unknown as UniversalResponse);
+        } else if (event === 'token') {
+          handlers.onToken(String(payload.text ?? ''));
+        } else if (event === 'feedback') {
+          handlers.onFeedback(
+            payload as unknown as Partial<CheckAnswerResponse>,
+          );
+        } else if (event === 'error') {
+          throw new ApiError(
+            String(payload.message ?? 'フィードバックの生成に失敗しました'),
+            500,
+          );
+        }
+      }
+    }
+  },
+
   async getTableSchemas(): Promise<TableSchemasResponse> {
-    const response = await fetch(`${API_BASE_URL}/table-schemas`);
+    const response = await fetch(`${API_BASE_URL}/table-schemas`, {
+      headers: buildHeaders(),
+    });
     return handleResponse<TableSchemasResponse>(response);
   },
 
+  async deleteSession(): Promise<void> {
+    const response = await fetch(`${API_BASE_URL}/session`, {
+      method: 'DELETE',
+      headers: buildHeaders(),
+    });
+    await handleResponse<unknown>(response);
+  },
+
   async getHealth(): Promise<HealthResponse> {
     const response = await fetch(`${API_BASE_URL}/health`);
     return handleResponse<HealthResponse>(response);